@@ -1,15 +1,16 @@
 #!/usr/bin/env python3
 
 import itertools
-from multiprocessing import Pool
 
 from requests.exceptions import HTTPError
 
 from impl.common import (
     DiffDict,
-    distance,
+    GeoIndex,
+    RefIndex,
     fetch_html_data,
     fetch_json_data,
+    fetch_many,
     opening_weekdays,
     overpass_query,
     titleize,
@@ -61,10 +62,11 @@ def fetch_level2_data(data):
 
 if __name__ == "__main__":
     new_data = fetch_level1_data()
-    with Pool(4) as p:
-        new_data = list(p.imap_unordered(fetch_level2_data, new_data))
+    new_data = fetch_many(fetch_level2_data, new_data)
 
     old_data = [DiffDict(e) for e in overpass_query('nwr[shop][~"^(name|brand)$"~"5[ ]?[aàá][ ]?sec",i](area.country);')]
+    old_refs = RefIndex(old_data, REF)
+    old_geo = GeoIndex(old_data)
 
     old_node_ids = {d.data["id"] for d in old_data}
 
@@ -74,10 +76,10 @@ if __name__ == "__main__":
 
         tags_to_reset = set()
 
-        d = next((od for od in old_data if od[REF] == public_id), None)
+        d = old_refs.find(public_id)
         if d is None:
             coord = [float(nd["lat"]), float(nd["lng"])]
-            ds = [x for x in old_data if not x[REF] and distance([x.lat, x.lon], coord) < 250]
+            ds = [x for x, _ in old_geo.within(coord, 250) if not x[REF]]
             if len(ds) == 1:
                 d = ds[0]
         if d is None:
@@ -87,6 +89,8 @@ if __name__ == "__main__":
             d.data["lat"] = round(float(nd["lat"]), 7) or 38.306893
             d.data["lon"] = round(float(nd["lng"]), 7) or -17.050891
             old_data.append(d)
+            old_refs.add(d)
+            old_geo.add(d)
         else:
             old_node_ids.remove(d.data["id"])
 
@@ -3,7 +3,7 @@
 import itertools
 import re
 
-from impl.common import DiffDict, distance, fetch_json_data, format_phonenumber, overpass_query, titleize, write_diff
+from impl.common import DiffDict, GeoIndex, RefIndex, fetch_json_data, format_phonenumber, overpass_query, titleize, write_diff
 
 
 DATA_URL = "https://www.agriloja.pt/pt/as-nossas-lojas_596.html"
@@ -76,15 +76,17 @@ if __name__ == "__main__":
     new_data = fetch_data()
 
     old_data = [DiffDict(e) for e in overpass_query("nwr[shop][name=Agriloja](area.country);")]
+    old_refs = RefIndex(old_data, REF)
+    old_geo = GeoIndex(old_data)
 
     old_node_ids = {d.data["id"] for d in old_data}
 
     for nd in new_data:
         public_id = nd["id"]
-        d = next((od for od in old_data if od[REF] == public_id), None)
+        d = old_refs.find(public_id)
         coord = list(map(float, re.split(r"\s*[,;]\s*", nd["coordinates"].strip())))[:2]
         if d is None:
-            ds = [x for x in old_data if not x[REF] and distance([x.lat, x.lon], coord) < 250]
+            ds = [x for x, _ in old_geo.within(coord, 250) if not x[REF]]
             if len(ds) == 1:
                 d = ds[0]
         if d is None:
@@ -93,6 +95,8 @@ if __name__ == "__main__":
             d.data["id"] = f"-{public_id}"
             d.data["lat"], d.data["lon"] = coord
             old_data.append(d)
+            old_refs.add(d)
+            old_geo.add(d)
         else:
             old_node_ids.remove(d.data["id"])
 
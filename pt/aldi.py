@@ -5,7 +5,18 @@ import re
 
 from unidecode import unidecode
 
-from impl.common import DiffDict, distance, fetch_json_data, opening_weekdays, overpass_query, titleize, write_diff
+from impl.common import (
+    DiffDict,
+    GeoIndex,
+    RefIndex,
+    RegexReplacements,
+    fetch_json_data,
+    normalize_addresses,
+    opening_weekdays,
+    overpass_query,
+    titleize,
+    write_diff,
+)
 
 
 DATA_URL = "https://locator.uberall.com/api/storefinders/ALDINORDPT_YTvsWfhEG5TCPruM6ab6sZIi0Xodyx/locations/all"
@@ -26,14 +37,16 @@ CITIES = {
     "4835-106": "Guimarães",
     "8700-224": "Olhão",
 }
-STREET_ABBREVS = [
-    [r"\bav\.? ", "avenida "],
-    [r"\best\. ", "estrada "],
-    [r"\bestrada nacional ", "EN "],
-    [r"\bdr\. ", "doutor "],
-    [r"\be?n(\d+)\b", r"en \1"],
-    [r"\br\. ", "rua "],
-]
+STREET_ABBREVS = RegexReplacements(
+    [
+        [r"\bav\.? ", "avenida "],
+        [r"\best\. ", "estrada "],
+        [r"\bestrada nacional ", "en "],
+        [r"\bdr\. ", "doutor "],
+        [r"\be?n(\d+)\b", r"en \1"],
+        [r"\br\. ", "rua "],
+    ]
+)
 
 
 def fetch_data():
@@ -51,6 +64,8 @@ if __name__ == "__main__":
     new_data = fetch_data()
 
     old_data = [DiffDict(e) for e in overpass_query('nwr[shop][~"^(name|brand)$"~"(^| )aldi( |$)",i](area.country);')]
+    old_refs = RefIndex(old_data, REF)
+    old_geo = GeoIndex(old_data)
 
     old_node_ids = {d.data["id"] for d in old_data}
 
@@ -58,10 +73,10 @@ if __name__ == "__main__":
         public_id = nd["identifier"]
         tags_to_reset = set()
 
-        d = next((od for od in old_data if od[REF] == public_id), None)
+        d = old_refs.find(public_id)
         if d is None:
             coord = [float(nd["lat"]), float(nd["lng"])]
-            ds = [x for x in old_data if not x[REF] and distance([x.lat, x.lon], coord) < 250]
+            ds = [x for x, _ in old_geo.within(coord, 250) if not x[REF]]
             if len(ds) == 1:
                 d = ds[0]
         if d is None:
@@ -71,6 +86,8 @@ if __name__ == "__main__":
             d.data["lat"] = float(nd["lat"])
             d.data["lon"] = float(nd["lng"])
             old_data.append(d)
+            old_refs.add(d)
+            old_geo.add(d)
         else:
             old_node_ids.remove(d.data["id"])
 
@@ -119,11 +136,10 @@ if __name__ == "__main__":
             d["source:contact"] = "website"
 
         d["addr:postcode"] = nd["zip"].strip()
-        d["addr:city"] = CITIES.get(d["addr:postcode"], nd["city"].strip())
+        d["addr:city"] = nd["city"].strip()
         if not d["addr:street"] and not d["addr:place"] and not d["addr:suburb"] and not d["addr:housename"]:
             street = nd["streetAndNumber"].replace("  ", " ")
-            for r in STREET_ABBREVS:
-                street = re.sub(r[0], r[1], street.lower())
+            street = STREET_ABBREVS.sub(street.lower())
             if m := re.fullmatch(r"^(?!en\s+)(.+?),?\s+(?:n\.º\s*)?(\d+[a-z]?(?:-\d+)?)", street):
                 d["addr:street"] = titleize(m[1])
                 d["addr:housenumber"] = m[2].upper()
@@ -145,6 +161,8 @@ if __name__ == "__main__":
         if d.data["id"] in old_node_ids:
             d.kind = "del"
 
+    normalize_addresses([d for d in old_data if d.kind != "del"], CITIES)
+
     old_data.sort(key=lambda d: d[REF])
 
     write_diff("Aldi", REF, old_data, osm=True)
@@ -7,7 +7,9 @@ from urllib.parse import urljoin
 
 from impl.common import (
     DiffDict,
-    distance,
+    GeoIndex,
+    RefIndex,
+    RegexReplacements,
     fetch_json_data,
     format_phonenumber,
     opening_weekdays,
@@ -22,38 +24,40 @@ DATA_URL = "https://www.amanhecer.pt/lojas"
 REF = "ref"
 
 DAYS = ["segunda-feira", "terça-feira", "quarta-feira", "quinta-feira", "sexta-feira", "sábado", "domingo"]
-BRANCH_FIXES = (
-    (r"\s{2,}", " "),
-    (r"–", "-"),
-    (r"[’´`]", "'"),
-    (r"[“”]", ""),
-    (r"(^| )a ", r"\1A "),
-    (r"(^| )o ", r"\1O "),
-    (r"'S\b", "'s"),
-    (r"\b3m\b", "3M"),
-    (r"\bà do\b", "À do"),
-    (r"\ba-dos-\b", "A-dos-"),
-    (r"\b[Dd]'\s*", "d'"),
-    (r"\bDelimarket\b", "DeliMarket"),
-    (r"\bGi\b", "GI"),
-    (r"\bEpac\b", "EPAC"),
-    (r"\bEsuper\b", "ESuper"),
-    (r"\b(Frescos do) Nh\b", r"\1 NH"),
-    (r"^.*\b(Império das Carnes)\b", r"\1"),
-    (r"\bLidermarche\b", "Lidermarché"),
-    (r"\bLL\b", "II"),
-    (r"\bLLL\b", "III"),
-    (r"\bLILI\b", "Lili"),
-    (r"\bMarketfish\b", "MarketFish"),
-    (r"\bMini[- ]Mercado\b", "Minimercado"),
-    (r"\bNa Mina\b", "na Mina"),
-    (r"\bParaiso\b", "Paraíso"),
-    (r"\bPorto Côvo\b", "Porto Covo"),
-    (r"\bRm Costa\b", "R.M. Costa"),
-    (r"\bS\. Bernardo\b", "São Bernardo"),
-    (r"^Sa ", "SA "),
-    (r"\bSupercastanholas\b", "Super Castanholas"),
-    (r"\b(Minimercado) (Alameda)\b", r"\1 da \2"),
+BRANCH_FIXES = RegexReplacements(
+    (
+        (r"\s{2,}", " "),
+        (r"–", "-"),
+        (r"[’´`]", "'"),
+        (r"[“”]", ""),
+        (r"(^| )a ", r"\1A "),
+        (r"(^| )o ", r"\1O "),
+        (r"'S\b", "'s"),
+        (r"\b3m\b", "3M"),
+        (r"\bà do\b", "À do"),
+        (r"\ba-dos-\b", "A-dos-"),
+        (r"\b[Dd]'\s*", "d'"),
+        (r"\bDelimarket\b", "DeliMarket"),
+        (r"\bGi\b", "GI"),
+        (r"\bEpac\b", "EPAC"),
+        (r"\bEsuper\b", "ESuper"),
+        (r"\b(Frescos do) Nh\b", r"\1 NH"),
+        (r"^.*\b(Império das Carnes)\b", r"\1"),
+        (r"\bLidermarche\b", "Lidermarché"),
+        (r"\bLL\b", "II"),
+        (r"\bLLL\b", "III"),
+        (r"\bLILI\b", "Lili"),
+        (r"\bMarketfish\b", "MarketFish"),
+        (r"\bMini[- ]Mercado\b", "Minimercado"),
+        (r"\bNa Mina\b", "na Mina"),
+        (r"\bParaiso\b", "Paraíso"),
+        (r"\bPorto Côvo\b", "Porto Covo"),
+        (r"\bRm Costa\b", "R.M. Costa"),
+        (r"\bS\. Bernardo\b", "São Bernardo"),
+        (r"^Sa ", "SA "),
+        (r"\bSupercastanholas\b", "Super Castanholas"),
+        (r"\b(Minimercado) (Alameda)\b", r"\1 da \2"),
+    )
 )
 SUBNETS = {
     r"DeliMarket",
@@ -118,6 +122,8 @@ if __name__ == "__main__":
         DiffDict(e)
         for e in overpass_query('nwr[shop][shop!=pastry][~"^(name|brand|operator|website)$"~"amanhecer",i](area.country);')
     ]
+    old_refs = RefIndex(old_data, REF)
+    old_geo = GeoIndex(old_data)
 
     new_node_id = -10000
     old_node_ids = {d.data["id"] for d in old_data}
@@ -126,18 +132,17 @@ if __name__ == "__main__":
         public_id = nd["id"]
 
         branch = titleize(html.unescape(nd["name"]))
-        for a, b in BRANCH_FIXES:
-            branch = re.sub(a, b, branch)
+        branch = BRANCH_FIXES.sub(branch)
         is_warehouse = "Armazém" in branch
         branch = re.sub(r"[- ]*\bArmazém\b[- ]*", " ", branch).strip()
         subname = re.sub(r"^Amanhecer\s+(?![a-z])|\s+(-\s+.+|\(.+\))$|, Unipessoal.*$", "", branch)
         subname = re.sub(r"\b(" + "|".join(SUBNETS) + r")\s.+$", r"\1", subname)
         tags_to_reset = set()
 
-        d = next((od for od in old_data if od[REF] == public_id), None) if public_id else None
+        d = old_refs.find(public_id) if public_id else None
         coord = [nd["latitude"], nd["longitude"]]
         if d is None:
-            ds = [x for x in old_data if not x[REF] and x.data["id"] in old_node_ids and distance([x.lat, x.lon], coord) < 100]
+            ds = [x for x, _ in old_geo.within(coord, 100) if not x[REF] and x.data["id"] in old_node_ids]
             if len(ds) == 1:
                 d = ds[0]
         if d is None:
@@ -146,6 +151,8 @@ if __name__ == "__main__":
             d.data["id"] = str(new_node_id)
             d.data["lat"], d.data["lon"] = coord
             old_data.append(d)
+            old_refs.add(d)
+            old_geo.add(d)
             new_node_id -= 1
         else:
             old_node_ids.remove(d.data["id"])
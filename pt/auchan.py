@@ -3,12 +3,22 @@
 import itertools
 import json
 import re
-from multiprocessing import Pool
 
 from lxml import etree
 from requests import HTTPError
 
-from impl.common import DiffDict, distance, fetch_html_data, fetch_json_data, opening_weekdays, overpass_query, write_diff
+from impl.common import (
+    DiffDict,
+    GeoIndex,
+    RefIndex,
+    RegexMapping,
+    fetch_html_data,
+    fetch_json_data,
+    fetch_many,
+    opening_weekdays,
+    overpass_elements,
+    write_diff,
+)
 
 
 LEVEL1_DATA_URL = "https://www.auchan.pt/pt/lojas"
@@ -165,14 +175,16 @@ CITY_LOC_FIXES = {
     "Vilar Andorinho": "Vilar de Andorinho",
     "Visconde Santarém": "Visconde de Santarém",
 }
-EVENTS_MAPPING = {
-    r"Horário feriados: (\d{2}:\d{2}) - (\d{2}:\d{2})": r"PH \1-\2",
-    r"Horário feriados: (\d{1}:\d{2}) - (\d{2}:\d{2})": r"PH 0\1-\2",
-    r"Horário vésperas de feriado: (\d{2}:\d{2}) - (\d{2}:\d{2})": r"PH -1 days \1-\2",
-    r"Encerramento: domingo de Páscoa, 25 de dezembro e 1 de janeiro": r"easter,Dec 25,Jan 01 off",
-    r"Encerramento véspera de Ano Novo: (\d{2}:\d{2})": r"Dec 31 {opens-}\1",
-    r"Encerramento véspera de Natal: (\d{2}:\d{2})": r"Dec 24 {opens-}\1",
-}
+EVENTS_MAPPING = RegexMapping(
+    {
+        r"Horário feriados: (\d{2}:\d{2}) - (\d{2}:\d{2})": r"PH \1-\2",
+        r"Horário feriados: (\d{1}:\d{2}) - (\d{2}:\d{2})": r"PH 0\1-\2",
+        r"Horário vésperas de feriado: (\d{2}:\d{2}) - (\d{2}:\d{2})": r"PH -1 days \1-\2",
+        r"Encerramento: domingo de Páscoa, 25 de dezembro e 1 de janeiro": r"easter,Dec 25,Jan 01 off",
+        r"Encerramento véspera de Ano Novo: (\d{2}:\d{2})": r"Dec 31 {opens-}\1",
+        r"Encerramento véspera de Natal: (\d{2}:\d{2})": r"Dec 24 {opens-}\1",
+    }
+)
 DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
 
 
@@ -243,12 +255,11 @@ def fix_branch(branch):
 
 if __name__ == "__main__":
     new_data = fetch_level1_data()
-    with Pool(4) as p:
-        new_data = list(p.imap_unordered(fetch_level2_data, new_data))
+    new_data = fetch_many(fetch_level2_data, new_data)
 
     old_data = [
         DiffDict(e)
-        for e in overpass_query(
+        for e in overpass_elements(
             "("
             'nwr[shop][shop!=electronics][shop!=houseware][shop!=pet][~"^(name|brand)$"~"auchan",i](area.country);'
             'nwr[amenity][amenity!=fuel][amenity!=charging_station][amenity!=parking][amenity!=recycling][~"^(name|brand)$"~"auchan",i](area.country);'
@@ -256,16 +267,18 @@ if __name__ == "__main__":
             ");"
         )
     ]
+    old_refs = RefIndex(old_data, REF)
+    old_geo = GeoIndex(old_data)
 
     new_node_id = -10000
     old_node_ids = {d.data["id"] for d in old_data}
 
     for nd in new_data:
         public_id = nd["id"]
-        d = next((od for od in old_data if od[REF] == public_id), None)
+        d = old_refs.find(public_id)
         if d is None:
             coord = [nd["latitude"], nd["longitude"]]
-            ds = [x for x in old_data if not x[REF] and distance([x.lat, x.lon], coord) < 100]
+            ds = [x for x, _ in old_geo.within(coord, 100) if not x[REF]]
             if len(ds) == 1:
                 d = ds[0]
         if d is None:
@@ -275,6 +288,8 @@ if __name__ == "__main__":
             d.data["lat"] = nd["latitude"]
             d.data["lon"] = nd["longitude"]
             old_data.append(d)
+            old_refs.add(d)
+            old_geo.add(d)
             new_node_id -= 1
         else:
             old_node_ids.remove(d.data["id"])
@@ -341,11 +356,7 @@ if __name__ == "__main__":
             for ea in events:
                 if "Auchan Saúde e Bem-Estar:" in ea:
                     continue
-                eb = f"<ERR:{ea}>"
-                for ema, emb in EVENTS_MAPPING.items():
-                    if re.fullmatch(ema, ea) is not None:
-                        eb = re.sub(ema, emb, ea)
-                        break
+                eb = EVENTS_MAPPING.sub(ea, f"<ERR:{ea}>")
                 schedule.append(eb.replace("{opens-}", f"{opens}-"))
             schedule = "; ".join(schedule)
             if d["opening_hours"].replace(" ", "") != schedule.replace(" ", ""):
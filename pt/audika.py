@@ -3,7 +3,7 @@
 import itertools
 import re
 
-from impl.common import DiffDict, distance, fetch_json_data, opening_weekdays, overpass_query, write_diff
+from impl.common import DiffDict, GeoIndex, RefIndex, fetch_json_data, opening_weekdays, overpass_query, write_diff
 
 
 DATA_URL = "https://www.audika.pt/api/clinics/getclinics/{347A23B3-5B62-480A-984B-F51C53E516E8}"
@@ -45,16 +45,18 @@ if __name__ == "__main__":
     new_data = fetch_data()
 
     old_data = [DiffDict(e) for e in overpass_query('nwr[shop][name~"audika|ac[uú]stica m[eé]dica",i](area.country);')]
+    old_refs = RefIndex(old_data, REF)
+    old_geo = GeoIndex(old_data)
 
     new_node_id = -10000
     old_node_ids = {d.data["id"] for d in old_data}
 
     for nd in new_data:
         public_id = nd["ItemId"].lower().strip("}{")
-        d = next((od for od in old_data if od[REF] == public_id), None)
+        d = old_refs.find(public_id)
         if d is None:
             coord = [float(nd["Latitude"]), float(nd["Longitude"])]
-            ds = [x for x in old_data if not x[REF] and distance([x.lat, x.lon], coord) < 250]
+            ds = [x for x, _ in old_geo.within(coord, 250) if not x[REF]]
             if len(ds) == 1:
                 d = ds[0]
         if d is None:
@@ -64,6 +66,8 @@ if __name__ == "__main__":
             d.data["lat"] = float(nd["Latitude"])
             d.data["lon"] = float(nd["Longitude"])
             old_data.append(d)
+            old_refs.add(d)
+            old_geo.add(d)
             new_node_id -= 1
         else:
             old_node_ids.remove(d.data["id"])
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+
+import ast
+import random
+import re
+import time
+import tracemalloc
+from argparse import ArgumentParser
+from math import pi
+from pathlib import Path
+
+import numpy as np
+from shapely import voronoi_polygons
+from shapely.geometry import Point, Polygon
+
+from impl.common import (
+    DiffDict,
+    RegexMapping,
+    RegexReplacements,
+    circles,
+    country_polygon,
+    distance,
+    distance_matrix,
+    label_point,
+    nearest,
+    offset,
+)
+
+
+def timed(func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - started
+
+
+def random_coords(count):
+    # Roughly mainland Portugal
+    return [[random.uniform(36.9, 42.2), random.uniform(-9.5, -6.2)] for _ in range(count)]  # noqa: S311
+
+
+def bench_distance(size):
+    stores = random_coords(size)
+    elements = random_coords(size)
+
+    def scalar_nearest():
+        return [min(range(len(elements)), key=lambda i: distance(s, elements[i])) for s in stores]
+
+    expected, scalar_time = timed(scalar_nearest)
+    (indices, _), vector_time = timed(nearest, stores, elements)
+    mismatches = sum(1 for a, b in zip(indices, expected, strict=True) if a != b)
+    _, matrix_time = timed(distance_matrix, stores, elements)
+
+    print(
+        f"nearest, {size}x{size}: scalar {scalar_time:.2f}s, numpy {vector_time:.2f}s"
+        f" ({scalar_time / vector_time:.0f}x, {mismatches} mismatches)"
+    )
+    print(f"distance_matrix, {size}x{size}: numpy {matrix_time:.2f}s")
+
+
+def bench_circle(size):
+    centers = [[lon, lat] for lat, lon in random_coords(size)]
+    radii = [random.uniform(1000, 100_000) for _ in range(size)]  # noqa: S311
+
+    def scalar_circles():
+        # `circle` before it was vectorized
+        return [
+            Polygon([offset(c, r, (2 * pi * -i) / 32) for i in range(32)] + [offset(c, r, 0)])
+            for c, r in zip(centers, radii, strict=True)
+        ]
+
+    expected, scalar_time = timed(scalar_circles)
+    result, vector_time = timed(circles, centers, radii)
+    error = max(
+        float(np.abs(np.asarray(x.exterior.coords) - np.asarray(y.exterior.coords)).max())
+        for x, y in zip(expected, result, strict=True)
+    )
+
+    print(
+        f"circle, {size}: scalar {scalar_time:.2f}s, numpy {vector_time:.3f}s"
+        f" ({scalar_time / vector_time:.0f}x, max error {error:.1e} degrees)"
+    )
+
+
+def bench_label_point(_size):
+    # Every part of the country polygon (mainland and islands), as `cover_polygon` sees them
+    parts = list(country_polygon().geoms)
+
+    def voronoi_label_point(g):
+        # `label_point` before it used polylabel
+        pts = {Point(p) for e in voronoi_polygons(g, only_edges=True).geoms for p in e.coords if g.contains(Point(p))}
+        pmax = max(pts, default=None, key=lambda p: min(p.distance(g.exterior), min(p.distance(g.interiors), default=360)))
+        if pmax is None:
+            pmax = g.centroid
+        return (pmax.x, pmax.y)
+
+    def depth(points):
+        # Distance to the boundary, larger is better
+        return sum(g.boundary.distance(Point(p)) for g, p in zip(parts, points, strict=True))
+
+    expected, voronoi_time = timed(lambda: [voronoi_label_point(g) for g in parts])
+    result, polylabel_time = timed(lambda: [label_point(g) for g in parts])
+
+    print(
+        f"label_point, {len(parts)} parts: voronoi {voronoi_time:.2f}s, polylabel {polylabel_time:.3f}s"
+        f" ({voronoi_time / polylabel_time:.0f}x, depth {depth(expected):.4f} vs {depth(result):.4f} degrees)"
+    )
+
+
+class DictDiffDict:
+    # `DiffDict` before it had slots, as far as the benchmark uses it
+    def __init__(self, data):
+        self.data = data
+        self.kind = "old"
+        self.old_tags = {}
+        self._watchers = []
+
+    @property
+    def lat(self):
+        return self.data.get("center", {}).get("lat", self.data.get("lat"))
+
+    @property
+    def lon(self):
+        return self.data.get("center", {}).get("lon", self.data.get("lon"))
+
+    def __getitem__(self, key):
+        return self.data["tags"].get(key) or ""
+
+    def __setitem__(self, key, value):
+        old_value = self[key]
+        if old_value == value:
+            return
+        if key not in self.old_tags:
+            self.old_tags[key] = old_value
+        self.data["tags"][key] = value
+        if self.kind == "old":
+            self.kind = "mod"
+        for callback in self._watchers:
+            callback(self, key, old_value)
+
+
+def bench_diffdict(size):
+    keys = ["name", "brand", "branch", "opening_hours", "addr:street", "addr:city", "addr:postcode", "website", "phone"]
+    elements = [
+        {"type": "node", "id": i, "lat": lat, "lon": lon, "tags": {k: f"{k} {i}" for k in keys}}
+        for i, (lat, lon) in enumerate(random_coords(size))
+    ]
+
+    def wrap(cls):
+        tracemalloc.start()
+        result = [cls(e) for e in elements]
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        return result, memory
+
+    def update(ds):
+        # What a script does per element: read most tags, then set some of them, changed or not
+        for d in ds:
+            for k in keys:
+                d[k] = d[k].upper() if k == "branch" else d[k]
+            d.lat, d.lon  # noqa: B018
+
+    (dict_ds, dict_memory), _ = timed(wrap, DictDiffDict)
+    (slot_ds, slot_memory), _ = timed(wrap, DiffDict)
+    _, dict_time = timed(update, dict_ds)
+    _, slot_time = timed(update, slot_ds)
+
+    print(
+        f"DiffDict, {size}: dict {dict_memory / size:.0f} B/element, {dict_time:.3f}s;"
+        f" slots {slot_memory / size:.0f} B/element, {slot_time:.3f}s"
+    )
+
+
+def regex_tables():
+    # Every `RegexMapping` and `RegexReplacements` table of the scripts, read from their source as importing them is not
+    # always possible
+    for path in sorted(Path(__file__).parent.glob("*.py")):
+        for node in ast.parse(path.read_text()).body:
+            if (
+                isinstance(node, ast.Assign)
+                and isinstance(node.value, ast.Call)
+                and getattr(node.value.func, "id", None) in ("RegexMapping", "RegexReplacements")
+            ):
+                yield node.value.func.id, ast.literal_eval(node.value.args[0]), regex_flags(node.value)
+
+
+def regex_flags(call):
+    # Value of the `flags=` argument of a table, a union of `re` flags (e.g. `re.IGNORECASE | re.DOTALL`)
+    flags = 0
+    for keyword in call.keywords:
+        if keyword.arg == "flags":
+            for node in ast.walk(keyword.value):
+                if isinstance(node, ast.Attribute):
+                    flags |= getattr(re, node.attr)
+    return flags
+
+
+def regex_example(pattern):
+    # Rough text a pattern could have been written for, the same kind of values the scripts feed the tables
+    s = re.sub(r"\\d(?:\{(\d+)(?:,\d*)?\}|[+*?])?", lambda m: "1" * int(m[1] or 1), pattern)
+    s = re.sub(r"\\s[+*?]?", " ", s)
+    s = re.sub(r"\[\^?\\?(.)[^]]*\][+*?]?|\.[+*?]", r"\1", s)
+    s = re.sub(r"\(\?:|\(\?i\)|\\b|[()^$?*+]|\{\d+(,\d*)?\}", "", s)
+    return s.replace("|", " ").replace("\\", "")
+
+
+def regex_table_examples(kind, table):
+    return [regex_example(k if kind == "RegexMapping" else k[0]) for k in table]
+
+
+def linear_regex_sub(kind, table, flags, value):
+    # What the scripts did before the tables were compiled
+    if kind == "RegexMapping":
+        return next((re.sub(a, b, value, flags=flags) for a, b in table.items() if re.fullmatch(a, value, flags)), None)
+    for a, b in table:
+        value = re.sub(a, b, value, flags=flags)
+    return value
+
+
+def bench_regex(size):
+    tables = list(regex_tables())
+    examples = [x for kind, table, _ in tables for x in regex_table_examples(kind, table)]
+
+    def table_values(kind, table, flags):
+        # About half of the values a table sees are meant for it, the rest are whatever else stores have in that field;
+        # values also repeat a lot across a script's stores, e.g. the same opening hours
+        own = regex_table_examples(kind, table)
+        own = [v for v in own if linear_regex_sub(kind, table, flags, v) not in (None, v)] or own
+        return [random.choice(own if random.random() < 0.5 else examples) for _ in range(size // 10)] * 10  # noqa: S311
+
+    def linear(kind, table, flags, values):
+        return [linear_regex_sub(kind, table, flags, v) for v in values]
+
+    def compiled(kind, table, flags, values):
+        mapping = RegexMapping(table, flags=flags) if kind == "RegexMapping" else RegexReplacements(table, flags=flags)
+        return [mapping.sub(v) for v in values]
+
+    linear_time = compiled_time = 0
+    hits = mismatches = 0
+    for kind, table, flags in tables:
+        values = table_values(kind, table, flags)
+        expected, elapsed = timed(linear, kind, table, flags, values)
+        linear_time += elapsed
+        result, elapsed = timed(compiled, kind, table, flags, values)
+        compiled_time += elapsed
+        hits += sum(1 for x, v in zip(expected, values, strict=True) if x not in (None, v))
+        mismatches += sum(1 for x, y in zip(expected, result, strict=True) if x != y)
+
+    count = size // 10 * 10
+    print(
+        f"regex tables, {len(tables)}x{count}: linear {linear_time:.2f}s, compiled {compiled_time:.3f}s"
+        f" ({linear_time / compiled_time:.0f}x, {hits / len(tables) / count:.0%} hits, {mismatches} mismatches)"
+    )
+
+
+BENCHMARKS = {
+    "circle": bench_circle,
+    "diffdict": bench_diffdict,
+    "distance": bench_distance,
+    "label_point": bench_label_point,
+    "regex": bench_regex,
+}
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("benchmarks", nargs="*", metavar="benchmark", help=f"one of: {', '.join(BENCHMARKS)} (default: all)")
+    parser.add_argument("-n", "--size", type=int, default=5000, help="number of items to benchmark with")
+    args = parser.parse_args()
+
+    if unknown := set(args.benchmarks) - set(BENCHMARKS):
+        parser.error(f"unknown benchmarks: {', '.join(sorted(unknown))}")
+
+    random.seed(0)
+    for name in args.benchmarks or BENCHMARKS:
+        BENCHMARKS[name](args.size)
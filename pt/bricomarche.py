@@ -3,35 +3,39 @@
 import itertools
 import re
 
-from impl.common import DiffDict, distance, fetch_json_data, overpass_query, titleize, write_diff
+from impl.common import DiffDict, GeoIndex, RefIndex, RegexMapping, fetch_json_data, overpass_query, titleize, write_diff
 
 
 DATA_URL = "https://www.bricomarche.pt/apoio-ao-cliente/horarios-de-loja/"
 
 REF = "ref"
 
-SCHEDULE_DAYS_MAPPING = {
-    r"seg(unda)?( a |-)sex(ta?)?": "Mo-Fr",
-    r"(2ª|seg(unda)?)( [-a] |-)s[aá]b(ado)?": "Mo-Sa",
-    r"(de )?seg(unda)?(-feira)?( [-a] |-)dom(ingo)?|todos os dias": "Mo-Su",
-    r"s[aá]b(ado)?": "Sa",
-    r"sab-dom": "Sa,Su",
-    r"dom(ingos?)?": "Su",
-    r"dom(ingo)? e feriados?": "Su,PH",
-    r"páscoa, natal e ano novo": "easter,Dec 25,Jan 01",
-}
-SCHEDULE_HOURS_MAPPING = {
-    r"(\d{1})h?[:.h](\d{2})[hm]?(?: (?:-|[aà]s) |-)(\d{2})h?[:.h](\d{2})[hm]?": r"0\1:\2-\3:\4",
-    r"(?:das )?(\d{1})h(?:\s*(?:-|às)\s*)(\d{2})h": r"0\1:00-\2:00",
-    r"(\d{1})h(?: - |-)(\d{2})[:.h](\d{2})h?": r"0\1:00-\2:\3",
-    r"(\d{1})h(\d{2})-(\d{1})h": r"0\1:\2-0\3:00",
-    r"(\d{1})[:h](\d{2})h?-(\d{2})h": r"0\1:\2-\3:00",
-    r"(?:das )?(\d{2})[:h](\d{2})[hm]?(?: (?:-|[aà]s) |-)(\d{2})[:h](\d{2})[hm.]?": r"\1:\2-\3:\4",
-    r"(?:das )?(\d{2})[:h](\d{2})h?(?: às |-)(\d{2})h": r"\1:\2-\3:00",
-    r"(\d{2})h(?: (?:-|às) |-)(\d{2})h": r"\1:00-\2:00",
-    r"(?:das )?(\d{2})h-(\d{2})[:h](\d{2})h?": r"\1:00-\2:\3",
-    r".*\bfechados?\b.*": "off",
-}
+SCHEDULE_DAYS_MAPPING = RegexMapping(
+    {
+        r"seg(unda)?( a |-)sex(ta?)?": "Mo-Fr",
+        r"(2ª|seg(unda)?)( [-a] |-)s[aá]b(ado)?": "Mo-Sa",
+        r"(de )?seg(unda)?(-feira)?( [-a] |-)dom(ingo)?|todos os dias": "Mo-Su",
+        r"s[aá]b(ado)?": "Sa",
+        r"sab-dom": "Sa,Su",
+        r"dom(ingos?)?": "Su",
+        r"dom(ingo)? e feriados?": "Su,PH",
+        r"páscoa, natal e ano novo": "easter,Dec 25,Jan 01",
+    }
+)
+SCHEDULE_HOURS_MAPPING = RegexMapping(
+    {
+        r"(\d{1})h?[:.h](\d{2})[hm]?(?: (?:-|[aà]s) |-)(\d{2})h?[:.h](\d{2})[hm]?": r"0\1:\2-\3:\4",
+        r"(?:das )?(\d{1})h(?:\s*(?:-|às)\s*)(\d{2})h": r"0\1:00-\2:00",
+        r"(\d{1})h(?: - |-)(\d{2})[:.h](\d{2})h?": r"0\1:00-\2:\3",
+        r"(\d{1})h(\d{2})-(\d{1})h": r"0\1:\2-0\3:00",
+        r"(\d{1})[:h](\d{2})h?-(\d{2})h": r"0\1:\2-\3:00",
+        r"(?:das )?(\d{2})[:h](\d{2})[hm]?(?: (?:-|[aà]s) |-)(\d{2})[:h](\d{2})[hm.]?": r"\1:\2-\3:\4",
+        r"(?:das )?(\d{2})[:h](\d{2})h?(?: às |-)(\d{2})h": r"\1:\2-\3:00",
+        r"(\d{2})h(?: (?:-|às) |-)(\d{2})h": r"\1:00-\2:00",
+        r"(?:das )?(\d{2})h-(\d{2})[:h](\d{2})h?": r"\1:00-\2:\3",
+        r".*\bfechados?\b.*": "off",
+    }
+)
 BRANCHES = {
     "Charneca da Caparica": "Charneca de Caparica",
 }
@@ -45,13 +49,7 @@ def fetch_data():
 
 
 def schedule_time(v, mapping):
-    sa = v
-    sb = f"<ERR:{v}>"
-    for sma, smb in mapping.items():
-        if re.fullmatch(sma, sa) is not None:
-            sb = re.sub(sma, smb, sa)
-            break
-    return sb
+    return mapping.sub(v, f"<ERR:{v}>")
 
 
 def fixup_schedule_time(v):
@@ -67,6 +65,8 @@ if __name__ == "__main__":
     new_data = fetch_data()
 
     old_data = [DiffDict(e) for e in overpass_query('nwr[shop][name~"bricomarch[eé]",i](area.country);')]
+    old_refs = RefIndex(old_data, REF)
+    old_geo = GeoIndex(old_data)
 
     new_node_id = -10000
     old_node_ids = {d.data["id"] for d in old_data}
@@ -76,10 +76,10 @@ if __name__ == "__main__":
         branch = nd["name"]
         tags_to_reset = set()
 
-        d = next((od for od in old_data if od[REF] == public_id), None)
+        d = old_refs.find(public_id)
         coord = [float(nd["lat"] or 38.306893), float(nd["lng"] or -17.050891)]
         if d is None:
-            ds = [x for x in old_data if not x[REF] and distance([x.lat, x.lon], coord) < 250]
+            ds = [x for x, _ in old_geo.within(coord, 250) if not x[REF]]
             if len(ds) == 1:
                 d = ds[0]
         if d is None:
@@ -88,6 +88,8 @@ if __name__ == "__main__":
             d.data["id"] = str(new_node_id)
             d.data["lat"], d.data["lon"] = coord
             old_data.append(d)
+            old_refs.add(d)
+            old_geo.add(d)
             new_node_id -= 1
         else:
             old_node_ids.remove(d.data["id"])
@@ -3,7 +3,7 @@
 import itertools
 import re
 
-from impl.common import DiffDict, distance, fetch_json_data, opening_weekdays, overpass_query, titleize, write_diff
+from impl.common import DiffDict, GeoIndex, RefIndex, fetch_json_data, opening_weekdays, overpass_query, titleize, write_diff
 
 
 # DATA_URL = "https://www.burgerking.pt/api/whitelabel"  # noqa: ERA001
@@ -276,6 +276,8 @@ if __name__ == "__main__":
             'nwr[amenity][amenity!=charging_station][~"^(name|brand)$"~"burgu?er[ ]?king",i](area.country);'
         )
     ]
+    old_refs = RefIndex(old_data, REF)
+    old_geo = GeoIndex(old_data)
 
     old_node_ids = {d.data["id"] for d in old_data}
 
@@ -285,10 +287,10 @@ if __name__ == "__main__":
         branch = re.sub(r"Burger King ", "", branch).strip()
         tags_to_reset = set()
 
-        d = next((od for od in old_data if od[REF] == public_id), None)
+        d = old_refs.find(public_id)
         if d is None:
             coord = [nd["latitude"], nd["longitude"]]
-            ds = [x for x in old_data if not x[REF] and distance([x.lat, x.lon], coord) < 250]
+            ds = [x for x, _ in old_geo.within(coord, 250) if not x[REF]]
             if len(ds) == 1:
                 d = ds[0]
         if d is None:
@@ -298,6 +300,8 @@ if __name__ == "__main__":
             d.data["lat"] = nd["latitude"] or 38.306893
             d.data["lon"] = nd["longitude"] or -17.050891
             old_data.append(d)
+            old_refs.add(d)
+            old_geo.add(d)
         else:
             old_node_ids.remove(d.data["id"])
 
@@ -2,7 +2,7 @@
 
 import re
 
-from impl.common import DiffDict, distance, fetch_json_data, overpass_query, titleize, write_diff
+from impl.common import DiffDict, GeoIndex, fetch_json_data, overpass_query, titleize, write_diff
 
 
 DATA_URL = "https://www.burgerranch.com/localizacoes/"
@@ -21,6 +21,7 @@ if __name__ == "__main__":
     new_data = fetch_data()
 
     old_data = [DiffDict(e) for e in overpass_query('nwr[amenity][name~"burgu?er ranch|ranch burgu?er",i](area.country);')]
+    old_geo = GeoIndex(old_data)
 
     new_node_id = -10000
     old_node_ids = {d.data["id"] for d in old_data}
@@ -32,7 +33,7 @@ if __name__ == "__main__":
         d = None  # next((od for od in old_data if od[REF] == public_id), None)
         if d is None:
             coord = [float(nd["latitude"]), float(nd["longitude"])]
-            ds = [x for x in old_data if not x[REF] and distance([x.lat, x.lon], coord) < 250]
+            ds = [x for x, _ in old_geo.within(coord, 250) if not x[REF]]
             if len(ds) == 1:
                 d = ds[0]
         if d is None:
@@ -42,6 +43,7 @@ if __name__ == "__main__":
             d.data["lat"] = float(nd["latitude"])
             d.data["lon"] = float(nd["longitude"])
             old_data.append(d)
+            old_geo.add(d)
             new_node_id -= 1
         else:
             old_node_ids.remove(d.data["id"])
@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+
+import datetime
+from argparse import ArgumentParser
+
+from humanize import naturalsize, naturaltime
+
+from impl.common import CACHE_STORE
+
+
+def show_stats():
+    now = datetime.datetime.now(datetime.UTC)
+    stats = CACHE_STORE.stats()
+    for s in stats:
+        oldest = naturaltime(datetime.datetime.fromtimestamp(s["oldest"], datetime.UTC), when=now)
+        print(f"{s['kind']:<20} {s['count']:>8} entries {naturalsize(s['size']):>10}, oldest {oldest}")
+    print(f"{'total':<20} {sum(s['count'] for s in stats):>8} entries {naturalsize(sum(s['size'] for s in stats)):>10}")
+
+
+def prune():
+    print(f"Removed {CACHE_STORE.prune()} expired or evicted entries")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("command", choices=["stats", "prune"])
+    args = parser.parse_args()
+
+    if args.command == "stats":
+        show_stats()
+    else:
+        prune()
@@ -5,7 +5,17 @@ import re
 
 from playwright.sync_api import sync_playwright
 
-from impl.common import DiffDict, cache_name, distance, overpass_query, write_diff
+from impl.common import (
+    DiffDict,
+    GeoIndex,
+    RefIndex,
+    RegexMapping,
+    cache_get,
+    cache_set,
+    normalize_addresses,
+    overpass_query,
+    write_diff,
+)
 from impl.config import ENABLE_CACHE, PLAYWRIGHT_CDP_URL, PLAYWRIGHT_CONTEXT_OPTS
 
 
@@ -18,45 +28,49 @@ BRANCHES = {
     "Av. da República": "Avenida da República",
     "Av. Roma": "Avenida de Roma",
 }
-SCHEDULE_DAYS_MAPPING = {
-    r"24 de dezembro": "Dec 24",
-    r"2ª a 5ª": "Mo-Th",
-    r"2ª a 6ª": "Mo-Fr",
-    r"2ª a dom": "Mo-Su",
-    r"2ª a dom.": "Mo-Su",
-    r"2ª a domingo": "Mo-Su",
-    r"2ª a sábado": "Mo-Sa",
-    r"2ª a sexta": "Mo-Fr",
-    r"31 de dezembro": "Dec 31",
-    r"6ª a sábado": "Fr,Sa",
-    r"6ª e sábado": "Fr,Sa",
-    r"6ª feira, sábado e vésperas de feriado": "Fr,Sa,PH -1 day",
-    r"6ª feira santa": "easter -2 days",
-    r"6ª feira santa e domingo páscoa": "easter -2 days,easter",
-    r"6ª-feira, sábado e vésperas de feriado": "Fr,Sa,PH -1 day",
-    r"domingo": "Su",
-    r"domingo a 5ª": "Su-Th",
-    r"domingo a 5ª feira": "Su-Th",
-    r"domingo a 5ª-feira": "Su-Th",
-    r"domingo e feriado": "Su,PH",
-    r"domingo e feriados": "Su,PH",
-    r"domingo páscoa": "easter",
-    r"feriados": "PH",
-    r"sábado": "Sa",
-    r"segunda-feira a sábado": "Mo-Sa",
-    r"sexta e sábado": "Fr,Sa",
-}
-SCHEDULE_HOURS_MAPPING = {
-    r"(\d{1})h às (\d{2})h": r"0\1:00-\2:00",
-    r"(\d{1})h(\d{2}) às (\d{2})h": r"0\1:\2-\3:00",
-    r"(\d{2}):(\d{2}) – (\d{2}):(\d{2})h": r"\1:\2-\3:\4",
-    r"(\d{2}):(\d{2}) às (\d{2}):(\d{2})h": r"\1:\2-\3:\4",
-    r"(\d{2}):(\d{2})h às (\d{2})h": r"\1:\2-\3:00",
-    r"(\d{2})h às (\d{2}):(\d{2})h": r"\1:00-\2:\3",
-    r"(\d{2})h às (\d{2})h": r"\1:00-\2:00",
-    r"(\d{2})h(\d{2}) às (\d{2})h": r"\1:\2-\3:00",
-    r"encerrado": "off",
-}
+SCHEDULE_DAYS_MAPPING = RegexMapping(
+    {
+        r"24 de dezembro": "Dec 24",
+        r"2ª a 5ª": "Mo-Th",
+        r"2ª a 6ª": "Mo-Fr",
+        r"2ª a dom": "Mo-Su",
+        r"2ª a dom.": "Mo-Su",
+        r"2ª a domingo": "Mo-Su",
+        r"2ª a sábado": "Mo-Sa",
+        r"2ª a sexta": "Mo-Fr",
+        r"31 de dezembro": "Dec 31",
+        r"6ª a sábado": "Fr,Sa",
+        r"6ª e sábado": "Fr,Sa",
+        r"6ª feira, sábado e vésperas de feriado": "Fr,Sa,PH -1 day",
+        r"6ª feira santa": "easter -2 days",
+        r"6ª feira santa e domingo páscoa": "easter -2 days,easter",
+        r"6ª-feira, sábado e vésperas de feriado": "Fr,Sa,PH -1 day",
+        r"domingo": "Su",
+        r"domingo a 5ª": "Su-Th",
+        r"domingo a 5ª feira": "Su-Th",
+        r"domingo a 5ª-feira": "Su-Th",
+        r"domingo e feriado": "Su,PH",
+        r"domingo e feriados": "Su,PH",
+        r"domingo páscoa": "easter",
+        r"feriados": "PH",
+        r"sábado": "Sa",
+        r"segunda-feira a sábado": "Mo-Sa",
+        r"sexta e sábado": "Fr,Sa",
+    }
+)
+SCHEDULE_HOURS_MAPPING = RegexMapping(
+    {
+        r"(\d{1})h às (\d{2})h": r"0\1:00-\2:00",
+        r"(\d{1})h(\d{2}) às (\d{2})h": r"0\1:\2-\3:00",
+        r"(\d{2}):(\d{2}) – (\d{2}):(\d{2})h": r"\1:\2-\3:\4",
+        r"(\d{2}):(\d{2}) às (\d{2}):(\d{2})h": r"\1:\2-\3:\4",
+        r"(\d{2}):(\d{2})h às (\d{2})h": r"\1:\2-\3:00",
+        r"(\d{2})h às (\d{2}):(\d{2})h": r"\1:00-\2:\3",
+        r"(\d{2})h às (\d{2})h": r"\1:00-\2:00",
+        r"(\d{2})h(\d{2}) às (\d{2})h": r"\1:\2-\3:00",
+        r"encerrado": "off",
+    }
+)
 CITIES = {
     "8200-425": "Guia",
 }
@@ -75,8 +89,8 @@ def fetch_data():
         # print(f"Making request: {request.url}")  # noqa: ERA001
         route.continue_()
 
-    cache_file = cache_name(DATA_URL).with_suffix(".cache.json")
-    if not ENABLE_CACHE or not cache_file.exists():
+    result = cache_get("data", DATA_URL) if ENABLE_CACHE else None
+    if result is None:
         # print(f"Querying URL: {DATA_URL}")  # noqa: ERA001
         with sync_playwright() as p:
             browser = p.chromium.connect_over_cdp(PLAYWRIGHT_CDP_URL) if PLAYWRIGHT_CDP_URL else p.firefox.launch()
@@ -87,9 +101,9 @@ def fetch_data():
             result = page.content()
             browser.close()
         if ENABLE_CACHE:
-            cache_file.write_bytes(result.encode("utf-8"))
+            cache_set("data", DATA_URL, result.encode("utf-8"))
     else:
-        result = cache_file.read_bytes().decode("utf-8")
+        result = result.decode("utf-8")
     result = re.sub(r"^.*var\s+stores_obj\s*=\s*JSON.parse\('([^']*)'\);.*$", r"\1", result, flags=re.DOTALL)
     result = [
         {
@@ -105,6 +119,8 @@ if __name__ == "__main__":
     new_data = fetch_data()
 
     old_data = [DiffDict(e) for e in overpass_query('nwr[shop][name="Celeiro"](area.country);')]
+    old_refs = RefIndex(old_data, REF)
+    old_geo = GeoIndex(old_data)
 
     old_node_ids = {d.data["id"] for d in old_data}
 
@@ -113,10 +129,10 @@ if __name__ == "__main__":
         branch = re.sub(r"^Celeiro\s+", "", nd["title"])
         tags_to_reset = set()
 
-        d = next((od for od in old_data if od[REF] == public_id), None)
+        d = old_refs.find(public_id)
         if d is None:
             coord = [float(nd["lat"]), float(nd["lng"])]
-            ds = [x for x in old_data if not x[REF] and distance([x.lat, x.lon], coord) < 250]
+            ds = [x for x, _ in old_geo.within(coord, 250) if not x[REF]]
             if len(ds) == 1:
                 d = ds[0]
         if d is None:
@@ -126,6 +142,8 @@ if __name__ == "__main__":
             d.data["lat"] = float(nd["lat"])
             d.data["lon"] = float(nd["lng"])
             old_data.append(d)
+            old_refs.add(d)
+            old_geo.add(d)
         else:
             old_node_ids.remove(d.data["id"])
 
@@ -152,19 +170,12 @@ if __name__ == "__main__":
                 continue
 
             sa = s[0]
-            sb = f"<ERR:{s}>"
-            for sma, smb in SCHEDULE_DAYS_MAPPING.items():
-                if re.fullmatch(sma, sa) is not None:
-                    sb = re.sub(sma, smb, sa)
-                    break
+            sb = SCHEDULE_DAYS_MAPPING.sub(sa, f"<ERR:{s}>")
             s[0] = sb
 
             sa = s[1]
-            sb = f"<ERR:{s}>"
-            for sma, smb in SCHEDULE_HOURS_MAPPING.items():
-                if re.fullmatch(sma, sa) is not None:
-                    sb = re.sub(sma, smb, sa).replace("23:59", "00:00")
-                    break
+            sb = SCHEDULE_HOURS_MAPPING.sub(sa)
+            sb = sb.replace("23:59", "00:00") if sb is not None else f"<ERR:{s}>"
             s[1] = sb
         for i in range(len(schedule) - 1, 0, -1):
             if len(schedule) >= 2 and schedule[i - 1][1] == schedule[i][1]:
@@ -188,7 +199,7 @@ if __name__ == "__main__":
         address = [x.strip() for x in nd["address"].split("</br>") if x.strip()]
         if m := re.fullmatch(r"(\d{4})\s*[-–]\s*(\d{3})\s+(.+)", address[-1]):
             d["addr:postcode"] = f"{m[1]}-{m[2]}"
-            d["addr:city"] = CITIES.get(d["addr:postcode"], m[3])
+            d["addr:city"] = m[3]
             address.pop()
         if not d["addr:street"] and not d["addr:place"] and not d["addr:suburb"] and not d["addr:housename"]:
             d["x-dld-addr"] = "; ".join(address)
@@ -201,6 +212,8 @@ if __name__ == "__main__":
         if d.data["id"] in old_node_ids:
             d.kind = "del"
 
+    normalize_addresses([d for d in old_data if d.kind != "del"], CITIES)
+
     old_data.sort(key=lambda d: d[REF])
 
     write_diff("Celeiro", REF, old_data, osm=True)
@@ -2,7 +2,16 @@
 
 import re
 
-from impl.common import DiffDict, distance, fetch_json_data, format_phonenumber, overpass_query, write_diff
+from impl.common import (
+    DiffDict,
+    GeoIndex,
+    RefIndex,
+    fetch_json_data,
+    format_phonenumber,
+    normalize_addresses,
+    overpass_query,
+    write_diff,
+)
 
 
 DATA_URL = "https://century21.pt/api/agencies"
@@ -48,6 +57,8 @@ if __name__ == "__main__":
             ");"
         )
     ]
+    old_refs = RefIndex(old_data, REF)
+    old_geo = GeoIndex(old_data)
 
     new_node_id = -10000
     old_node_ids = {d.data["id"] for d in old_data}
@@ -57,10 +68,10 @@ if __name__ == "__main__":
         branch = nd["name"].removeprefix("CENTURY 21 ").replace("´", "'").strip()
         tags_to_reset = set()
 
-        d = next((od for od in old_data if od[REF] == public_id), None)
+        d = old_refs.find(public_id)
         coord = [nd["latitude"], nd["longitude"]]
         if d is None:
-            ds = [x for x in old_data if not x[REF] and distance([x.lat, x.lon], coord) < 250]
+            ds = [x for x, _ in old_geo.within(coord, 250) if not x[REF]]
             if len(ds) == 1:
                 d = ds[0]
         if d is None:
@@ -69,6 +80,8 @@ if __name__ == "__main__":
             d.data["id"] = str(new_node_id)
             d.data["lat"], d.data["lon"] = coord
             old_data.append(d)
+            old_refs.add(d)
+            old_geo.add(d)
             new_node_id -= 1
         else:
             old_node_ids.remove(d.data["id"])
@@ -107,7 +120,7 @@ if __name__ == "__main__":
         if m := re.fullmatch(r"(.+),?\s*(\d{4}\s*[-–]\s*\d{3})(?:,?\s*(.+))?", address):
             address = m[1].strip(", ")
             d["addr:postcode"] = re.sub(r"\s*[-–]\s*", "-", m[2])
-            d["addr:city"] = CITIES.get(d["addr:postcode"], m[3]) or d["addr:city"]
+            d["addr:city"] = m[3] or d["addr:city"]
         if not d["addr:street"] and not d["addr:place"] and not d["addr:suburb"] and not d["addr:housename"]:
             d["x-dld-addr"] = address
 
@@ -119,6 +132,8 @@ if __name__ == "__main__":
         if d.data["id"] in old_node_ids:
             d.kind = "del"
 
+    normalize_addresses([d for d in old_data if d.kind != "del"], CITIES)
+
     old_data.sort(key=lambda d: d[REF])
 
     write_diff("Century 21", REF, old_data, osm=True)
@@ -2,9 +2,19 @@
 
 import json
 import re
-from multiprocessing import Pool
 
-from impl.common import DiffDict, distance, fetch_html_data, overpass_query, titleize, write_diff
+from impl.common import (
+    DiffDict,
+    GeoIndex,
+    RefIndex,
+    RegexMapping,
+    fetch_html_data,
+    fetch_many,
+    match_nearby,
+    overpass_query,
+    titleize,
+    write_diff,
+)
 
 
 AGENCIAS_DATA_URL = "https://www.cgd.pt/Corporativo/Rede-CGD/Pages/Agencias.aspx"
@@ -48,11 +58,13 @@ DAYS_OPEN = {
         f"{DAYS_8_AND_19} Mo,We,Fr",
     ],
 }
-SCHEDULE_HOURS_MAPPING = {
-    r"(\d{2})h(\d{2})": r"\1:\2-",
-    r"(?:De 2ª a 6ª feira, das )?(\d{2})h(\d{2})\s*(?:[-–]|às)\s*(\d{2})h(\d{2})\.?": r"\1:\2-\3:\4",
-    r"(?:Todos os dias úteis: )?(\d{1})h(\d{2})\s*(?:[-–]|às)\s*(\d{2})h(\d{2})": r"0\1:\2-\3:\4",
-}
+SCHEDULE_HOURS_MAPPING = RegexMapping(
+    {
+        r"(\d{2})h(\d{2})": r"\1:\2-",
+        r"(?:De 2ª a 6ª feira, das )?(\d{2})h(\d{2})\s*(?:[-–]|às)\s*(\d{2})h(\d{2})\.?": r"\1:\2-\3:\4",
+        r"(?:Todos os dias úteis: )?(\d{1})h(\d{2})\s*(?:[-–]|às)\s*(\d{2})h(\d{2})": r"0\1:\2-\3:\4",
+    }
+)
 
 
 def fetch_level1_data(url):
@@ -88,44 +100,46 @@ def fetch_level2_data(url):
     return result
 
 
+def get_coord(nd):
+    coord = [nd["lat"], nd["lon"]]
+    if coord[1] > 0:
+        coord[1] = -coord[1]
+    return coord
+
+
 def schedule_time(v):
-    sa = v
-    sb = "<ERR>"
-    for sma, smb in SCHEDULE_HOURS_MAPPING.items():
-        if re.fullmatch(sma, sa) is not None:
-            sb = re.sub(sma, smb, sa)
-            break
-    return sb
+    return SCHEDULE_HOURS_MAPPING.sub(v, "<ERR>")
 
 
 if __name__ == "__main__":
     new_data = fetch_level1_data(AGENCIAS_DATA_URL) + fetch_level1_data(GABINETES_DATA_URL)
-    with Pool(4) as p:
-        new_data = [d for ds in p.imap_unordered(fetch_level1_data, new_data) for d in ds]
-        new_data = [d for ds in p.imap_unordered(fetch_level2_data, new_data) for d in ds]
+    new_data = [d for ds in fetch_many(fetch_level1_data, new_data) for d in ds]
+    new_data = [d for ds in fetch_many(fetch_level2_data, new_data) for d in ds]
 
     old_data = [DiffDict(e) for e in overpass_query('nwr[amenity=bank][name~"caixa geral",i](area.country);')]
+    old_refs = RefIndex(old_data, REF)
+    old_geo = GeoIndex(old_data)
 
     old_node_ids = {d.data["id"] for d in old_data}
 
-    for nd in new_data:
+    nearby = match_nearby(
+        old_geo, [None if old_refs.find(nd["id"]) else get_coord(nd) for nd in new_data], 75, lambda x: not x[REF]
+    )
+
+    for nd, nearby_d in zip(new_data, nearby, strict=True):
         public_id = nd["id"]
         tags_to_reset = set()
 
-        d = next((od for od in old_data if od[REF] == public_id), None)
-        coord = [nd["lat"], nd["lon"]]
-        if coord[1] > 0:
-            coord[1] = -coord[1]
-        if d is None:
-            ds = [x for x in old_data if not x[REF] and distance([x.lat, x.lon], coord) < 75]
-            if len(ds) == 1:
-                d = ds[0]
+        d = old_refs.find(public_id) or nearby_d
+        coord = get_coord(nd)
         if d is None:
             d = DiffDict()
             d.data["type"] = "node"
             d.data["id"] = f"-{public_id}"
             d.data["lat"], d.data["lon"] = coord
             old_data.append(d)
+            old_refs.add(d)
+            old_geo.add(d)
         else:
             old_node_ids.remove(d.data["id"])
 
@@ -7,7 +7,19 @@ import re
 from lxml import etree
 from playwright.sync_api import sync_playwright
 
-from impl.common import DiffDict, cache_name, distance, format_phonenumber, overpass_query, titleize, write_diff
+from impl.common import (
+    DiffDict,
+    GeoIndex,
+    RefIndex,
+    RegexMapping,
+    cache_get,
+    cache_set,
+    format_phonenumber,
+    normalize_addresses,
+    overpass_query,
+    titleize,
+    write_diff,
+)
 from impl.config import ENABLE_CACHE, PLAYWRIGHT_CDP_URL, PLAYWRIGHT_CONTEXT_OPTS
 
 
@@ -15,21 +27,25 @@ DATA_URL = "https://chip7.pt/contact"
 
 REF = "ref"
 
-SCHEDULE_DAYS_MAPPING = {
-    r"segunda\s*,\s*quarta\s*,\s*sexta": "Mo,We,Fr",
-    r"segunda\s+a\s+sexta": "Mo-Fr",
-    r"segunda\s+a\s+domingo": "Mo-Su",
-    r"terça\s+e\s+quinta": "Tu,Fr",
-    r"sexta-feira santa": "easter -2 days",
-    r"sábados?": "Sa",
-    r"sábados?\s*[,;]\s*domingos?\s+e\s+feriados": "Sa,Su,PH",
-    r"domingos?\s+e\s+feriados?": "Su,PH",
-}
-SCHEDULE_HOURS_MAPPING = {
-    r"(?:das )?(\d{1})[h:]+(\d{2})\s*:\s*(\d{2})[h:]+(\d{2})": r"0\1:\2-\3:\4",
-    r"(?:das )?(\d{2})[h:]+(\d{2})\s*:\s*(\d{2})[h:]+(\d{2})": r"\1:\2-\3:\4",
-    r"encerrad[ao]s?": r"off",
-}
+SCHEDULE_DAYS_MAPPING = RegexMapping(
+    {
+        r"segunda\s*,\s*quarta\s*,\s*sexta": "Mo,We,Fr",
+        r"segunda\s+a\s+sexta": "Mo-Fr",
+        r"segunda\s+a\s+domingo": "Mo-Su",
+        r"terça\s+e\s+quinta": "Tu,Fr",
+        r"sexta-feira santa": "easter -2 days",
+        r"sábados?": "Sa",
+        r"sábados?\s*[,;]\s*domingos?\s+e\s+feriados": "Sa,Su,PH",
+        r"domingos?\s+e\s+feriados?": "Su,PH",
+    }
+)
+SCHEDULE_HOURS_MAPPING = RegexMapping(
+    {
+        r"(?:das )?(\d{1})[h:]+(\d{2})\s*:\s*(\d{2})[h:]+(\d{2})": r"0\1:\2-\3:\4",
+        r"(?:das )?(\d{2})[h:]+(\d{2})\s*:\s*(\d{2})[h:]+(\d{2})": r"\1:\2-\3:\4",
+        r"encerrad[ao]s?": r"off",
+    }
+)
 BRANCHES = {
     "Alges": "Algés",
     "Montemor o Novo": "Montemor-o-Novo",
@@ -62,8 +78,8 @@ def fetch_data():
         # print(f"Making request: {request.url}")  # noqa: ERA001
         route.continue_()
 
-    cache_file = cache_name(DATA_URL).with_suffix(".cache.html")
-    if not ENABLE_CACHE or not cache_file.exists():
+    result = cache_get("data", DATA_URL) if ENABLE_CACHE else None
+    if result is None:
         # print(f"Querying URL: {DATA_URL}")  # noqa: ERA001
         with sync_playwright() as p:
             browser = p.chromium.connect_over_cdp(PLAYWRIGHT_CDP_URL) if PLAYWRIGHT_CDP_URL else p.firefox.launch()
@@ -74,9 +90,9 @@ def fetch_data():
             result = page.content()
             browser.close()
         if ENABLE_CACHE:
-            cache_file.write_bytes(result.encode("utf-8"))
+            cache_set("data", DATA_URL, result.encode("utf-8"))
     else:
-        result = cache_file.read_bytes().decode("utf-8")
+        result = result.decode("utf-8")
     result = etree.fromstring(result.replace(" wire:", " wire-"), etree.HTMLParser()).xpath(
         "//div[@id='content']/div[@wire-initial-data]/@wire-initial-data"
     )[0]
@@ -87,19 +103,15 @@ def fetch_data():
 def schedule_time(v, mapping):
     if not isinstance(v, str):
         return ",".join(schedule_time(x, mapping) for x in v)
-    sa = v
-    sb = f"<ERR:{v}>"
-    for sma, smb in mapping.items():
-        if re.fullmatch(sma, sa) is not None:
-            sb = re.sub(sma, smb, sa)
-            break
-    return sb
+    return mapping.sub(v, f"<ERR:{v}>")
 
 
 if __name__ == "__main__":
     new_data = fetch_data()
 
     old_data = [DiffDict(e) for e in overpass_query('nwr[shop][name~"chip ?7",i](area.country);')]
+    old_refs = RefIndex(old_data, REF)
+    old_geo = GeoIndex(old_data)
 
     old_node_ids = {d.data["id"] for d in old_data}
 
@@ -108,10 +120,10 @@ if __name__ == "__main__":
         branch = titleize(re.sub(r"^CHIP7\s+", "", nd["name"]))
         tags_to_reset = set()
 
-        d = next((od for od in old_data if od[REF] == public_id), None)
+        d = old_refs.find(public_id)
         coord = [nd["lat"], nd["lng"]]
         if d is None:
-            ds = [x for x in old_data if not x[REF] and distance([x.lat, x.lon], coord) < 250]
+            ds = [x for x, _ in old_geo.within(coord, 250) if not x[REF]]
             if len(ds) == 1:
                 d = ds[0]
         if d is None:
@@ -120,6 +132,8 @@ if __name__ == "__main__":
             d.data["id"] = f"-{public_id}"
             d.data["lat"], d.data["lon"] = coord
             old_data.append(d)
+            old_refs.add(d)
+            old_geo.add(d)
         else:
             old_node_ids.remove(d.data["id"])
 
@@ -183,7 +197,7 @@ if __name__ == "__main__":
 
         if m := re.match(r"(\d{4}\s*-\s*\d{3})\b", nd["zip"]):
             d["addr:postcode"] = m[1].replace(" ", "")
-        d["addr:city"] = CITIES.get(d["addr:postcode"]) or titleize(nd["city"])
+        d["addr:city"] = titleize(nd["city"])
         if not d["addr:street"] and not d["addr:place"] and not d["addr:suburb"] and not d["addr:housename"]:
             d["x-dld-addr"] = nd["address"]
 
@@ -195,6 +209,8 @@ if __name__ == "__main__":
         if d.data["id"] in old_node_ids:
             d.kind = "del"
 
+    normalize_addresses([d for d in old_data if d.kind != "del"], CITIES)
+
     old_data.sort(key=lambda d: d[REF])
 
     write_diff("Chip7", REF, old_data, osm=True)
@@ -3,7 +3,6 @@
 import itertools
 import re
 import uuid
-from multiprocessing import Pool
 from urllib.parse import urljoin, urlsplit
 
 from lxml import etree
@@ -11,12 +10,15 @@ from playwright.sync_api import sync_playwright
 
 from impl.common import (
     DiffDict,
-    cache_name,
+    GeoIndex,
+    RefIndex,
+    cache_get,
+    cache_set,
     cookie_jar_name,
-    distance,
     fetch_html_data,
+    fetch_many,
     opening_weekdays,
-    overpass_query,
+    overpass_elements,
     save_cookies,
     write_diff,
 )
@@ -93,8 +95,8 @@ def fetch_level1_data():
         # print(f"Making request: {request.url}")  # noqa: ERA001
         route.continue_()
 
-    cache_file = cache_name(DATA_URL).with_suffix(".cache.html")
-    if not ENABLE_CACHE or not (cache_file.exists() and cookie_jar_name().exists()):
+    result = cache_get("data", DATA_URL) if ENABLE_CACHE and cookie_jar_name().exists() else None
+    if result is None:
         # print(f"Querying URL: {DATA_URL}")  # noqa: ERA001
         with sync_playwright() as p:
             browser = p.chromium.connect_over_cdp(PLAYWRIGHT_CDP_URL) if PLAYWRIGHT_CDP_URL else p.firefox.launch()
@@ -108,9 +110,9 @@ def fetch_level1_data():
             save_cookies({x["name"]: x["value"] for x in context.cookies()})
             browser.close()
         if ENABLE_CACHE:
-            cache_file.write_bytes(result.encode("utf-8"))
+            cache_set("data", DATA_URL, result.encode("utf-8"))
     else:
-        result = cache_file.read_bytes().decode("utf-8")
+        result = result.decode("utf-8")
     result_tree = etree.fromstring(result, etree.HTMLParser())
     result = [
         {
@@ -159,13 +161,16 @@ def fetch_level2_data(data):
 
 if __name__ == "__main__":
     new_data = fetch_level1_data()
-    with Pool(4) as p:
-        new_data = list(p.imap_unordered(fetch_level2_data, new_data))
+    new_data = fetch_many(fetch_level2_data, new_data)
 
     old_data = [
         DiffDict(e)
-        for e in overpass_query('nwr[shop][shop!=newsagent][shop!=florist][shop!=tobacco][name~"continente",i](area.country);')
+        for e in overpass_elements(
+            'nwr[shop][shop!=newsagent][shop!=florist][shop!=tobacco][name~"continente",i](area.country);'
+        )
     ]
+    old_refs = RefIndex(old_data, REF)
+    old_geo = GeoIndex(old_data)
 
     new_node_id = -10000
     old_node_ids = {d.data["id"] for d in old_data}
@@ -178,10 +183,10 @@ if __name__ == "__main__":
         is_mod = name == "Continente Modelo"
         tags_to_reset = set()
 
-        d = next((od for od in old_data if od[REF] == public_id), None)
+        d = old_refs.find(public_id)
         if d is None:
             coord = [nd["lat"], nd["lon"]]
-            ds = [x for x in old_data if not x[REF] and distance([x.lat, x.lon], coord) < 250]
+            ds = [x for x, _ in old_geo.within(coord, 250) if not x[REF]]
             if len(ds) == 1:
                 d = ds[0]
             elif is_mod and len(ds) == 2:
@@ -196,6 +201,8 @@ if __name__ == "__main__":
             d.data["lat"] = nd["lat"]
             d.data["lon"] = nd["lon"]
             old_data.append(d)
+            old_refs.add(d)
+            old_geo.add(d)
             new_node_id -= 1
         else:
             old_node_ids.remove(d.data["id"])
@@ -8,7 +8,8 @@ from unidecode import unidecode
 from impl.common import (
     BASE_NAME,
     DiffDict,
-    distance,
+    GeoIndex,
+    RefIndex,
     fetch_json_data,
     format_phonenumber,
     opening_weekdays,
@@ -64,6 +65,8 @@ if __name__ == "__main__":
     new_data = fetch_data()
 
     old_data = [DiffDict(e) for e in overpass_query('nwr[shop][~"^(name|brand)$"~"Decathlon"](area.country);')]
+    old_refs = RefIndex(old_data, REF)
+    old_geo = GeoIndex(old_data)
 
     old_node_ids = {d.data["id"] for d in old_data}
 
@@ -75,10 +78,10 @@ if __name__ == "__main__":
         branch = re.sub(r"\s+(Express|Connect)$", "", branch)
         tags_to_reset = set()
 
-        d = next((od for od in old_data if od[REF] == public_id), None)
+        d = old_refs.find(public_id)
         if d is None:
             coord = list(reversed(nd["coordinates"]))
-            ds = [x for x in old_data if not x[REF] and distance([x.lat, x.lon], coord) < 250]
+            ds = [x for x, _ in old_geo.within(coord, 250) if not x[REF]]
             if len(ds) == 1:
                 d = ds[0]
         if d is None:
@@ -87,6 +90,8 @@ if __name__ == "__main__":
             d.data["id"] = f"-{int(public_id)}"
             d.data["lat"], d.data["lon"] = reversed(nd["coordinates"])
             old_data.append(d)
+            old_refs.add(d)
+            old_geo.add(d)
         else:
             old_node_ids.remove(d.data["id"])
 
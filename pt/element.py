@@ -3,9 +3,18 @@
 import json
 import re
 from itertools import count
-from multiprocessing import Pool
 
-from impl.common import DiffDict, distance, fetch_html_data, overpass_query, titleize, write_diff
+from impl.common import (
+    DiffDict,
+    GeoIndex,
+    RefIndex,
+    RegexMapping,
+    fetch_html_data,
+    fetch_many,
+    overpass_query,
+    titleize,
+    write_diff,
+)
 
 
 DATA_URL = "https://elementgyms.pt/ginasio/"
@@ -16,10 +25,12 @@ SCHEDULE_DAYS = {
     "2ª a 6ª": "Mo-Fr",
     "Sábados, domingos e feriados": "Sa,Su,PH",
 }
-SCHEDULE_HOURS_MAPPING = {
-    r"(\d{1})h(\d{2}) (?:-|às) (\d{2})h(\d{2})": r"0\1:\2-\3:\4",
-    r"(\d{2})h(\d{2}) (?:-|às) (\d{2})h(\d{2})": r"\1:\2-\3:\4",
-}
+SCHEDULE_HOURS_MAPPING = RegexMapping(
+    {
+        r"(\d{1})h(\d{2}) (?:-|às) (\d{2})h(\d{2})": r"0\1:\2-\3:\4",
+        r"(\d{2})h(\d{2}) (?:-|às) (\d{2})h(\d{2})": r"\1:\2-\3:\4",
+    }
+)
 
 
 def fetch_level1_data():
@@ -93,21 +104,16 @@ def fetch_level2_data(data):
 
 
 def schedule_time(v, mapping):
-    sa = v
-    sb = f"<ERR:{v}>"
-    for sma, smb in mapping.items():
-        if re.fullmatch(sma, sa) is not None:
-            sb = re.sub(sma, smb, sa)
-            break
-    return sb
+    return mapping.sub(v, f"<ERR:{v}>")
 
 
 if __name__ == "__main__":
     new_data = fetch_level1_data()
-    with Pool(4) as p:
-        new_data = list(p.imap_unordered(fetch_level2_data, new_data))
+    new_data = fetch_many(fetch_level2_data, new_data)
 
     old_data = [DiffDict(e) for e in overpass_query('nwr[leisure][name~"element( |$)",i](area.country);')]
+    old_refs = RefIndex(old_data, REF)
+    old_geo = GeoIndex(old_data)
 
     new_node_id = -10000
     old_node_ids = {d.data["id"] for d in old_data}
@@ -118,12 +124,12 @@ if __name__ == "__main__":
             continue
         tags_to_reset = set()
 
-        d = next((od for od in old_data if od[REF] == public_id), None)
+        d = old_refs.find(public_id)
         coord = [float(nd["extra"]["latitude"]), float(nd["extra"]["longitude"])]
         if coord[1] > 0:
             coord[1] = -coord[1]
         if d is None:
-            ds = [x for x in old_data if not x[REF] and distance([x.lat, x.lon], coord) < 250]
+            ds = [x for x, _ in old_geo.within(coord, 250) if not x[REF]]
             if len(ds) == 1:
                 d = ds[0]
         if d is None:
@@ -132,6 +138,8 @@ if __name__ == "__main__":
             d.data["id"] = str(new_node_id)
             d.data["lat"], d.data["lon"] = coord
             old_data.append(d)
+            old_refs.add(d)
+            old_geo.add(d)
             new_node_id -= 1
         else:
             old_node_ids.remove(d.data["id"])
@@ -3,10 +3,9 @@
 import itertools
 import json
 import re
-from multiprocessing import Pool
 from urllib.parse import urljoin
 
-from impl.common import DiffDict, RedoIter, distance, fetch_html_data, overpass_query, write_diff
+from impl.common import DiffDict, GeoIndex, RedoIter, RefIndex, fetch_html_data, fetch_many, overpass_query, write_diff
 
 
 DATA_URL = "https://www.emel.pt/pt/parques/ajax/parques.ajax.php"
@@ -134,8 +133,7 @@ def fixup_stay_duration(v):
 
 if __name__ == "__main__":
     new_data = fetch_level1_data()
-    with Pool(4) as p:
-        new_data = list(p.imap_unordered(fetch_level2_data, new_data))
+    new_data = fetch_many(fetch_level2_data, new_data)
 
     old_data = [
         DiffDict(e)
@@ -156,6 +154,8 @@ if __name__ == "__main__":
             ");"
         )
     ]
+    old_refs = RefIndex(old_data, REF)
+    old_geo = GeoIndex(old_data)
 
     old_node_ids = {d.data["id"] for d in old_data}
 
@@ -167,10 +167,10 @@ if __name__ == "__main__":
         name_parts = re.split(r"\s*(?://|-)\s*(?=Exclusivo\b)", nd["name"].strip())
         tags_to_reset = set()
 
-        d = next((od for od in old_data if od[REF] == public_id and od.data["type"] == old_type), None)
+        d = next((od for od in old_refs.find_all(public_id) if od.data["type"] == old_type), None)
         coord = nd["coords"]
         if d is None:
-            ds = [x for x in old_data if not x[REF] and x.data["type"] == old_type and distance([x.lat, x.lon], coord) < 250]
+            ds = [x for x, _ in old_geo.within(coord, 250) if not x[REF] and x.data["type"] == old_type]
             if len(ds) == 1:
                 d = ds[0]
         if d is None and old_type in ("way", "relation"):
@@ -187,6 +187,8 @@ if __name__ == "__main__":
             d.data["id"] = f"-{public_id}"
             d.data["lat"], d.data["lon"] = coord
             old_data.append(d)
+            old_refs.add(d)
+            old_geo.add(d)
         else:
             old_node_ids.remove(d.data["id"])
 
@@ -1,12 +1,24 @@
 #!/usr/bin/env python3
 
 import re
-from multiprocessing import Pool
+from functools import partial
 
-import requests
 from lxml import etree
 
-from impl.common import DiffDict, distance, fetch_json_data, format_phonenumber, overpass_query, titleize, write_diff
+from impl.common import (
+    DiffDict,
+    GeoIndex,
+    RefIndex,
+    RegexReplacements,
+    fetch_json_data,
+    fetch_many,
+    format_phonenumber,
+    http_request,
+    normalize_addresses,
+    overpass_query,
+    titleize,
+    write_diff,
+)
 
 
 PAGE_URL = "https://www.era.pt/agencias"
@@ -15,70 +27,73 @@ LEVEL2_DATA_URL = "https://www.era.pt/API/ServicesModule/agencies/card"
 
 REF = "ref"
 
-OPERATOR_FIXES = (
-    # proper names
-    (r"\bacontecevalor\b", "AconteceValor"),
-    (r"\baçorbase\b", "AçorBase"),
-    (r"\badvancedpurposes\b", "AdvancedPurposes"),
-    (r"\baim2achieve\b", "Aim2Achieve"),
-    (r"\balbatrossworld\b", "AlbatrossWorld"),
-    (r"\balbuincome\b", "AlbuIncome"),
-    (r"\bamb2f\b", "AMB2F"),
-    (r"\bamcfarinha\b", "AMCFarinha"),
-    (r"\bbesthomes\b", "BestHomes"),
-    (r"\bchasingideas\b", "ChasingIdeas"),
-    (r"\bcmi - gest\b", "CMI-Gest"),
-    (r"\bcr2i\b", "CR2I"),
-    (r"\bdadosuper\b", "DadoSuper"),
-    (r"\bera\b", "ERA"),
-    (r"\beratrofa\b", "ERATrofa"),
-    (r"\bespoinvest\b", "EspoInvest"),
-    (r"\bexplorar100parar\b", "Explorar100Parar"),
-    (r"\bguia&vitorino\b", "Guia & Vitorino"),
-    (r"\bhouseview\b", "HouseView"),
-    (r"\bimpetuosocasião\b", "ImpetuosOcasião"),
-    (r"\binvestpeople\b", "InvestPeople"),
-    (r"\bjnl\b", "JNL"),
-    (r"\blivingmoods\b", "LivingMoods"),
-    (r"\blivremaneira\b", "LivreManeira"),
-    (r"\bm3f\b", "M3F"),
-    (r"\bmediaprimavera\b", "MediaPrimavera"),
-    (r"\bmnz\b", "MNZ"),
-    (r"\bmtf\b", "MTF"),
-    (r"\bnfpt\b", "NFPT"),
-    (r"\bnt sim\b", "NT SIM"),
-    (r"\bo vizinho\b", "O Vizinho"),
-    (r"\bpdreams\b", "PDreams"),
-    (r"\bpensarenvolvente\b", "PensarEnvolvente"),
-    (r"\bpineu\b", "Pinéu"),
-    (r"\bplss\b", "PLSS"),
-    (r"\bprediglobal\b", "PrediGlobal"),
-    (r"\bpropertyland\b", "PropertyLand"),
-    (r"\bprosperfavorite\b", "ProsperFavorite"),
-    (r"\bquimeraudaz\b", "QuimerAudaz"),
-    (r"\brabbit's\b", "Rabbit's"),
-    (r"\brodrigues e ferreira\b", "Rodrigues & Ferreira"),
-    (r"\bsoftevidence\b", "SoftEvidence"),
-    (r"\bsw\b", "SW"),
-    (r"\bvalorbase\b", "ValorBase"),
-    (r"\bvilazigzag\b", "VilaZigzag"),
-    # abbreviations
-    (r"(?<=- )m\. ?i\.", "Mediação Imobiliária"),
-    (r"\bs\. ?m\. ?i\.", "Sociedade de Mediação Imobiliária"),
-    (r"(?<=mediação )\bimob\.", "Imobiliária"),
-    (r"\bmedi?\.? imob\b\.?", "Mediação Imobiliária"),
-    (r"\bmed\.?(?= imob)", "Mediação"),
-    (r"\bmed\. ?(?=imob)", "Mediação "),
-    (r"\bsoc(\.|iedade)( de)?(?= med)", "Sociedade de"),
-    (r"\bsmi\b", "Sociedade de Mediação Imobiliária"),
-    (r"\bunip?\b\.?", "Unipessoal"),
-    # forms of ownership
-    (r"(\s*[-,])?\s*\bunipessoal\b", ", Unipessoal"),
-    (r"(\s*[-,.])?\s*\blda\b\.?", ", Lda."),
-    # dashes
-    (r"\b(?<!de)[\s>,]+\b((sociedade de )?mediação\b|(soluções|serviços) imob)", r" - \1"),
-    # typos and other mistakes
-    (r"\bimobi?liari([ao])", r"Imobiliári\1"),
+OPERATOR_FIXES = RegexReplacements(
+    (
+        # proper names
+        (r"\bacontecevalor\b", "AconteceValor"),
+        (r"\baçorbase\b", "AçorBase"),
+        (r"\badvancedpurposes\b", "AdvancedPurposes"),
+        (r"\baim2achieve\b", "Aim2Achieve"),
+        (r"\balbatrossworld\b", "AlbatrossWorld"),
+        (r"\balbuincome\b", "AlbuIncome"),
+        (r"\bamb2f\b", "AMB2F"),
+        (r"\bamcfarinha\b", "AMCFarinha"),
+        (r"\bbesthomes\b", "BestHomes"),
+        (r"\bchasingideas\b", "ChasingIdeas"),
+        (r"\bcmi - gest\b", "CMI-Gest"),
+        (r"\bcr2i\b", "CR2I"),
+        (r"\bdadosuper\b", "DadoSuper"),
+        (r"\bera\b", "ERA"),
+        (r"\beratrofa\b", "ERATrofa"),
+        (r"\bespoinvest\b", "EspoInvest"),
+        (r"\bexplorar100parar\b", "Explorar100Parar"),
+        (r"\bguia&vitorino\b", "Guia & Vitorino"),
+        (r"\bhouseview\b", "HouseView"),
+        (r"\bimpetuosocasião\b", "ImpetuosOcasião"),
+        (r"\binvestpeople\b", "InvestPeople"),
+        (r"\bjnl\b", "JNL"),
+        (r"\blivingmoods\b", "LivingMoods"),
+        (r"\blivremaneira\b", "LivreManeira"),
+        (r"\bm3f\b", "M3F"),
+        (r"\bmediaprimavera\b", "MediaPrimavera"),
+        (r"\bmnz\b", "MNZ"),
+        (r"\bmtf\b", "MTF"),
+        (r"\bnfpt\b", "NFPT"),
+        (r"\bnt sim\b", "NT SIM"),
+        (r"\bo vizinho\b", "O Vizinho"),
+        (r"\bpdreams\b", "PDreams"),
+        (r"\bpensarenvolvente\b", "PensarEnvolvente"),
+        (r"\bpineu\b", "Pinéu"),
+        (r"\bplss\b", "PLSS"),
+        (r"\bprediglobal\b", "PrediGlobal"),
+        (r"\bpropertyland\b", "PropertyLand"),
+        (r"\bprosperfavorite\b", "ProsperFavorite"),
+        (r"\bquimeraudaz\b", "QuimerAudaz"),
+        (r"\brabbit's\b", "Rabbit's"),
+        (r"\brodrigues e ferreira\b", "Rodrigues & Ferreira"),
+        (r"\bsoftevidence\b", "SoftEvidence"),
+        (r"\bsw\b", "SW"),
+        (r"\bvalorbase\b", "ValorBase"),
+        (r"\bvilazigzag\b", "VilaZigzag"),
+        # abbreviations
+        (r"(?<=- )m\. ?i\.", "Mediação Imobiliária"),
+        (r"\bs\. ?m\. ?i\.", "Sociedade de Mediação Imobiliária"),
+        (r"(?<=mediação )\bimob\.", "Imobiliária"),
+        (r"\bmedi?\.? imob\b\.?", "Mediação Imobiliária"),
+        (r"\bmed\.?(?= imob)", "Mediação"),
+        (r"\bmed\. ?(?=imob)", "Mediação "),
+        (r"\bsoc(\.|iedade)( de)?(?= med)", "Sociedade de"),
+        (r"\bsmi\b", "Sociedade de Mediação Imobiliária"),
+        (r"\bunip?\b\.?", "Unipessoal"),
+        # forms of ownership
+        (r"(\s*[-,])?\s*\bunipessoal\b", ", Unipessoal"),
+        (r"(\s*[-,.])?\s*\blda\b\.?", ", Lda."),
+        # dashes
+        (r"\b(?<!de)[\s>,]+\b((sociedade de )?mediação\b|(soluções|serviços) imob)", r" - \1"),
+        # typos and other mistakes
+        (r"\bimobi?liari([ao])", r"Imobiliári\1"),
+    ),
+    flags=re.IGNORECASE,
 )
 CITIES = {
     "2620-315": "Ramada",
@@ -98,7 +113,7 @@ CITIES = {
 
 
 def get_api_headers():
-    result = requests.get(PAGE_URL, timeout=30)
+    result = http_request("get", PAGE_URL, timeout=30)
     result_etree = etree.fromstring(result.content.decode("utf-8"), etree.HTMLParser())
     return {
         "Cookie": f"__RequestVerificationToken={result.cookies['__RequestVerificationToken']}",
@@ -127,8 +142,7 @@ def get_ref(nd):
 
 def fixup_operator(v):
     v = titleize(re.sub(r"\s*[-–]\s*", " - ", v).replace("´", "'"))
-    for a, b in OPERATOR_FIXES:
-        v = re.sub(a, b, v, flags=re.IGNORECASE)
+    v = OPERATOR_FIXES.sub(v)
     return v
 
 
@@ -136,8 +150,7 @@ if __name__ == "__main__":
     api_headers = get_api_headers()
 
     new_data = fetch_level1_data(api_headers)
-    with Pool(4) as p:
-        new_data = list(p.starmap(fetch_level2_data, ((x, api_headers) for x in new_data)))
+    new_data = fetch_many(partial(fetch_level2_data, api_headers=api_headers), new_data)
 
     old_data = [
         DiffDict(e)
@@ -148,6 +161,8 @@ if __name__ == "__main__":
             ");"
         )
     ]
+    old_refs = RefIndex(old_data, REF)
+    old_geo = GeoIndex(old_data)
 
     new_node_id = -10000
     old_node_ids = {d.data["id"] for d in old_data}
@@ -157,10 +172,10 @@ if __name__ == "__main__":
         branch = nd["Name"].removeprefix("ERA ").strip()
         tags_to_reset = set()
 
-        d = next((od for od in old_data if od[REF] == public_id), None)
+        d = old_refs.find(public_id)
         coord = [nd["Location"]["lat"], nd["Location"]["lng"]]
         if d is None:
-            ds = [x for x in old_data if not x[REF] and distance([x.lat, x.lon], coord) < 100]
+            ds = [x for x, _ in old_geo.within(coord, 100) if not x[REF]]
             if len(ds) == 1:
                 d = ds[0]
         if d is None:
@@ -169,6 +184,8 @@ if __name__ == "__main__":
             d.data["id"] = str(new_node_id)
             d.data["lat"], d.data["lon"] = coord
             old_data.append(d)
+            old_refs.add(d)
+            old_geo.add(d)
             new_node_id -= 1
         else:
             old_node_ids.remove(d.data["id"])
@@ -206,7 +223,7 @@ if __name__ == "__main__":
 
         if m := re.fullmatch(r"(\d{4}-\d{3})\s+(.+)", nd["PostTown"]):
             d["addr:postcode"] = m[1]
-            d["addr:city"] = CITIES.get(d["addr:postcode"], m[2])
+            d["addr:city"] = m[2]
         if not d["addr:street"] and not d["addr:place"] and not d["addr:suburb"] and not d["addr:housename"]:
             d["x-dld-addr"] = nd["Address"].strip()
 
@@ -218,6 +235,8 @@ if __name__ == "__main__":
         if d.data["id"] in old_node_ids:
             d.kind = "del"
 
+    normalize_addresses([d for d in old_data if d.kind != "del"], CITIES)
+
     old_data.sort(key=lambda d: d[REF])
 
     write_diff("ERA", REF, old_data, osm=True)
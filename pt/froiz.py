@@ -1,6 +1,6 @@
 #!/usr/bin/env python3
 
-from impl.common import DiffDict, distance, fetch_html_data, overpass_query, write_diff
+from impl.common import DiffDict, GeoIndex, RefIndex, fetch_html_data, normalize_addresses, overpass_query, write_diff
 
 
 DATA_URL = "https://www.froiz.pt/localizador-de-lojas/"
@@ -34,6 +34,8 @@ if __name__ == "__main__":
     new_data = fetch_data()
 
     old_data = [DiffDict(e) for e in overpass_query('nwr[shop][~"^(name|brand)$"~"froiz",i](area.country);')]
+    old_refs = RefIndex(old_data, REF)
+    old_geo = GeoIndex(old_data)
 
     old_node_ids = {d.data["id"] for d in old_data}
 
@@ -41,10 +43,10 @@ if __name__ == "__main__":
         public_id = nd["id"]
         tags_to_reset = set()
 
-        d = next((od for od in old_data if od[REF] == public_id), None)
+        d = old_refs.find(public_id)
         coord = [float(nd["lat"]), float(nd["long"])]
         if d is None:
-            ds = [x for x in old_data if not x[REF] and distance([x.lat, x.lon], coord) < 250]
+            ds = [x for x, _ in old_geo.within(coord, 250) if not x[REF]]
             if len(ds) == 1:
                 d = ds[0]
         if d is None:
@@ -53,6 +55,8 @@ if __name__ == "__main__":
             d.data["id"] = public_id
             d.data["lat"], d.data["lon"] = coord
             old_data.append(d)
+            old_refs.add(d)
+            old_geo.add(d)
         else:
             old_node_ids.remove(d.data["id"])
 
@@ -93,7 +97,7 @@ if __name__ == "__main__":
             if len(postcode) == 8:  # and not d["addr:postcode"]:
                 d["addr:postcode"] = POSTCODES.get(public_id, postcode)
         city = address.pop().strip()
-        d["addr:city"] = CITIES.get(d["addr:postcode"], city)
+        d["addr:city"] = city
         if not d["addr:street"] and not d["addr:place"] and not d["addr:suburb"] and not d["addr:housename"]:
             d["x-dld-addr"] = "; ".join(address)
 
@@ -105,6 +109,8 @@ if __name__ == "__main__":
         if d.data["id"] in old_node_ids:
             d.kind = "del"
 
+    normalize_addresses([d for d in old_data if d.kind != "del"], CITIES)
+
     old_data.sort(key=lambda d: d[REF])
 
     write_diff("Froiz", REF, old_data, osm=True)
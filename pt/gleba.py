@@ -4,21 +4,35 @@ import re
 
 from more_itertools import one
 
-from impl.common import DiffDict, distance, fetch_html_data, format_phonenumber, lookup_gmaps_coords, overpass_query, write_diff
+from impl.common import (
+    DiffDict,
+    GeoIndex,
+    RefIndex,
+    RegexMapping,
+    fetch_html_data,
+    format_phonenumber,
+    lookup_gmaps_coords,
+    overpass_query,
+    write_diff,
+)
 
 
 DATA_URL = "https://mygleba.com/pt/lojas-gleba"
 
 REF = "ref"
 
-SCHEDULE_DAYS_MAPPING = {
-    r"seg a quin": "Mo-Th",
-    r"seg a dom": "Mo-Su",
-    r"sex a dom": "Fr-Su",
-}
-SCHEDULE_HOURS_MAPPING = {
-    r"(\d{2})[:h](\d{2})\s*-\s*(\d{2})[:h](\d{2})": r"\1:\2-\3:\4",
-}
+SCHEDULE_DAYS_MAPPING = RegexMapping(
+    {
+        r"seg a quin": "Mo-Th",
+        r"seg a dom": "Mo-Su",
+        r"sex a dom": "Fr-Su",
+    }
+)
+SCHEDULE_HOURS_MAPPING = RegexMapping(
+    {
+        r"(\d{2})[:h](\d{2})\s*-\s*(\d{2})[:h](\d{2})": r"\1:\2-\3:\4",
+    }
+)
 
 
 def fetch_data():
@@ -43,19 +57,15 @@ def fetch_data():
 
 
 def schedule_time(v, mapping):
-    sa = v
-    sb = f"<ERR:{v}>"
-    for sma, smb in mapping.items():
-        if re.fullmatch(sma, sa) is not None:
-            sb = re.sub(sma, smb, sa)
-            break
-    return sb
+    return mapping.sub(v, f"<ERR:{v}>")
 
 
 if __name__ == "__main__":
     new_data = fetch_data()
 
     old_data = [DiffDict(e) for e in overpass_query('nwr[shop][~"^(name|brand)$"~"gleba",i](area.country);')]
+    old_refs = RefIndex(old_data, REF)
+    old_geo = GeoIndex(old_data)
 
     old_node_ids = {d.data["id"] for d in old_data}
 
@@ -65,10 +75,10 @@ if __name__ == "__main__":
         public_id = nd["id"]
         tags_to_reset = set()
 
-        d = next((od for od in old_data if od[REF] == public_id), None)
+        d = old_refs.find(public_id)
         coord = nd["coords"]
         if d is None:
-            ds = [x for x in old_data if not x[REF] and distance([x.lat, x.lon], coord) < 250]
+            ds = [x for x, _ in old_geo.within(coord, 250) if not x[REF]]
             if len(ds) == 1:
                 d = ds[0]
         if d is None:
@@ -77,6 +87,8 @@ if __name__ == "__main__":
             d.data["id"] = str(new_node_id)
             d.data["lat"], d.data["lon"] = coord
             old_data.append(d)
+            old_refs.add(d)
+            old_geo.add(d)
             new_node_id -= 1
         else:
             old_node_ids.remove(d.data["id"])
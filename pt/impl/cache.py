@@ -0,0 +1,154 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+from gzip import compress, decompress
+from hashlib import sha256
+
+
+CACHE_SCHEMA = """
+BEGIN IMMEDIATE;
+CREATE TABLE IF NOT EXISTS entries (
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    created REAL NOT NULL,
+    accessed REAL NOT NULL,
+    size INTEGER NOT NULL,
+    value BLOB NOT NULL,
+    PRIMARY KEY (kind, key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed);
+CREATE TABLE IF NOT EXISTS totals (
+    name TEXT NOT NULL PRIMARY KEY,
+    value INTEGER NOT NULL
+) WITHOUT ROWID;
+INSERT OR IGNORE INTO totals (name, value) SELECT 'size', COALESCE(SUM(size), 0) FROM entries;
+CREATE TRIGGER IF NOT EXISTS entries_insert AFTER INSERT ON entries BEGIN
+    UPDATE totals SET value = value + NEW.size WHERE name = 'size';
+END;
+CREATE TRIGGER IF NOT EXISTS entries_update AFTER UPDATE OF size ON entries BEGIN
+    UPDATE totals SET value = value + NEW.size - OLD.size WHERE name = 'size';
+END;
+CREATE TRIGGER IF NOT EXISTS entries_delete AFTER DELETE ON entries BEGIN
+    UPDATE totals SET value = value - OLD.size WHERE name = 'size';
+END;
+COMMIT;
+"""
+
+DURATION_UNITS = {"s": 1, "m": 60, "h": 60 * 60, "d": 24 * 60 * 60}
+
+# Last access times are only as precise as that, so that most lookups don't have to write
+ACCESS_RESOLUTION = 60 * 60
+
+
+def parse_duration(value):
+    # Seconds, or a number followed by one of DURATION_UNITS (e.g. "6h", "30d"); None means forever
+    if value is None or isinstance(value, int | float):
+        return value
+    m = re.fullmatch(r"(\d+(?:\.\d+)?)\s*([smhd])", value.strip())
+    if not m:
+        msg = f"Invalid duration: {value!r}"
+        raise ValueError(msg)
+    return float(m[1]) * DURATION_UNITS[m[2]]
+
+
+class CacheStore:
+    # Single SQLite database shared by all scripts and their workers; WAL mode lets readers run concurrently with a writer,
+    # and connections are per process and thread as SQLite ones may not be shared across either
+    def __init__(self, path, *, ttls, stale_ttls, max_size):
+        self._path = path
+        self._ttls = ttls
+        self._stale_ttls = stale_ttls
+        self._max_size = max_size
+        self._local = threading.local()
+
+    def get(self, kind, key):
+        value, fresh = self.lookup(kind, key)
+        return value if fresh else None
+
+    def lookup(self, kind, key, *, expired=False):
+        # Entries past their TTL are still returned (as not fresh) for as long as the kind's stale TTL allows, or until
+        # pruned if `expired` is set
+        key = sha256(key.encode()).hexdigest()
+        conn = self._connection()
+        row = conn.execute("SELECT value, created, accessed FROM entries WHERE kind = ? AND key = ?", (kind, key)).fetchone()
+        if row is None or (not expired and self._expired(kind, row[1], self._stale_ttls.get(kind, 0))):
+            return None, False
+        if (now := time.time()) - row[2] > ACCESS_RESOLUTION:
+            conn.execute("UPDATE entries SET accessed = ? WHERE kind = ? AND key = ?", (now, kind, key))
+        return decompress(row[0]), not self._expired(kind, row[1])
+
+    def set(self, kind, key, value):
+        key = sha256(key.encode()).hexdigest()
+        value = compress(value)
+        now = time.time()
+        conn = self._connection()
+        conn.execute(
+            "INSERT INTO entries (kind, key, created, accessed, size, value) VALUES (?, ?, ?, ?, ?, ?)"
+            " ON CONFLICT (kind, key) DO UPDATE"
+            " SET created = excluded.created, accessed = excluded.accessed, size = excluded.size, value = excluded.value",
+            (kind, key, now, now, len(value), value),
+        )
+        if self._total_size(conn) > self._max_size:
+            self._evict(conn)
+
+    def delete(self, kind, key):
+        key = sha256(key.encode()).hexdigest()
+        self._connection().execute("DELETE FROM entries WHERE kind = ? AND key = ?", (kind, key))
+
+    def stats(self):
+        rows = self._connection().execute(
+            "SELECT kind, COUNT(*), SUM(size), MIN(created), MAX(created) FROM entries GROUP BY kind ORDER BY kind"
+        )
+        return [
+            {"kind": kind, "count": count, "size": size, "oldest": oldest, "newest": newest}
+            for kind, count, size, oldest, newest in rows
+        ]
+
+    def prune(self):
+        conn = self._connection()
+        removed = 0
+        for kind, ttl in self._ttls.items():
+            if ttl is not None:
+                ttl += self._stale_ttls.get(kind, 0)
+                removed += conn.execute(
+                    "DELETE FROM entries WHERE kind = ? AND created < ?", (kind, time.time() - ttl)
+                ).rowcount
+        removed += self._evict(conn)
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        conn.execute("VACUUM")
+        return removed
+
+    def _expired(self, kind, created, stale_ttl=0):
+        ttl = self._ttls.get(kind)
+        return ttl is not None and created < time.time() - ttl - stale_ttl
+
+    def _total_size(self, conn):
+        # Kept up to date by triggers, instead of summing the sizes of all entries
+        return conn.execute("SELECT value FROM totals WHERE name = 'size'").fetchone()[0]
+
+    def _evict(self, conn):
+        # Least recently used entries go first
+        total = self._total_size(conn)
+        if total <= self._max_size:
+            return 0
+        removed = 0
+        for kind, key, size in conn.execute("SELECT kind, key, size FROM entries ORDER BY accessed").fetchall():
+            conn.execute("DELETE FROM entries WHERE kind = ? AND key = ?", (kind, key))
+            removed += 1
+            total -= size
+            if total <= self._max_size:
+                break
+        return removed
+
+    def _connection(self):
+        if getattr(self._local, "pid", None) != os.getpid():
+            self._path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self._path, timeout=60, isolation_level=None)
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")
+            conn.executescript(CACHE_SCHEMA)
+            self._local.connection = conn
+            self._local.pid = os.getpid()
+        return self._local.connection
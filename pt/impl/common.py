@@ -1,15 +1,24 @@
+import atexit
 import datetime
 import fcntl
 import itertools
+import os
 import re
+import resource
 import sys
-from gzip import compress, decompress
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from functools import cache, lru_cache, partial
+from gzip import GzipFile, compress
 from hashlib import sha256
 from json import dumps as json_dumps
 from json import loads as json_loads
-from math import asin, atan2, cos, degrees, pi, radians, sin, sqrt
+from math import asin, atan2, cos, degrees, floor, inf, pi, radians, sin, sqrt
 from pathlib import Path
+from urllib.parse import urlsplit
 
+import numpy as np
 import pytz
 import requests
 from humanize import naturaltime
@@ -17,10 +26,33 @@ from jinja2 import Environment, FileSystemLoader
 from lxml import etree
 from osm2geojson import json2geojson
 from retrying import retry
-from shapely import voronoi_polygons
-from shapely.geometry import Point, Polygon, shape
-
-from .config import ENABLE_CACHE, ENABLE_GMAPS_CACHE, ENABLE_OVERPASS_CACHE, OVERPASS_API_URL, PROXIES
+from scipy.optimize import linear_sum_assignment
+from shapely import from_wkb, intersects, polygons, prepare, to_wkb, union_all
+from shapely.geometry import shape
+from shapely.ops import polylabel
+
+from .cache import CacheStore, parse_duration
+from .config import (
+    CACHE_MAX_SIZE,
+    CACHE_STALE_TTLS,
+    CACHE_TTLS,
+    ENABLE_CACHE,
+    ENABLE_GMAPS_CACHE,
+    ENABLE_OVERPASS_CACHE,
+    HTTP_CONCURRENCY,
+    HTTP_POOL_SIZE,
+    OSM_EXTRACT,
+    OVERPASS_API_URL,
+    OVERPASS_INCREMENTAL,
+    OVERPASS_PREFETCH_DIR,
+    OVERPASS_RESYNC_DAYS,
+    POSTCODE_DATASET,
+    PROXIES,
+    RUN_STATS_FILE,
+)
+from .extract import OsmExtract
+from .jsonstream import JSON_CHUNK_SIZE, iter_chunks, iter_json_array, write_json_array
+from .postcodes import PostcodeIndex
 
 
 try:
@@ -34,8 +66,20 @@ BASE_DIR = BASE_PATH.parent
 BASE_NAME = BASE_PATH.stem
 
 CACHE_DIR = BASE_DIR / "cache"
+# Defaults, overridden by `cache.ttl` and `cache.stale_ttl` in the config; None keeps entries until evicted
+DEFAULT_CACHE_TTLS = {
+    "boundary": 30 * 24 * 60 * 60,
+    "boundary_geometry": 30 * 24 * 60 * 60,
+    "cover_plan": None,
+    "data": 24 * 60 * 60,
+    "gmaps": None,
+    "overpass": 24 * 60 * 60,
+    "overpass_snapshot": None,
+    "validators": None,
+}
 
 EARTH_RADIUS = 6378137
+MEAN_EARTH_RADIUS = 6371000
 
 LISBON_TZ = pytz.timezone("Europe/Lisbon")
 
@@ -50,8 +94,24 @@ COMMON_HTTP_HEADERS = {
     "user-agent": "mikedld-osm/1.0",
 }
 
+HTTP_LOCK = threading.Lock()
+HTTP_SESSIONS = {}
+HTTP_HOST_SLOTS = {}
+
+CACHE_STORE = CacheStore(
+    CACHE_DIR / "cache.sqlite3",
+    ttls={**DEFAULT_CACHE_TTLS, **{k: parse_duration(v) for k, v in CACHE_TTLS.items()}},
+    stale_ttls={k: parse_duration(v) for k, v in CACHE_STALE_TTLS.items()},
+    max_size=CACHE_MAX_SIZE,
+)
+CACHE_REVALIDATOR = ThreadPoolExecutor(max_workers=4)
+
 
 class DiffDict:
+    # Scripts keep thousands of these around and read or write their tags many times, hence the slots, the direct
+    # reference to the tags dict and the watchers list only being allocated when needed
+    __slots__ = ("_data", "_tags", "_watchers", "kind", "old_tags")
+
     def __init__(self, data=None):
         if data is None:
             self.data = {"tags": {}}
@@ -60,6 +120,19 @@ class DiffDict:
             self.data = data
             self.kind = "old"
         self.old_tags = {}
+        self._watchers = ()
+
+    @property
+    def data(self):
+        return self._data
+
+    @data.setter
+    def data(self, value):
+        self._data = value
+        self._tags = value.setdefault("tags", {})
+
+    def watch(self, callback):
+        self._watchers = [*self._watchers, callback]
 
     def diff(self):
         return [[self.lat, self.lon], {key: [old_value, self[key]] for key, old_value in self.old_tags.items()}]
@@ -69,34 +142,167 @@ class DiffDict:
             self[key] = self.old_tags[key]
             self.old_tags.pop(key)
             if not self[key]:
-                self.data["tags"].pop(key)
+                self._tags.pop(key)
             if not self.old_tags and self.kind == "mod":
                 self.kind = "old"
 
+    # Not cached, as scripts set the coordinates of new elements through `data` after creating them
     @property
     def lat(self):
-        return self.data.get("center", {}).get("lat", self.data.get("lat"))
+        center = self._data.get("center")
+        return center["lat"] if center is not None else self._data.get("lat")
 
     @property
     def lon(self):
-        return self.data.get("center", {}).get("lon", self.data.get("lon"))
+        center = self._data.get("center")
+        return center["lon"] if center is not None else self._data.get("lon")
 
     def __getitem__(self, key):
-        return self.data["tags"].get(key) or ""
+        return self._tags.get(key) or ""
 
     def __setitem__(self, key, value):
-        if self[key] == value:
+        old_value = self._tags.get(key) or ""
+        if old_value == value:
             return
         if key not in self.old_tags:
-            self.old_tags[key] = self[key]
-        self.data["tags"][key] = value
+            self.old_tags[key] = old_value
+        self._tags[key] = value
         if self.kind == "old":
             self.kind = "mod"
+        for callback in self._watchers:
+            callback(self, key, old_value)
 
     def __repr__(self):
         return repr({"data": self.data, "kind": self.kind})
 
 
+class RefIndex:
+    def __init__(self, items, key):
+        self._key = key
+        self._exact = {}
+        self._partial = {}
+        for d in items:
+            self.add(d)
+
+    def add(self, d):
+        d.watch(self._on_change)
+        self._update(d, d[self._key], self._link)
+
+    def find(self, ref):
+        return next(iter(self.find_all(ref)), None)
+
+    def find_all(self, ref):
+        # Exact value matches take precedence over matches of one of the multiple values
+        return [*self._exact.get(ref, []), *self._partial.get(ref, [])]
+
+    def _on_change(self, d, key, old_value):
+        if key == self._key:
+            self._update(d, old_value, self._unlink)
+            self._update(d, d[key], self._link)
+
+    def _update(self, d, value, func):
+        if not value:
+            return
+        func(self._exact, value, d)
+        if ";" in value:
+            for ref in {x.strip() for x in value.split(";")} - {"", value}:
+                func(self._partial, ref, d)
+
+    @staticmethod
+    def _link(refs, ref, d):
+        refs.setdefault(ref, []).append(d)
+
+    @staticmethod
+    def _unlink(refs, ref, d):
+        refs[ref].remove(d)
+        if not refs[ref]:
+            refs.pop(ref)
+
+
+class GeoIndex:
+    def __init__(self, items, cell_size=250):
+        self._step = degrees(cell_size / MEAN_EARTH_RADIUS)
+        self._cells = {}
+        for d in items:
+            self.add(d)
+
+    def add(self, d):
+        if d.lat is not None and d.lon is not None:
+            self._cells.setdefault(self._cell(d.lat, d.lon), []).append(d)
+
+    def within(self, coord, radius):
+        # Candidates closer than `radius` meters, nearest first
+        lat_range = degrees(radius / MEAN_EARTH_RADIUS)
+        lon_range = lat_range / max(cos(radians(coord[0])), 0.01)
+        lat_min, lon_min = self._cell(coord[0] - lat_range, coord[1] - lon_range)
+        lat_max, lon_max = self._cell(coord[0] + lat_range, coord[1] + lon_range)
+        result = [
+            (d, dist)
+            for lat in range(lat_min, lat_max + 1)
+            for lon in range(lon_min, lon_max + 1)
+            for d in self._cells.get((lat, lon), [])
+            if (dist := distance([d.lat, d.lon], coord)) < radius
+        ]
+        result.sort(key=lambda x: x[1])
+        return result
+
+    def nearest(self, coord, radius):
+        return next(iter(self.within(coord, radius)), (None, None))
+
+    def _cell(self, lat, lon):
+        return (floor(lat / self._step), floor(lon / self._step))
+
+
+def match_nearby(geo, coords, radius, predicate=None):
+    # Assign each of `coords` (None to skip) at most one distinct element of `geo` closer than `radius` meters, so that
+    # as many as possible are matched with the minimum total distance; independent clusters are solved separately
+    edges = {
+        i: {id(x): (x, dist) for x, dist in geo.within(coord, radius) if predicate is None or predicate(x)}
+        for i, coord in enumerate(coords)
+        if coord is not None
+    }
+    result = [None] * len(coords)
+    for items in nearby_clusters(edges):
+        elements = list({key: x for i in items for key, (x, _) in edges[i].items()}.values())
+        columns = {id(x): col for col, x in enumerate(elements)}
+        # A dummy column per item leaves it unmatched for twice `radius` (as if both it and the element it could have
+        # been matched to were left out), which is always worse than matching it; elements out of reach are infeasible
+        n, m = len(items), len(elements)
+        cost = np.full((n, m + n), np.inf)
+        for row, i in enumerate(items):
+            for key, (_, dist) in edges[i].items():
+                cost[row, columns[key]] = dist
+            cost[row, m + row] = 2 * radius
+        for row, col in zip(*linear_sum_assignment(cost), strict=True):
+            if col < m:
+                result[items[row]] = elements[col]
+    return result
+
+
+def nearby_clusters(edges):
+    # Connected components (lists of items sharing candidate elements) of the candidates graph, items without candidates
+    # are left out
+    parents = {}
+
+    def root(key):
+        while parents[key] != key:
+            parents[key] = parents[parents[key]]
+            key = parents[key]
+        return key
+
+    for i, candidates in edges.items():
+        parents.setdefault(("new", i), ("new", i))
+        for key in candidates:
+            parents.setdefault(("old", key), ("old", key))
+            parents[root(("old", key))] = root(("new", i))
+
+    clusters = {}
+    for i, candidates in edges.items():
+        if candidates:
+            clusters.setdefault(root(("new", i)), []).append(i)
+    return list(clusters.values())
+
+
 class RedoIter:
     def __init__(self, items):
         self.redo = False
@@ -124,9 +330,152 @@ class Locker:
         self.fp.close()
 
 
-def cache_name(key):
-    today = datetime.datetime.now(datetime.UTC).astimezone(LISBON_TZ).date()
-    return CACHE_DIR / f"{BASE_NAME}-{today}-{sha256(key.encode()).hexdigest()[:10]}.cache"
+class RegexMapping:
+    # Ordered `{pattern: replacement}` table where the first pattern fully matching a value wins, and is then substituted
+    # the same as `re.sub` would; the patterns are joined in a single alternation so that the winning one is found in one
+    # scan instead of trying them one by one, and results are memoized
+    def __init__(self, mapping, *, flags=0):
+        self._patterns = [re.compile(k, flags) for k in mapping]
+        self._replacements = list(mapping.values())
+        self._combined = combine_patterns(self._patterns, flags)
+        self._lookup = lru_cache(maxsize=4096)(self._lookup_uncached)
+
+    def sub(self, value, default=None):
+        result = self._lookup(value)
+        return result if result is not None else default
+
+    def _lookup_uncached(self, value):
+        if self._combined is not None:
+            m = self._combined.fullmatch(value)
+            i = int(m.lastgroup[2:]) if m else None
+        else:
+            i = next((i for i, x in enumerate(self._patterns) if x.fullmatch(value)), None)
+        return self._patterns[i].sub(self._replacements[i], value) if i is not None else None
+
+
+class RegexReplacements:
+    # Ordered (pattern, replacement) substitutions, each applied to the result of the previous ones; values none of the
+    # patterns occur in, most of them usually, are told apart with a single scan of the joined patterns, and results are
+    # memoized
+    def __init__(self, rules, *, flags=0):
+        self._patterns = [re.compile(a, flags) for a, _ in rules]
+        self._replacements = [b for _, b in rules]
+        self._combined = combine_patterns(self._patterns, flags)
+        self._sub = lru_cache(maxsize=4096)(self._sub_uncached)
+
+    def sub(self, value):
+        return self._sub(value)
+
+    def _sub_uncached(self, value):
+        if self._combined is not None and not self._combined.search(value):
+            return value
+        for pattern, replacement in zip(self._patterns, self._replacements, strict=True):
+            value = pattern.sub(replacement, value)
+        return value
+
+
+def combine_patterns(patterns, flags):
+    # None if the patterns can't be joined without changing their meaning, i.e. with group references (renumbered in the
+    # alternation) or global flags (only allowed at the start)
+    if any(re.search(r"\\[1-9]|\(\?P=|\(\?[aiLmsux]+\)", x.pattern) for x in patterns):
+        return None
+    try:
+        return re.compile("|".join(f"(?P<_r{i}>{x.pattern})" for i, x in enumerate(patterns)), flags)
+    except re.error:
+        return None
+
+
+def record_run_event(event):
+    # Appended line by line, so that events from concurrent workers are not lost
+    if RUN_STATS_FILE:
+        with Path(RUN_STATS_FILE).open("a") as f:
+            print(event, file=f)
+
+
+def record_run_usage():
+    usage = [resource.getrusage(resource.RUSAGE_SELF), resource.getrusage(resource.RUSAGE_CHILDREN)]
+    record_run_event(f"cpu_time {sum(u.ru_utime + u.ru_stime for u in usage)}")
+    record_run_event(f"max_rss {max(u.ru_maxrss for u in usage)}")
+
+
+if RUN_STATS_FILE:
+    atexit.register(record_run_usage)
+
+
+def cache_get(kind, key):
+    return CACHE_STORE.get(kind, key)
+
+
+def cache_set(kind, key, value):
+    CACHE_STORE.set(kind, key, value)
+
+
+FLIGHT_LOCKS = threading.local()
+
+
+@contextmanager
+def single_flight(kind, key):
+    # Callers fetching the same entry, from other threads or processes, wait for the first one instead of fetching it
+    # again; keys are spread over a fixed number of lock files, so unrelated fetches only rarely wait for each other. A
+    # fetch nested in another one (e.g. a boundary fetched while building a cached geometry) may land in a bucket its own
+    # thread already holds, which is then not locked again, as a second `flock` on it would wait forever
+    bucket = sha256(f"{kind}:{key}".encode()).hexdigest()[:2]
+    if not hasattr(FLIGHT_LOCKS, "buckets"):
+        FLIGHT_LOCKS.buckets = set()
+    held = FLIGHT_LOCKS.buckets
+    if bucket in held:
+        yield
+        return
+    with Locker(f"cache/flight-{bucket}"):
+        held.add(bucket)
+        try:
+            yield
+        finally:
+            held.discard(bucket)
+
+
+def cached_fetch(kind, key, fetch, *, enabled=True):
+    # Stale entries are served right away and refreshed in the background, for the next run to pick up; a failed refresh
+    # leaves the stale entry in place. With the cache disabled, responses are still stored to be revalidated against
+    value, fresh = CACHE_STORE.lookup(kind, key) if enabled else (None, False)
+    if value is None:
+        with single_flight(kind, key) if enabled else nullcontext():
+            value, fresh = CACHE_STORE.lookup(kind, key) if enabled else (None, False)
+            if value is None:
+                value = fetch()
+                cache_set(kind, key, value)
+                return value
+    record_run_event("cache")
+    if not fresh:
+        CACHE_REVALIDATOR.submit(revalidate_cache, kind, key, fetch)
+    return value
+
+
+def revalidate_cache(kind, key, fetch):
+    with single_flight(kind, key):
+        if CACHE_STORE.get(kind, key) is None:
+            cache_set(kind, key, fetch())
+
+
+def conditional_fetch(kind, key, request):
+    # Revalidates the cached response, even an expired one, using its ETag / Last-Modified; `request` is called with the
+    # extra headers to send and returns the response
+    cached, _ = CACHE_STORE.lookup(kind, key, expired=True)
+    validators = cache_get("validators", f"{kind}:{key}")
+    headers = {}
+    if cached is not None and validators is not None:
+        validators = json_loads(validators)
+        if "etag" in validators:
+            headers["if-none-match"] = validators["etag"]
+        if "last-modified" in validators:
+            headers["if-modified-since"] = validators["last-modified"]
+    r = request(headers)
+    if r.status_code == 304 and cached is not None:
+        record_run_event("cache")
+        return cached
+    if validators := {k: r.headers[k] for k in ("etag", "last-modified") if k in r.headers}:
+        cache_set("validators", f"{kind}:{key}", json_dumps(validators).encode("utf-8"))
+    return r.content
 
 
 def cookie_jar_name():
@@ -136,6 +485,8 @@ def cookie_jar_name():
 
 def save_cookies(cookies):
     cookie_jar_name().write_text(json_dumps(cookies))
+    for session in HTTP_SESSIONS.values():
+        session.cookies.update(cookies)
 
 
 def load_cookies():
@@ -145,6 +496,41 @@ def load_cookies():
         return None
 
 
+def http_session(url):
+    # One keep-alive session per host, not shared with forked pool workers
+    parts = urlsplit(url)
+    key = (os.getpid(), parts.scheme, parts.netloc)
+    with HTTP_LOCK:
+        if (session := HTTP_SESSIONS.get(key)) is None:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_maxsize=HTTP_POOL_SIZE)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            session.headers.update(COMMON_HTTP_HEADERS)
+            session.proxies.update(PROXIES)
+            if cookies := load_cookies():
+                session.cookies.update(cookies)
+            HTTP_SESSIONS[key] = session
+    return session
+
+
+def http_request(method, url, **kwargs):
+    # At most as many requests in flight per host as there are pooled connections
+    netloc = urlsplit(url).netloc
+    with HTTP_LOCK:
+        slot = HTTP_HOST_SLOTS.setdefault(netloc, threading.BoundedSemaphore(HTTP_POOL_SIZE))
+    with slot:
+        r = http_session(url).request(method, url, **kwargs)
+    r.raise_for_status()
+    record_run_event("http")
+    return r
+
+
+def fetch_many(func, items, *, max_workers=HTTP_CONCURRENCY):
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(func, items))
+
+
 def fetch_json_data(
     url,
     params=None,
@@ -157,26 +543,20 @@ def fetch_json_data(
     post_process=None,
     verify_cert=True,
 ):
-    cache_file = cache_name(f"{url}:{params}:{headers}:{data}:{json}").with_suffix(".cache.data.gz")
-    if not ENABLE_CACHE or not cache_file.exists():
+    def request(conditional_headers):
         # print(f"Querying URL: {url} {params}")  # noqa: ERA001
         common_args = {
             "params": params or {},
-            "headers": {**COMMON_HTTP_HEADERS, **(headers or {}), **(var_headers or {})},
-            "proxies": PROXIES,
             "verify": verify_cert,
-            "cookies": load_cookies(),
         }
+        request_headers = {**(headers or {}), **(var_headers or {})}
         if data is not None or json is not None:
-            r = requests.post(url, **common_args, data=data, json=json, timeout=120)
-        else:
-            r = requests.get(url, **common_args, timeout=120)
-        r.raise_for_status()
-        result = r.content
-        if ENABLE_CACHE:
-            cache_file.write_bytes(compress(result))
-    else:
-        result = decompress(cache_file.read_bytes())
+            # Preconditions on POST make servers fail with 412 instead of returning 304
+            return http_request("post", url, **common_args, headers=request_headers, data=data, json=json, timeout=120)
+        return http_request("get", url, **common_args, headers={**request_headers, **conditional_headers}, timeout=120)
+
+    cache_key = f"{url}:{params}:{headers}:{data}:{json}"
+    result = cached_fetch("data", cache_key, partial(conditional_fetch, "data", cache_key, request), enabled=ENABLE_CACHE)
     result = result.decode(encoding)
     if post_process:
         result = post_process(result)
@@ -184,41 +564,177 @@ def fetch_json_data(
 
 
 def fetch_html_data(url, params=None, *, encoding="utf-8", headers=None):
-    cache_file = cache_name(f"{url}:{params}:{headers}").with_suffix(".cache.data.gz")
-    if not ENABLE_CACHE or not cache_file.exists():
+    def request(conditional_headers):
         # print(f"Querying URL: {url} {params}")  # noqa: ERA001
-        r = requests.get(
-            url, params=params or {}, headers={**COMMON_HTTP_HEADERS, **(headers or {})}, cookies=load_cookies(), timeout=120
-        )
-        r.raise_for_status()
-        result = r.content
-        if ENABLE_CACHE:
-            cache_file.write_bytes(compress(result))
-    else:
-        result = decompress(cache_file.read_bytes())
+        return http_request("get", url, params=params or {}, headers={**(headers or {}), **conditional_headers}, timeout=120)
+
+    cache_key = f"{url}:{params}:{headers}"
+    result = cached_fetch("data", cache_key, partial(conditional_fetch, "data", cache_key, request), enabled=ENABLE_CACHE)
     result = result.decode(encoding)
     return etree.fromstring(result, etree.HTMLParser())
 
 
-@retry(stop_max_attempt_number=3, wait_fixed=10000)
-def overpass_query(query, *, country="PT", center=True):
+def overpass_statements(query, *, center=True, snapshot=None):
     out = "meta"
     if center:
         out += " center"
-    full_query = f'[out:json][timeout:300]; area[admin_level=2]["ISO3166-1"="{country}"] -> .country; {query} out {out};'
-    cache_file = cache_name(full_query).with_suffix(".cache.overpass.gz")
-    if not ENABLE_OVERPASS_CACHE or not cache_file.exists():
-        # print(f"Querying Overpass: {full_query}")  # noqa: ERA001
-        r = requests.post(f"{OVERPASS_API_URL}/interpreter", data=full_query, headers=COMMON_HTTP_HEADERS, timeout=300)
-        r.raise_for_status()
-        result = r.json()["elements"]
-        if ENABLE_OVERPASS_CACHE:
-            cache_file.write_bytes(compress(json_dumps(result).encode("utf-8")))
+    if snapshot is None:
+        return f"{query} out {out};"
+    # Only the ids of the current result and the elements changed since the snapshot, see `overpass_merge`
+    return f'{query} (._;) -> .all; .all out ids; make incremental; out; nwr.all(newer:"{snapshot["timestamp"]}"); out {out};'
+
+
+def overpass_full_query(query, *, country="PT", center=True, snapshot=None):
+    statements = overpass_statements(query, center=center, snapshot=snapshot)
+    return f'[out:json][timeout:300]; area[admin_level=2]["ISO3166-1"="{country}"] -> .country; {statements}'
+
+
+def load_overpass_snapshot(full_query):
+    # Snapshots are dropped after OVERPASS_RESYNC_DAYS, so that a full resync eventually picks up what `newer:` does not
+    # see (e.g. moved nodes of an otherwise unchanged way)
+    snapshot = cache_get("overpass_snapshot", full_query) if OVERPASS_INCREMENTAL else None
+    if snapshot is None:
+        return None
+    snapshot = json_loads(snapshot.decode("utf-8"))
+    synced = datetime.datetime.fromisoformat(snapshot["synced"])
+    if datetime.datetime.now(datetime.UTC) - synced > datetime.timedelta(days=OVERPASS_RESYNC_DAYS):
+        return None
+    return snapshot
+
+
+def overpass_merge(full_query, snapshot, elements, members):
+    # Returns the result encoded as a JSON array, or None if the snapshot is inconsistent with the changes, in which case a
+    # full resync is needed; `elements` may be read from the same response as `members`, which are only used after them
+    if snapshot is None:
+        result = elements
+        synced = None
+    else:
+        elements = list(elements)
+        check_overpass_response(members)
+        marker = next((i for i, e in enumerate(elements) if e["type"] == "incremental"), None)
+        if marker is None:
+            msg = "Missing incremental marker in Overpass response"
+            raise ValueError(msg)
+        known = {(e["type"], e["id"]): e for e in snapshot["elements"]}
+        known.update({(e["type"], e["id"]): e for e in elements[marker + 1 :]})
+        ids = [(e["type"], e["id"]) for e in elements[:marker]]
+        if any(x not in known for x in ids):
+            CACHE_STORE.delete("overpass_snapshot", full_query)
+            return None
+        result = (known[x] for x in ids)
+        synced = snapshot["synced"]
+    # Encoded one element at a time, as part of the snapshot so that the result doesn't have to be copied out of it
+    data = bytearray(b'{"elements": ')
+    start = len(data)
+    write_json_array(data, result)
+    end = len(data)
+    check_overpass_response(members)
+    timestamp = members["osm3s"]["timestamp_osm_base"]
+    data += f', "timestamp": {json_dumps(timestamp)}, "synced": {json_dumps(synced or timestamp)}}}'.encode()
+    if OVERPASS_INCREMENTAL:
+        cache_set("overpass_snapshot", full_query, data)
+    return memoryview(data)[start:end]
+
+
+def check_overpass_response(members):
+    # Errors such as timeouts are reported in a remark, after whatever elements were output until then
+    if remark := members.get("remark"):
+        msg = f"Overpass error: {remark}"
+        raise ValueError(msg)
+
+
+def overpass_prefetch_name(full_query, directory=OVERPASS_PREFETCH_DIR):
+    return Path(directory) / f"{sha256(full_query.encode()).hexdigest()}.json.gz" if directory else None
+
+
+@cache
+def osm_extract():
+    with Locker("osm_extract"):
+        return OsmExtract.load(BASE_DIR / OSM_EXTRACT)
+
+
+def overpass_query(query, *, country="PT", center=True, cache_kind="overpass", predicate=None):
+    return list(overpass_elements(query, country=country, center=center, cache_kind=cache_kind, predicate=predicate))
+
+
+def overpass_elements(query, *, country="PT", center=True, cache_kind="overpass", predicate=None):
+    # Same as `overpass_query`, but elements are decoded one at a time as they are iterated over, and only the ones
+    # matching `predicate` are kept, so that the whole result never has to be in memory at once
+    if OSM_EXTRACT:
+        # The extract is expected to only cover the country being queried
+        elements = osm_extract().query(query, center=center)
     else:
-        result = json_loads(decompress(cache_file.read_bytes()).decode("utf-8"))
+        elements = overpass_api_elements(query, country=country, center=center, cache_kind=cache_kind)
+    return (e for e in elements if predicate is None or predicate(e))
+
+
+def overpass_api_elements(query, *, country="PT", center=True, cache_kind="overpass"):
+    full_query = overpass_full_query(query, country=country, center=center)
+    # Prefetched results go in the cache, or only come as a file with it disabled
+    prefetch_file = overpass_prefetch_name(full_query) if not ENABLE_OVERPASS_CACHE else None
+    if prefetch_file and prefetch_file.exists():
+        record_run_event("cache")
+        with GzipFile(prefetch_file) as f:
+            yield from iter_json_array(iter(partial(f.read, JSON_CHUNK_SIZE), b""))
+        return
+    fetch = partial(overpass_fetch, query, country=country, center=center)
+    yield from iter_json_array(iter_chunks(cached_fetch(cache_kind, full_query, fetch, enabled=ENABLE_OVERPASS_CACHE)))
+
+
+@retry(stop_max_attempt_number=3, wait_fixed=10000)
+def overpass_fetch(query, *, country="PT", center=True):
+    full_query = overpass_full_query(query, country=country, center=center)
+    result = None
+    snapshot = load_overpass_snapshot(full_query)
+    while result is None:
+        request_query = overpass_full_query(query, country=country, center=center, snapshot=snapshot)
+        # print(f"Querying Overpass: {request_query}")  # noqa: ERA001
+        r = http_request("post", f"{OVERPASS_API_URL}/interpreter", data=request_query, timeout=300, stream=True)
+        members = {}
+        elements = iter_json_array(r.iter_content(JSON_CHUNK_SIZE), "elements", members)
+        result = overpass_merge(full_query, snapshot, elements, members)
+        snapshot = None
     return result
 
 
+def overpass_prefetch(queries, directory, *, country="PT"):
+    # Run multiple `overpass_query` (query, center) calls in a single request, sharing the country area lookup; results are
+    # split using marker elements output before each query. Queries with a fresh cache entry are left out, and results are
+    # cached the same as `overpass_query` would (or, with the cache disabled, put in `directory` for it to serve when run
+    # with `directory` set as OVERPASS_PREFETCH_DIR). Given more time than a single query, but not retried, so that scripts
+    # fall back to their own queries early
+    pending = [(query, center, overpass_full_query(query, country=country, center=center)) for query, center in queries]
+    if ENABLE_OVERPASS_CACHE:
+        pending = [x for x in pending if cache_get("overpass", x[2]) is None]
+    if not pending:
+        return
+    snapshots = [load_overpass_snapshot(x[2]) for x in pending]
+    statements = [
+        f'make prefetch index="{i}"; out; {overpass_statements(query, center=center, snapshot=snapshot)}'
+        for i, ((query, center, _), snapshot) in enumerate(zip(pending, snapshots, strict=True))
+    ]
+    full_query = f'[out:json][timeout:900]; area[admin_level=2]["ISO3166-1"="{country}"] -> .country; {" ".join(statements)}'
+    r = http_request("post", f"{OVERPASS_API_URL}/interpreter", data=full_query, timeout=900, stream=True)
+    members = {}
+    results = {}
+    current = None
+    for e in iter_json_array(r.iter_content(JSON_CHUNK_SIZE), "elements", members):
+        if e["type"] == "prefetch":
+            current = results.setdefault(int(e["tags"]["index"]), [])
+        else:
+            current.append(e)
+    check_overpass_response(members)
+    for i, result in results.items():
+        # Queries with an inconsistent snapshot are left for the script to resync on its own
+        query_full = pending[i][2]
+        data = overpass_merge(query_full, snapshots[i], result, members)
+        if data is None:
+            continue
+        cache_set("overpass", query_full, data)
+        if not ENABLE_OVERPASS_CACHE:
+            overpass_prefetch_name(query_full, directory).write_bytes(compress(data))
+
+
 def titleize(name):
     return "".join(
         word if word in PT_ARTICLES else (word.upper() if re.fullmatch(r"[ivxlcdm]{2,}", word) else word.capitalize())
@@ -237,17 +753,88 @@ def distance(a, b):
     dlon = radians(b[1]) - radians(a[1])
     a = pow(sin(dlat / 2), 2) + cos(radians(a[0])) * cos(radians(b[0])) * pow(sin(dlon / 2), 2)
     c = 2 * atan2(sqrt(a), sqrt(1 - a))
-    d = 6371000 * c
+    d = MEAN_EARTH_RADIUS * c
     return d
 
 
-def relation_polygon(rel_id):
-    features = json2geojson({"elements": overpass_query(f"rel({rel_id});(._;>;);", center=False)})["features"]
-    return shape(next(x for x in features if x["properties"]["type"] == "relation" and x["properties"]["id"] == rel_id))
+def _haversine(lat1, lon1, lat2, lon2):
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * MEAN_EARTH_RADIUS * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
+def distances(a, bs):
+    # Same as `[distance(a, b) for b in bs]`
+    a = np.radians(np.asarray(a, dtype=float))
+    bs = np.radians(np.asarray(bs, dtype=float).reshape(-1, 2))
+    return _haversine(a[0], a[1], bs[:, 0], bs[:, 1])
+
+
+def distance_matrix(as_, bs):
+    # Same as `[[distance(a, b) for b in bs] for a in as_]`
+    as_ = np.radians(np.asarray(as_, dtype=float).reshape(-1, 2))
+    bs = np.radians(np.asarray(bs, dtype=float).reshape(-1, 2))
+    return _haversine(as_[:, 0, None], as_[:, 1, None], bs[None, :, 0], bs[None, :, 1])
+
+
+def nearest(as_, bs, *, chunk_size=1024):
+    # Index of and distance to the nearest of `bs` for each of `as_`, computed in chunks to bound memory use
+    as_ = np.asarray(as_, dtype=float).reshape(-1, 2)
+    indices = np.empty(len(as_), dtype=int)
+    result = np.empty(len(as_))
+    for i in range(0, len(as_), chunk_size):
+        m = distance_matrix(as_[i : i + chunk_size], bs)
+        indices[i : i + chunk_size] = m.argmin(axis=1)
+        result[i : i + chunk_size] = m[np.arange(len(m)), indices[i : i + chunk_size]]
+    return indices, result
+
+
+def within_radius(a, bs, radius):
+    return distances(a, bs) < radius
+
+
+def relation_polygon(rel_id, *, tolerance=None):
+    # Built once per process and kept as WKB in the cache, prepared for fast `contains`/`intersects` calls; `tolerance`
+    # (in degrees) gives a simplified variant, grown by that much beforehand so that it still covers the original
+    return boundary_geometry(rel_id, tolerance)
 
 
-def country_polygon():
-    return relation_polygon(295480)
+@cache
+def boundary_geometry(rel_id, tolerance):
+    # Polygons from the extract are only memoized in-process, the store is left to the ones built from Overpass data
+    if tolerance and OSM_EXTRACT:
+        g = boundary_geometry(rel_id, None).buffer(tolerance).simplify(tolerance)
+    elif tolerance:
+        g = from_wkb(
+            cached_fetch(
+                "boundary_geometry",
+                f"{rel_id}:{tolerance}",
+                lambda: to_wkb(boundary_geometry(rel_id, None).buffer(tolerance).simplify(tolerance)),
+                enabled=ENABLE_OVERPASS_CACHE,
+            )
+        )
+    elif OSM_EXTRACT:
+        g = osm_extract().relation_polygon(rel_id)
+    else:
+        g = from_wkb(
+            cached_fetch(
+                "boundary_geometry",
+                str(rel_id),
+                partial(build_relation_polygon, rel_id),
+                enabled=ENABLE_OVERPASS_CACHE,
+            )
+        )
+    prepare(g)
+    return g
+
+
+def build_relation_polygon(rel_id):
+    elements = overpass_query(f"rel({rel_id});(._;>;);", center=False, cache_kind="boundary")
+    features = json2geojson({"elements": elements})["features"]
+    return to_wkb(shape(next(x for x in features if x["properties"]["type"] == "relation" and x["properties"]["id"] == rel_id)))
+
+
+def country_polygon(*, tolerance=None):
+    return relation_polygon(295480, tolerance=tolerance)
 
 
 def offset(c1, distance, bearing):
@@ -259,18 +846,32 @@ def offset(c1, distance, bearing):
     return [degrees(lon), degrees(lat)]
 
 
+def offsets(c1, distance, bearing):
+    # Same as `offset`, for arrays of (lon, lat) points, distances and bearings broadcast against each other
+    c1 = np.radians(np.asarray(c1, dtype=float))
+    lat1 = c1[..., 1]
+    lon1 = c1[..., 0]
+    d_by_r = np.asarray(distance, dtype=float) / EARTH_RADIUS
+    lat = np.arcsin(np.sin(lat1) * np.cos(d_by_r) + np.cos(lat1) * np.sin(d_by_r) * np.cos(bearing))
+    lon = lon1 + np.arctan2(np.sin(bearing) * np.sin(d_by_r) * np.cos(lat1), np.cos(d_by_r) - np.sin(lat1) * np.sin(lat))
+    return np.degrees(np.stack([lon, lat], axis=-1))
+
+
 def circle(center, radius, *, edges=32, bearing=0, direction=1):
-    start = radians(bearing)
-    coordinates = [offset(center, radius, start + (direction * 2 * pi * -i) / edges) for i in range(edges)]
-    coordinates.append(coordinates[0])
-    return Polygon(coordinates)
+    return circles([center], [radius], edges=edges, bearing=bearing, direction=direction)[0]
+
 
+def circles(centers, radii, *, edges=32, bearing=0, direction=1):
+    # Array of `circle` polygons, one per center and radius
+    bearings = radians(bearing) + (direction * 2 * pi * -np.arange(edges)) / edges
+    centers = np.asarray(centers, dtype=float).reshape(-1, 1, 2)
+    coordinates = offsets(centers, np.asarray(radii, dtype=float).reshape(-1, 1), bearings)
+    return polygons(np.concatenate([coordinates, coordinates[:, :1]], axis=1))
 
-def label_point(g):
-    pts = {Point(p) for e in voronoi_polygons(g, only_edges=True).geoms for p in e.coords if g.contains(Point(p))}
-    pmax = max(pts, default=None, key=lambda p: min(p.distance(g.exterior), min(p.distance(g.interiors), default=360)))
-    if pmax is None:
-        pmax = g.centroid
+
+def label_point(g, *, tolerance=0.001):
+    # Pole of inaccessibility, the inner point farthest from the boundary, found to within `tolerance` degrees
+    pmax = polylabel(g, tolerance) if g.area > 0 else g.centroid
     return (pmax.x, pmax.y)
 
 
@@ -298,17 +899,96 @@ def cover_polygon(g, radius, query):
             lon_offset = lon_step - (rp[0] - bounds[0]) % lon_step
 
             odd = int((rp[1] - bounds[1]) / lat_step) % 2 != 0
+            centers = []
             for lat in frange(bounds[1] - lat_offset, bounds[3] + lat_step, lat_step):
-                for lon in frange(bounds[0] - lon_offset + (0 if odd else lon_step / 2), bounds[2] + lon_step, lon_step):
-                    c = [lon, lat]
-                    if not circle(c, radius).intersects(g):
-                        continue
-                    g -= circle(c, query(c))
+                centers.extend(
+                    [lon, lat]
+                    for lon in frange(bounds[0] - lon_offset + (0 if odd else lon_step / 2), bounds[2] + lon_step, lon_step)
+                )
                 odd = not odd
+            for c, tile in zip(centers, circles(centers, [radius] * len(centers)), strict=True):
+                if not tile.intersects(g):
+                    continue
+                g -= circle(c, query(c))
 
         geoms.append(g)
 
 
+def cover_polygon_parallel(g, radius, query, *, plan_key=None, max_workers=HTTP_CONCURRENCY):
+    # Same as `cover_polygon`, but queries a whole hex tiling of `g` at a time, concurrently, then what is left uncovered
+    # (see `refine_tiles`), round after round. The final centers are kept under `plan_key` for later runs to query right
+    # away, only refining what is no longer covered
+    plan = []
+    cached_plan = cache_get("cover_plan", f"{plan_key}:{radius}") if plan_key else None
+    if cached_plan is not None:
+        tiles = [(c, min(r, radius)) for c, r in json_loads(cached_plan)]
+    else:
+        tiles = [(c, radius) for c in hex_centers(g, radius)]
+    while tiles:
+        centers = [c for c, _ in tiles]
+        radii = fetch_many(query, centers, max_workers=max_workers)
+        plan.extend(zip(centers, radii, strict=True))
+        g = g.difference(union_all(circles(centers, radii)))
+        tiles = refine_tiles(g, tiles, radii, radius)
+    if plan_key:
+        cache_set("cover_plan", f"{plan_key}:{radius}", json_dumps(plan).encode("utf-8"))
+    return plan
+
+
+def refine_tiles(g, tiles, radii, radius):
+    # Next (center, radius) tiles for what is left of `g` after querying `tiles`, which got `radii` back: parts fitting in
+    # a `radius` circle are queried once at their label point, same as `cover_polygon` does; larger ones are only tiled
+    # again within the tiles that got a smaller radius back than theirs, at half of it (or the returned one, if larger),
+    # sparser tiles first so that their overlap goes to them. Anything outside those tiles (e.g. with a cached plan
+    # that no longer fits) is tiled with the smallest radius returned around it
+    result = []
+    large = []
+    for p in getattr(g, "geoms", [g]):
+        if p.area == 0:
+            continue
+        rp = label_point(p)
+        if circle(rp, radius).contains(p):
+            result.append((list(rp), radius))
+        else:
+            large.append(p)
+    g = union_all(large)
+    for (c, tile_radius), r in sorted(zip(tiles, radii, strict=True), key=lambda x: -x[1]):
+        if r >= tile_radius or g.is_empty:
+            continue
+        part = g.intersection(circle(c, tile_radius))
+        if part.area == 0:
+            continue
+        g = g.difference(part)
+        part_radius = max(r, tile_radius / 2)
+        result.extend((x, part_radius) for x in hex_centers(part, part_radius))
+    for p in getattr(g, "geoms", [g]):
+        if p.area == 0:
+            continue
+        prepare(p)
+        r = min((r for (c, _), r in zip(tiles, radii, strict=True) if p.intersects(circle(c, r))), default=min(radii))
+        result.extend((x, r) for x in hex_centers(p, r))
+    return result
+
+
+def hex_centers(g, radius):
+    # Centers of a hex grid of `radius` circles covering `g`: rows 1.5 radii apart, centers sqrt(3) radii apart within a
+    # row, every other row shifted by half of that; longitude steps are measured at the bound closer to the equator
+    bounds = g.bounds
+    sradius = radius * 0.95
+    lat_step = offset(bounds[0:2], sradius * 1.5, 0)[1] - bounds[1]
+    lon_step = min(offset([bounds[0], lat], sradius * sqrt(3), pi / 2)[0] - bounds[0] for lat in (bounds[1], bounds[3]))
+    centers = [
+        [lon, lat]
+        for i, lat in enumerate(frange(bounds[1], bounds[3] + lat_step, lat_step))
+        for lon in frange(bounds[0] - (lon_step / 2 if i % 2 else 0), bounds[2] + lon_step, lon_step)
+    ]
+    if not centers:
+        return []
+    prepare(g)
+    mask = intersects(g, circles(centers, [radius] * len(centers)))
+    return [c for c, m in zip(centers, mask, strict=True) if m]
+
+
 def opening_weekdays(days):
     ranges = []
     for _k, g in itertools.groupby(enumerate(days), lambda x: x[0] - x[1]):
@@ -332,68 +1012,116 @@ def gregorian_easter(year):
     return datetime.date.fromordinal(week * 7)
 
 
+def resolve_url(url):
+    return http_request("head", url, allow_redirects=True, timeout=30).url.encode("utf-8")
+
+
 def lookup_gmaps_coords(gmaps_url):
     coords_regex = r"/@(-?[0-9.]+),(-?[0-9.]+),"
     m = re.search(coords_regex, gmaps_url)
     if not m:
-        cache_file = cache_name(gmaps_url).with_suffix(".cache.gmaps.url")
-        if not ENABLE_GMAPS_CACHE or not cache_file.exists():
-            r = requests.head(gmaps_url, headers=COMMON_HTTP_HEADERS, allow_redirects=True, timeout=30)
-            r.raise_for_status()
-            gmaps_url = r.url
-            if ENABLE_GMAPS_CACHE:
-                cache_file.write_bytes(gmaps_url.encode("utf-8"))
-        else:
-            gmaps_url = cache_file.read_bytes().decode("utf-8")
-        m = re.search(coords_regex, gmaps_url)
+        gmaps_url = cached_fetch("gmaps", gmaps_url, partial(resolve_url, gmaps_url), enabled=ENABLE_GMAPS_CACHE)
+        m = re.search(coords_regex, gmaps_url.decode("utf-8"))
     return [float(m[1]), float(m[2])] if m else None
 
 
 def lookup_postcode(postcode):
+    result = load_postcode(postcode)
+    # A new list every time, as callers extend it
+    return [list(result[0]), postcode_city(result[1])] if result else None
+
+
+def postcode_city(name):
+    return titleize(POSTCODE_CITIES.get(name.lower(), name))
+
+
+def normalize_addresses(elements, cities=None):
+    # Sets `addr:city` of each element to the locality of its `addr:postcode`, from `cities` (script overrides) or the
+    # postcode dataset, and flags postcodes whose CP4 the dataset doesn't know or doesn't cover the resulting city
+    cities = cities or {}
+    index = postcode_index() if POSTCODE_DATASET else None
+    for d in elements:
+        postcode = d["addr:postcode"]
+        if not postcode:
+            continue
+        city = cities.get(postcode)
+        if city is None and index is not None and (locality := index.locality(postcode)) is not None:
+            city = postcode_city(locality)
+        if city is not None:
+            d["addr:city"] = city
+            if d.old_tags.get("addr:city") == city:
+                d.revert("addr:city")
+        if index is not None and d["addr:city"] not in {postcode_city(x) for x in index.localities(postcode[:4])}:
+            d["x-dld-postcode"] = postcode
+
+
+@lru_cache(maxsize=4096)
+def load_postcode(postcode):
+    if POSTCODE_DATASET and (result := postcode_index().find(postcode)):
+        return result
+    store = postcode_store()
+    result = store.get("postcode", postcode)
+    if result is not None:
+        record_run_event("cache")
+        return tuple(json_loads(result))
+    with single_flight("postcode", postcode):
+        result = store.get("postcode", postcode)
+        if result is None and (scraped := scrape_postcode(postcode)) is not None:
+            result = json_dumps(scraped).encode("utf-8")
+            store.set("postcode", postcode, result)
+    return tuple(json_loads(result)) if result is not None else None
+
+
+@cache
+def postcode_index():
+    with Locker("postcode_index"):
+        return PostcodeIndex.load(BASE_DIR / POSTCODE_DATASET)
+
+
+@cache
+def postcode_store():
+    # Opened once per process, moving over the codes looked up before they were kept in it
+    store = CacheStore(BASE_DIR / "postal_codes.sqlite3", ttls={}, stale_ttls={}, max_size=inf)
+    codes_file = BASE_DIR / "postal_codes.json"
     with Locker("postal_codes"):
-        codes = {}
-        codes_file = BASE_DIR / "postal_codes.json"
         if codes_file.exists():
-            codes = json_loads(codes_file.read_text())
-        if postcode not in codes:
-            cp = postcode.split("-", 1)
-            page = requests.get(
-                "https://www.codigo-postal.pt/",
-                params={"cp4": cp[0], "cp3": cp[1] if len(cp) > 1 else ""},
-                headers=COMMON_HTTP_HEADERS,
-                timeout=120,
-            )
-            page.raise_for_status()
-            page_tree = etree.fromstring(page.content.decode("utf-8"), etree.HTMLParser())
-            place_els = page_tree.xpath("//div[@class='places']/p[not(@id)]")
-            page_coords = [
-                x.split(",")
-                for el in place_els
-                for x in (
-                    ["".join(el.xpath(".//*[contains(@class, 'gps')]/text()")).strip()]
-                    if "".join(el.xpath(".//span[@class='cp']/text()")).startswith(postcode)
-                    else []
-                )
-                if x
-            ]
-            if page_coords:
-                coords = [
-                    sum([float(x[0]) for x in page_coords]) / len(page_coords),
-                    sum([float(x[1]) for x in page_coords]) / len(page_coords),
-                ]
-                places = [
-                    "".join(el.xpath(".//span[@class='cp']/following-sibling::text()")).strip()
-                    for el in place_els
-                    if "".join(el.xpath(".//span[@class='cp']/text()")).startswith(postcode)
-                ]
-                places = [(k, len(list(g))) for k, g in itertools.groupby(sorted(places))]
-                place = sorted(places, key=lambda x: -x[1])[0][0]
-                codes[postcode] = [coords, place]
-                codes_file.write_text(json_dumps(codes))
-        result = codes.get(postcode)
-        if result:
-            result[1] = titleize(POSTCODE_CITIES.get(result[1].lower(), result[1]))
-        return result
+            for postcode, result in json_loads(codes_file.read_text()).items():
+                store.set("postcode", postcode, json_dumps(result).encode("utf-8"))
+            codes_file.unlink()
+    return store
+
+
+def scrape_postcode(postcode):
+    cp = postcode.split("-", 1)
+    page = http_request(
+        "get", "https://www.codigo-postal.pt/", params={"cp4": cp[0], "cp3": cp[1] if len(cp) > 1 else ""}, timeout=120
+    )
+    page_tree = etree.fromstring(page.content.decode("utf-8"), etree.HTMLParser())
+    place_els = page_tree.xpath("//div[@class='places']/p[not(@id)]")
+    page_coords = [
+        x.split(",")
+        for el in place_els
+        for x in (
+            ["".join(el.xpath(".//*[contains(@class, 'gps')]/text()")).strip()]
+            if "".join(el.xpath(".//span[@class='cp']/text()")).startswith(postcode)
+            else []
+        )
+        if x
+    ]
+    if not page_coords:
+        return None
+    coords = [
+        sum([float(x[0]) for x in page_coords]) / len(page_coords),
+        sum([float(x[1]) for x in page_coords]) / len(page_coords),
+    ]
+    places = [
+        "".join(el.xpath(".//span[@class='cp']/following-sibling::text()")).strip()
+        for el in place_els
+        if "".join(el.xpath(".//span[@class='cp']/text()")).startswith(postcode)
+    ]
+    places = [(k, len(list(g))) for k, g in itertools.groupby(sorted(places))]
+    place = sorted(places, key=lambda x: -x[1])[0][0]
+    return [coords, place]
 
 
 def write_diff(title, ref, diff, *, html=True, osm=True):
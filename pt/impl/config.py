@@ -17,9 +17,23 @@ CONFIG = _config
 ENABLE_CACHE = CONFIG.get("general", {}).get("enable_cache", True)
 OVERPASS_API_URL = CONFIG.get("general", {}).get("overpass_api_url", "http://overpass-api.de/api")
 ENABLE_OVERPASS_CACHE = CONFIG.get("general", {}).get("enable_overpass_cache", True)
+OVERPASS_INCREMENTAL = CONFIG.get("general", {}).get("overpass_incremental", True)
+OVERPASS_RESYNC_DAYS = CONFIG.get("general", {}).get("overpass_resync_days", 7)
+OSM_EXTRACT = CONFIG.get("general", {}).get("osm_extract")
 ENABLE_GMAPS_CACHE = CONFIG.get("general", {}).get("enable_gmaps_cache", True)
 
 PROXIES = CONFIG.get("general", {}).get("proxies", {})
+HTTP_POOL_SIZE = CONFIG.get("general", {}).get("http_pool_size", 10)
+HTTP_CONCURRENCY = CONFIG.get("general", {}).get("http_concurrency", 32)
+
+RUN_STATS_FILE = os.getenv("DLD_OSM_PT_RUN_STATS")
+OVERPASS_PREFETCH_DIR = os.getenv("DLD_OSM_PT_OVERPASS_PREFETCH")
+
+CACHE_MAX_SIZE = CONFIG.get("cache", {}).get("max_size_mb", 1024) * 1024 * 1024
+CACHE_TTLS = CONFIG.get("cache", {}).get("ttl", {})
+CACHE_STALE_TTLS = CONFIG.get("cache", {}).get("stale_ttl", {})
+
+POSTCODE_DATASET = CONFIG.get("postcodes", {}).get("dataset")
 
 PLAYWRIGHT_CDP_URL = CONFIG.get("playwright", {}).get("cdp_url")
 PLAYWRIGHT_CONTEXT_OPTS = CONFIG.get("playwright", {}).get("context_opts", {})
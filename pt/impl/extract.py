@@ -0,0 +1,319 @@
+import re
+from gzip import compress, decompress
+from json import dumps as json_dumps
+from json import loads as json_loads
+
+import osmium
+from shapely import from_wkb, prepare, union_all
+from shapely.geometry import Point
+
+
+# Only elements with one of these keys are kept; every queried selector has to filter on one of them, so that a result is
+# never silently incomplete
+EXTRACT_KEYS = ("amenity", "healthcare", "leisure", "office", "shop")
+
+ELEMENT_TYPES = {"n": "node", "w": "way", "r": "relation"}
+QUERY_TYPES = {"node": ("node",), "way": ("way",), "rel": ("relation",), "nwr": ("node", "way", "relation"), "area": ()}
+
+QL_TOKEN_REGEX = re.compile(r'\s*("(?:[^"\\]|\\.)*"|->|!=|!~|[()\[\];=~!,.]|[^\s()\[\];=~!,."]+)')
+
+
+class QueryParser:
+    # Subset of Overpass QL used by the scripts: `nwr`/`node`/`way`/`rel`/`area` queries with tag filters (`[k]`, `[!k]`,
+    # `[k=v]`, `[k!=v]`, `[k~v]`, `[k!~v]`, `[~k~v]`, with optional `,i`) and an optional `(area.x)` filter, unions, and
+    # `-> .x` assignments
+    def __init__(self, query):
+        self._tokens = []
+        pos = 0
+        while pos < len(query.rstrip()):
+            m = QL_TOKEN_REGEX.match(query, pos)
+            if not m:
+                msg = f"Unexpected input at {pos}: {query[pos : pos + 20]!r}"
+                raise ValueError(msg)
+            self._tokens.append(m[1])
+            pos = m.end()
+        self._pos = 0
+
+    def parse(self):
+        statements = []
+        while self._peek() is not None:
+            statements.append(self._statement())
+        return statements
+
+    def _peek(self):
+        return self._tokens[self._pos] if self._pos < len(self._tokens) else None
+
+    def _take(self, *expected):
+        token = self._peek()
+        if token is None or (expected and token not in expected):
+            msg = f"Expected {' or '.join(expected) or 'token'}, got {token!r}"
+            raise ValueError(msg)
+        self._pos += 1
+        return token
+
+    def _value(self):
+        token = self._take()
+        if token.startswith('"'):
+            return re.sub(r"\\(.)", r"\1", token[1:-1])
+        return token
+
+    def _statement(self):
+        if self._peek() == "(":
+            self._take("(")
+            statement = {"kind": "union", "statements": []}
+            while self._peek() != ")":
+                statement["statements"].append(self._statement())
+            self._take(")")
+        else:
+            kind = self._take(*QUERY_TYPES)
+            statement = {"kind": kind, "filters": [], "area": None}
+            while self._peek() in ("[", "("):
+                if self._take() == "[":
+                    statement["filters"].append(self._filter())
+                else:
+                    self._take("area")
+                    self._take(".")
+                    statement["area"] = self._take()
+                    self._take(")")
+        statement["into"] = "_"
+        if self._peek() == "->":
+            self._take("->")
+            self._take(".")
+            statement["into"] = self._take()
+        self._take(";")
+        return statement
+
+    def _filter(self):
+        negate = False
+        key_regex = None
+        if self._peek() == "!":
+            self._take("!")
+            negate = True
+        if self._peek() == "~":
+            self._take("~")
+            key_regex = self._value()
+            key = None
+        else:
+            key = self._value()
+        op = self._take("]", "=", "!=", "~", "!~") if key_regex is None else self._take("~")
+        value = None
+        flags = 0
+        if op != "]":
+            value = self._value()
+            if self._peek() == ",":
+                self._take(",")
+                self._take("i")
+                flags = re.IGNORECASE
+            self._take("]")
+        return tag_filter(key, key_regex, op, value, flags, negate=negate)
+
+
+def tag_filter(key, key_regex, op, value, flags, *, negate):
+    # Returns the index key (if the filter requires a literal key to be present) and the predicate
+    if key_regex is not None:
+        kr = re.compile(key_regex, flags)
+        vr = re.compile(value, flags)
+        return None, lambda tags: any(kr.search(k) and vr.search(v) for k, v in tags.items())
+    if op == "]":
+        return (None, lambda tags: key not in tags) if negate else (key, lambda tags: key in tags)
+    if op == "=":
+        return key, lambda tags: tags.get(key) == value
+    if op == "!=":
+        return None, lambda tags: tags.get(key) != value
+    vr = re.compile(value, flags)
+    if op == "~":
+        return key, lambda tags: key in tags and vr.search(tags[key]) is not None
+    return None, lambda tags: key not in tags or vr.search(tags[key]) is None
+
+
+class OsmExtract:
+    # Answers `overpass_query` selectors from a local OSM extract (PBF or XML) instead of the Overpass API; the extract is
+    # expected to cover a single country, which is what `(area.country)` then refers to
+    def __init__(self, elements, areas):
+        self._by_key = {}
+        for e in elements:
+            for k in EXTRACT_KEYS:
+                if k in e["tags"]:
+                    self._by_key.setdefault(k, []).append(e)
+        self._areas = areas
+        self._area_geoms = {}
+
+    @classmethod
+    def load(cls, path):
+        index_file = path.with_name(f"{path.name}.index.json.gz")
+        if not index_file.exists() or index_file.stat().st_mtime < path.stat().st_mtime:
+            elements, areas = build_extract_index(path)
+            index_file.write_bytes(compress(json_dumps({"elements": elements, "areas": areas}).encode("utf-8")))
+        else:
+            index = json_loads(decompress(index_file.read_bytes()).decode("utf-8"))
+            elements, areas = index["elements"], index["areas"]
+        return cls(elements, areas)
+
+    def query(self, query, *, center=True):
+        sets = {"country": None}
+        for statement in QueryParser(query).parse():
+            self._evaluate(statement, sets)
+        result = sorted(sets.get("_", []), key=lambda e: (list(ELEMENT_TYPES.values()).index(e["type"]), e["id"]))
+        return [e if center else {k: v for k, v in e.items() if k != "center"} for e in result]
+
+    def relation_polygon(self, rel_id):
+        area = next(x for x in self._areas if x["id"] == rel_id)
+        return self._area_geometry(area)
+
+    def _evaluate(self, statement, sets):
+        if statement["kind"] == "union":
+            result = {}
+            for s in statement["statements"]:
+                result.update({(e["type"], e["id"]): e for e in self._evaluate(s, sets)})
+            result = list(result.values())
+        elif statement["kind"] == "area":
+            result = [x for x in self._areas if all(f(x["tags"]) for _, f in statement["filters"])]
+            result = self._within(result, sets[statement["area"]] if statement["area"] else None)
+        else:
+            index_key = next((k for k, _ in statement["filters"] if k in EXTRACT_KEYS), None)
+            if index_key is None:
+                msg = f"Query has to filter on one of {', '.join(EXTRACT_KEYS)} to be run on the extract"
+                raise ValueError(msg)
+            types = QUERY_TYPES[statement["kind"]]
+            result = [
+                e
+                for e in self._by_key.get(index_key, [])
+                if e["type"] in types and all(f(e["tags"]) for _, f in statement["filters"])
+            ]
+            result = self._within(result, sets[statement["area"]] if statement["area"] else None)
+        sets[statement["into"]] = result
+        return result
+
+    def _within(self, elements, areas):
+        # Elements are matched by their (center) point, which is close enough for POIs
+        if areas is None:
+            return elements
+        g = union_all([self._area_geometry(x) for x in areas])
+        prepare(g)
+        return [e for e in elements if g.contains(Point(element_coord(e)))]
+
+    def _area_geometry(self, area):
+        if area["id"] not in self._area_geoms:
+            self._area_geoms[area["id"]] = from_wkb(area["wkb"])
+        return self._area_geoms[area["id"]]
+
+
+def element_coord(e):
+    if "center" in e:
+        return (e["center"]["lon"], e["center"]["lat"])
+    if "lon" in e:
+        return (e["lon"], e["lat"])
+    # Areas are matched by a point of their polygon
+    return (e["point"][0], e["point"][1])
+
+
+def element_meta(o):
+    return {
+        "timestamp": o.timestamp.strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "version": o.version,
+        "changeset": o.changeset,
+        "user": o.user,
+        "uid": o.uid,
+    }
+
+
+def extend_bounds(bounds, other):
+    if other is None:
+        return bounds
+    if bounds is None:
+        return list(other)
+    return [min(bounds[0], other[0]), min(bounds[1], other[1]), max(bounds[2], other[2]), max(bounds[3], other[3])]
+
+
+def bounds_center(bounds):
+    # Same as Overpass `out center`, the center of the bounding box
+    return {"lat": (bounds[1] + bounds[3]) / 2, "lon": (bounds[0] + bounds[2]) / 2}
+
+
+def element_bounds(o):
+    if o.is_node():
+        return (o.location.lon, o.location.lat, o.location.lon, o.location.lat) if o.location.valid() else None
+    b = None
+    for n in o.nodes:
+        if n.location.valid():
+            b = extend_bounds(b, (n.lon, n.lat, n.lon, n.lat))
+    return b
+
+
+def relation_bounds(r, bounds):
+    # Nested relations are not taken into account
+    b = None
+    for m in r["members"]:
+        if m["type"] != "relation":
+            b = extend_bounds(b, bounds[m["type"][0]].get(m["ref"]))
+    return b
+
+
+def element_data(o, bounds):
+    if o.is_node():
+        return {"type": "node", "id": o.id, "lat": bounds[1], "lon": bounds[0], **element_meta(o), "tags": dict(o.tags)}
+    return {
+        "type": "way",
+        "id": o.id,
+        "center": bounds_center(bounds),
+        "nodes": [n.ref for n in o.nodes],
+        **element_meta(o),
+        "tags": dict(o.tags),
+    }
+
+
+def area_data(o, wkb_factory):
+    wkb = wkb_factory.create_multipolygon(o)
+    p = from_wkb(wkb).representative_point()
+    return {"id": o.orig_id(), "point": [p.x, p.y], "tags": dict(o.tags), "wkb": wkb}
+
+
+def read_extract_relations(path):
+    relations = []
+    members = {"n": set(), "w": set()}
+    for o in osmium.FileProcessor(str(path), osmium.osm.RELATION).with_filter(osmium.filter.KeyFilter(*EXTRACT_KEYS)):
+        relations.append(
+            {
+                "type": "relation",
+                "id": o.id,
+                "members": [{"type": ELEMENT_TYPES[m.type], "ref": m.ref, "role": m.role} for m in o.members],
+                **element_meta(o),
+                "tags": dict(o.tags),
+            }
+        )
+        for m in o.members:
+            if m.type in members:
+                members[m.type].add(m.ref)
+    return relations, members
+
+
+def build_extract_index(path):
+    # Relations come last in the file, so their members are collected beforehand to be able to compute the centers
+    relations, members = read_extract_relations(path)
+
+    elements = []
+    areas = []
+    bounds = {"n": {}, "w": {}}
+    wkb_factory = osmium.geom.WKBFactory()
+    processor = osmium.FileProcessor(str(path)).with_locations()
+    processor = processor.with_areas(osmium.filter.TagFilter(("boundary", "administrative")))
+    for o in processor:
+        if o.is_area():
+            if not o.from_way() and o.tags.get("boundary") == "administrative":
+                areas.append(area_data(o, wkb_factory))
+            continue
+        if o.is_relation():
+            continue
+        keep = any(k in o.tags for k in EXTRACT_KEYS)
+        kind = o.type_str()
+        if not (keep or o.id in members[kind]) or (b := element_bounds(o)) is None:
+            continue
+        bounds[kind][o.id] = b
+        if keep:
+            elements.append(element_data(o, b))
+
+    for r in relations:
+        if (b := relation_bounds(r, bounds)) is not None:
+            r["center"] = bounds_center(b)
+            elements.append(r)
+    return elements, areas
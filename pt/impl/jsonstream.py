@@ -0,0 +1,119 @@
+import codecs
+import re
+from json import JSONDecodeError, JSONDecoder
+from json import dumps as json_dumps
+
+
+JSON_CHUNK_SIZE = 1 << 16
+
+WHITESPACE = frozenset(" \t\n\r")
+WHITESPACE_REGEX = re.compile(r"[ \t\n\r]*")
+NUMBER_DELIMITERS = frozenset(" \t\n\r,]}")
+
+DECODER = JSONDecoder()
+
+
+class JsonReader:
+    # Decodes a JSON document from text or UTF-8 `chunks` one value at a time, only keeping the chunks not fully decoded
+    # yet in memory
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self._buffer = ""
+        self._pos = 0
+        self._eof = False
+
+    def peek(self):
+        while True:
+            if self._pos < len(self._buffer) and self._buffer[self._pos] not in WHITESPACE:
+                return self._buffer[self._pos]
+            self._pos = WHITESPACE_REGEX.match(self._buffer, self._pos).end()
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._fill():
+                return None
+
+    def take(self, expected):
+        token = self.peek()
+        if token != expected:
+            msg = f"Expected {expected!r}, got {token!r}"
+            raise ValueError(msg)
+        self._pos += 1
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = DECODER.raw_decode(self._buffer, self._pos)
+            except JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # A number is only complete once followed by a delimiter, it may go on in the next chunk (e.g. "0." and "6")
+            if (
+                isinstance(value, int | float)
+                and (end == len(self._buffer) or self._buffer[end] not in NUMBER_DELIMITERS)
+                and self._fill()
+            ):
+                continue
+            self._pos = end
+            return value
+
+    def array(self):
+        self.take("[")
+        while self.peek() != "]":
+            yield self.value()
+            if self.peek() == ",":
+                self.take(",")
+        self.take("]")
+
+    def _fill(self):
+        if self._eof:
+            return False
+        chunk = next(self._chunks, None)
+        if chunk is None:
+            self._eof = True
+            chunk = self._decoder.decode(b"", final=True)
+        elif isinstance(chunk, bytes | bytearray | memoryview):
+            chunk = self._decoder.decode(chunk)
+        self._buffer = self._buffer[self._pos :] + chunk
+        self._pos = 0
+        return True
+
+
+def iter_json_array(chunks, key=None, members=None):
+    # Yields the items of a JSON array one by one; with `key`, the array is that member of a top-level object, the other
+    # members of which are put in `members` as they are read (i.e. only the ones before the array by the first item)
+    reader = JsonReader(chunks)
+    if key is None:
+        yield from reader.array()
+        return
+    reader.take("{")
+    while reader.peek() != "}":
+        name = reader.value()
+        reader.take(":")
+        if name == key:
+            yield from reader.array()
+        elif members is not None:
+            members[name] = reader.value()
+        else:
+            reader.value()
+        if reader.peek() == ",":
+            reader.take(",")
+    reader.take("}")
+
+
+def iter_chunks(data, size=JSON_CHUNK_SIZE):
+    view = memoryview(data)
+    for i in range(0, len(view), size):
+        yield view[i : i + size]
+
+
+def write_json_array(out, items):
+    # Appends `items` to the `out` bytearray as a JSON array, encoding them one at a time
+    out += b"["
+    for i, x in enumerate(items):
+        if i:
+            out += b", "
+        out += json_dumps(x).encode("utf-8")
+    out += b"]"
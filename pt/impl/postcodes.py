@@ -0,0 +1,162 @@
+import csv
+import io
+import itertools
+import re
+
+import numpy as np
+
+
+# Accepted column names, in order of preference; the CTT ones split the postcode in two
+POSTCODE_COLUMNS = ("cp", "codigo_postal", "postcode")
+CP4_COLUMNS = ("num_cod_postal", "cp4")
+CP3_COLUMNS = ("ext_cod_postal", "cp3")
+LAT_COLUMNS = ("latitude", "lat")
+LON_COLUMNS = ("longitude", "lon", "lng")
+LOCALITY_COLUMNS = ("desig_postal", "localidade", "locality")
+MUNICIPALITY_COLUMNS = ("concelho", "nome_concelho", "municipio", "municipality")
+
+
+def postcode_key(postcode):
+    # CP4-CP3 codes map to positive keys, CP4-only ones to negative keys
+    if not re.fullmatch(r"\d{4}(-\d{3})?", postcode):
+        return None
+    cp = postcode.split("-", 1)
+    if len(cp) == 1:
+        return -int(cp[0])
+    return int(cp[0]) * 1000 + int(cp[1])
+
+
+def find_column(header, names):
+    return next((header.index(x) for x in names if x in header), None)
+
+
+def most_common(values):
+    # Ties go to the first one in alphabetical order
+    counts = [(k, len(list(g))) for k, g in itertools.groupby(sorted(values))]
+    return sorted(counts, key=lambda x: -x[1])[0][0] if counts else None
+
+
+def read_postcode_rows(path):
+    data = path.read_bytes()
+    try:
+        text = data.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        text = data.decode("latin-1")
+    reader = csv.reader(io.StringIO(text), csv.Sniffer().sniff(text[:4096], delimiters=",;\t"))
+    header = [x.strip().lower() for x in next(reader)]
+    postcode_col = find_column(header, POSTCODE_COLUMNS)
+    cp4_col, cp3_col = find_column(header, CP4_COLUMNS), find_column(header, CP3_COLUMNS)
+    lat_col, lon_col = find_column(header, LAT_COLUMNS), find_column(header, LON_COLUMNS)
+    locality_col = find_column(header, LOCALITY_COLUMNS)
+    municipality_col = find_column(header, MUNICIPALITY_COLUMNS)
+    if (postcode_col is None and None in (cp4_col, cp3_col)) or locality_col is None:
+        msg = f"Missing postcode or locality columns in {path}"
+        raise ValueError(msg)
+    for row in reader:
+        if not row:
+            continue
+        postcode = row[postcode_col] if postcode_col is not None else f"{row[cp4_col]}-{row[cp3_col]}"
+        if postcode_key(postcode := postcode.strip()) is None or "-" not in postcode:
+            continue
+        coords = None
+        if lat_col is not None and lon_col is not None and row[lat_col].strip() and row[lon_col].strip():
+            coords = (float(row[lat_col]), float(row[lon_col]))
+        municipality = row[municipality_col].strip() if municipality_col is not None else ""
+        yield postcode, coords, row[locality_col].strip(), municipality
+
+
+class PostcodeIndex:
+    # Sorted postcode keys with the averaged coordinates and most common locality (and municipality, if the dataset has
+    # them) of each CP4-CP3 and CP4 code, same as what `scrape_postcode` makes of the matching places
+    def __init__(self, keys, coords, localities, municipalities, names):
+        self._keys = keys
+        self._coords = coords
+        self._localities = localities
+        self._municipalities = municipalities
+        self._names = names
+        self._reverse = None
+
+    @classmethod
+    def load(cls, path):
+        index_file = path.with_name(f"{path.name}.index.npz")
+        if not index_file.exists() or index_file.stat().st_mtime < path.stat().st_mtime:
+            index = cls.build(read_postcode_rows(path))
+            index.save(index_file)
+            return index
+        with np.load(index_file, allow_pickle=False) as f:
+            return cls(f["keys"], f["coords"], f["localities"], f["municipalities"], f["names"])
+
+    @classmethod
+    def build(cls, rows):
+        groups = {}
+        for postcode, coords, locality, municipality in rows:
+            for key in (postcode_key(postcode), postcode_key(postcode.split("-", 1)[0])):
+                groups.setdefault(key, []).append((coords, locality, municipality))
+        keys = np.array(sorted(groups), dtype=np.int64)
+        names = sorted({x for g in groups.values() for _, locality, municipality in g for x in (locality, municipality)})
+        name_ids = {x: i for i, x in enumerate(names)}
+        coords = np.full((len(keys), 2), np.nan)
+        localities = np.empty(len(keys), dtype=np.int32)
+        municipalities = np.empty(len(keys), dtype=np.int32)
+        for i, key in enumerate(keys.tolist()):
+            g = groups[key]
+            if points := [x[0] for x in g if x[0] is not None]:
+                coords[i] = [sum(x[0] for x in points) / len(points), sum(x[1] for x in points) / len(points)]
+            localities[i] = name_ids[most_common(x[1] for x in g)]
+            municipalities[i] = name_ids[most_common(x[2] for x in g)]
+        return cls(keys, coords, localities, municipalities, np.array(names, dtype=str))
+
+    def save(self, path):
+        with path.open("wb") as f:
+            np.savez_compressed(
+                f,
+                keys=self._keys,
+                coords=self._coords,
+                localities=self._localities,
+                municipalities=self._municipalities,
+                names=self._names,
+            )
+
+    def find(self, postcode):
+        i = self._position(postcode)
+        if i is None or np.isnan(self._coords[i][0]):
+            return None
+        return (self._coords[i].tolist(), str(self._names[self._localities[i]]))
+
+    def locality(self, postcode):
+        i = self._position(postcode)
+        return str(self._names[self._localities[i]]) if i is not None else None
+
+    def municipality(self, postcode):
+        i = self._position(postcode)
+        return (str(self._names[self._municipalities[i]]) or None) if i is not None else None
+
+    def localities(self, cp4):
+        return self._reverse_index()[0].get(cp4, [])
+
+    def postcodes(self, locality):
+        return self._reverse_index()[1].get(locality, [])
+
+    def _position(self, postcode):
+        key = postcode_key(postcode)
+        if key is None:
+            return None
+        i = np.searchsorted(self._keys, key)
+        if i == len(self._keys) or self._keys[i] != key:
+            return None
+        return i
+
+    def _reverse_index(self):
+        # CP4 code to its localities, and locality to its CP4-CP3 codes, built on first use
+        if self._reverse is None:
+            cp4_localities = {}
+            locality_postcodes = {}
+            for key, locality in zip(self._keys.tolist(), self._localities.tolist(), strict=True):
+                if key < 0:
+                    continue
+                postcode = f"{key // 1000:04d}-{key % 1000:03d}"
+                locality = str(self._names[locality])
+                cp4_localities.setdefault(postcode[:4], set()).add(locality)
+                locality_postcodes.setdefault(locality, []).append(postcode)
+            self._reverse = ({k: sorted(v) for k, v in cp4_localities.items()}, locality_postcodes)
+        return self._reverse
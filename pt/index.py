@@ -1,10 +1,25 @@
 #!/usr/bin/env python3
 
+import ast
+import datetime
+import json
+import math
+import os
 import sys
+import time
+from argparse import ArgumentParser
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from pathlib import Path
+from statistics import mean
 from subprocess import TimeoutExpired, run
+from tempfile import TemporaryDirectory
 from traceback import format_exception
 
+from requests import RequestException
+
+from impl.common import overpass_prefetch
+from impl.config import OSM_EXTRACT
+
 
 SCRIPTS = (
     "5asec.py",
@@ -56,16 +71,154 @@ SCRIPTS = (
 )
 
 
+HISTORY_SIZE = 10
+
+# Scripts sharing a resource are never run concurrently, e.g. the Playwright browser (a single CDP endpoint when configured)
+SCRIPT_RESOURCES = {
+    "celeiro.py": {"playwright"},
+    "chip7.py": {"playwright"},
+    "continente.py": {"playwright"},
+    "worten.py": {"playwright"},
+}
+
+
+def load_runs(runs_file):
+    try:
+        return json.loads(runs_file.read_text())
+    except (OSError, ValueError):
+        return {}
+
+
+def script_overpass_queries(path):
+    # Calls to `overpass_query` or `overpass_elements` with literal arguments, as (query, center) pairs
+    result = []
+    for node in ast.walk(ast.parse(path.read_text())):
+        if not (
+            isinstance(node, ast.Call)
+            and isinstance(node.func, ast.Name)
+            and node.func.id in ("overpass_query", "overpass_elements")
+            and len(node.args) == 1
+            and isinstance(node.args[0], ast.Constant)
+        ):
+            continue
+        kwargs = {k.arg: k.value for k in node.keywords}
+        center = kwargs.get("center", ast.Constant(value=True))
+        if "country" in kwargs or not isinstance(center, ast.Constant):
+            continue
+        result.append((node.args[0].value, center.value))
+    return result
+
+
+def prefetch_overpass_data(base_dir, scripts, prefetch_dir):
+    queries = list(dict.fromkeys(q for script in scripts for q in script_overpass_queries(base_dir / script)))
+    try:
+        overpass_prefetch(queries, prefetch_dir)
+    except (OSError, RequestException, ValueError) as e:
+        print(f"---\nPrefetching Overpass data failed, scripts will query it themselves: {e}", file=sys.stderr)
+
+
+def read_run_stats(stats_file):
+    result = {"http_requests": 0, "cache_hits": 0, "cpu_time": None, "max_rss": None}
+    try:
+        lines = stats_file.read_text().splitlines()
+    except OSError:
+        return result
+    for line in lines:
+        event, *value = line.split()
+        if event == "http":
+            result["http_requests"] += 1
+        elif event == "cache":
+            result["cache_hits"] += 1
+        elif event == "cpu_time":
+            result["cpu_time"] = float(value[0])
+        elif event == "max_rss":
+            result["max_rss"] = int(value[0])
+    return result
+
+
+def run_script(base_dir, script, stats_dir):
+    stats_file = stats_dir / f"{Path(script).stem}.stats"
+    env = {**os.environ, "DLD_OSM_PT_RUN_STATS": str(stats_file)}
+    start = datetime.datetime.now(datetime.UTC)
+    started = time.monotonic()
+    try:
+        result = run(  # noqa: S603
+            [sys.executable, script], check=False, capture_output=True, cwd=base_dir, env=env, text=True, timeout=600
+        )
+        exit_code = result.returncode
+        output = result.stderr
+    except TimeoutExpired as e:
+        exit_code = "<timeout>"
+        output = "".join(format_exception(e)).rstrip()
+    wall_time = time.monotonic() - started
+    info = {
+        "start": start.isoformat(),
+        "end": (start + datetime.timedelta(seconds=wall_time)).isoformat(),
+        "exit_code": exit_code,
+        "wall_time": wall_time,
+        **read_run_stats(stats_file),
+    }
+    return info, output
+
+
+def run_scripts(base_dir, scripts, history, jobs):
+    # Longest first, scripts without a recorded runtime before all others
+    pending = sorted(scripts, key=lambda s: -mean(history.get(Path(s).stem) or [math.inf]))
+    busy = set()
+    running = {}
+    result = {}
+    with TemporaryDirectory() as stats_dir, ThreadPoolExecutor(max_workers=jobs) as executor:
+        while pending or running:
+            for script in list(pending):
+                if len(running) >= jobs:
+                    break
+                resources = SCRIPT_RESOURCES.get(script, set())
+                if resources & busy:
+                    continue
+                pending.remove(script)
+                busy |= resources
+                running[executor.submit(run_script, base_dir, script, Path(stats_dir))] = script
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                script = running.pop(future)
+                busy -= SCRIPT_RESOURCES.get(script, set())
+                info, output = future.result()
+                result[Path(script).stem] = info
+                if info["exit_code"] != 0:
+                    print(f"---\nScript '{script}' failed with exit code {info['exit_code']}: {output}", file=sys.stderr)
+    return result
+
+
 if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="number of scripts to run concurrently")
+    parser.add_argument("--no-prefetch", action="store_true", help="let every script query Overpass on its own")
+    parser.add_argument("scripts", nargs="*", default=SCRIPTS, help="scripts to run (default: all)")
+    args = parser.parse_args()
+
     base_dir = Path(__file__).parent
+    runs_file = base_dir / "runs.json"
+
+    history = load_runs(runs_file).get("history", {})
+
+    start = datetime.datetime.now(datetime.UTC)
+    started = time.monotonic()
+    with TemporaryDirectory() as prefetch_dir:
+        if not args.no_prefetch and not OSM_EXTRACT:
+            prefetch_overpass_data(base_dir, args.scripts, prefetch_dir)
+            os.environ["DLD_OSM_PT_OVERPASS_PREFETCH"] = prefetch_dir
+        scripts = run_scripts(base_dir, args.scripts, history, max(args.jobs, 1))
+    wall_time = time.monotonic() - started
+
+    for name, info in scripts.items():
+        history[name] = [*history.get(name, []), info["wall_time"]][-HISTORY_SIZE:]
 
-    for script in SCRIPTS:
-        try:
-            result = run([sys.executable, script], check=False, capture_output=True, cwd=base_dir, text=True, timeout=600)  # noqa: S603
-            exit_code = result.returncode
-            output = result.stderr
-        except TimeoutExpired as e:
-            exit_code = "<timeout>"
-            output = "".join(format_exception(e)).rstrip()
-        if exit_code != 0:
-            print(f"---\nScript '{script}' failed with exit code {exit_code}: {output}", file=sys.stderr)
+    runs = {
+        "start": start.isoformat(),
+        "end": (start + datetime.timedelta(seconds=wall_time)).isoformat(),
+        "jobs": max(args.jobs, 1),
+        "wall_time": wall_time,
+        "scripts": scripts,
+        "history": history,
+    }
+    runs_file.write_text(json.dumps(runs))
@@ -4,7 +4,16 @@ import itertools
 import re
 from urllib.parse import urljoin
 
-from impl.common import DiffDict, distance, fetch_json_data, opening_weekdays, overpass_query, write_diff
+from impl.common import (
+    DiffDict,
+    GeoIndex,
+    RefIndex,
+    fetch_json_data,
+    normalize_addresses,
+    opening_weekdays,
+    overpass_query,
+    write_diff,
+)
 
 
 DATA_URL = "https://jysk.pt/api/stores"
@@ -32,6 +41,8 @@ if __name__ == "__main__":
     new_data = fetch_data()
 
     old_data = [DiffDict(e) for e in overpass_query('nwr[shop][name~"jysk",i](area.country);')]
+    old_refs = RefIndex(old_data, REF)
+    old_geo = GeoIndex(old_data)
 
     old_node_ids = {d.data["id"] for d in old_data}
 
@@ -40,10 +51,10 @@ if __name__ == "__main__":
         branch = re.sub(r"^(.+?\w)-(\w.+)$", r"\1 - \2", nd["name"])
         tags_to_reset = set()
 
-        d = next((od for od in old_data if od[REF] == public_id), None)
+        d = old_refs.find(public_id)
         if d is None:
             coord = [nd["latitude"], nd["longitude"]]
-            ds = [x for x in old_data if not x[REF] and distance([x.lat, x.lon], coord) < 250]
+            ds = [x for x, _ in old_geo.within(coord, 250) if not x[REF]]
             if len(ds) == 1:
                 d = ds[0]
         if d is None:
@@ -53,6 +64,8 @@ if __name__ == "__main__":
             d.data["lat"] = nd["latitude"]
             d.data["lon"] = nd["longitude"]
             old_data.append(d)
+            old_refs.add(d)
+            old_geo.add(d)
         else:
             old_node_ids.remove(d.data["id"])
 
@@ -101,7 +114,7 @@ if __name__ == "__main__":
         d["source:contact"] = "website"
 
         d["addr:postcode"] = nd["zipCode"]
-        d["addr:city"] = CITIES.get(d["addr:postcode"], nd["city"].strip(" ,"))
+        d["addr:city"] = nd["city"].strip(" ,")
         if not d["addr:street"] and not d["addr:place"] and not d["addr:suburb"] and not d["addr:housename"]:
             d["x-dld-addr"] = "; ".join([nd["street"], nd["streetSupplement"] or ""]).strip("; ")
 
@@ -113,6 +126,8 @@ if __name__ == "__main__":
         if d.data["id"] in old_node_ids:
             d.kind = "del"
 
+    normalize_addresses([d for d in old_data if d.kind != "del"], CITIES)
+
     old_data.sort(key=lambda d: d[REF])
 
     write_diff("Jysk", REF, old_data)
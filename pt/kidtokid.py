@@ -5,7 +5,7 @@ import itertools
 
 from lxml import etree
 
-from impl.common import DiffDict, distance, fetch_json_data, opening_weekdays, overpass_query, titleize, write_diff
+from impl.common import DiffDict, GeoIndex, RefIndex, fetch_json_data, opening_weekdays, overpass_query, titleize, write_diff
 
 
 DATA_URL = "https://www.kidtokid.pt/wp-admin/admin-ajax.php"
@@ -41,6 +41,8 @@ if __name__ == "__main__":
     new_data = fetch_data()
 
     old_data = [DiffDict(e) for e in overpass_query('nwr[shop][name~"kid( to |2)kid",i](area.country);')]
+    old_refs = RefIndex(old_data, REF)
+    old_geo = GeoIndex(old_data)
 
     old_node_ids = {d.data["id"] for d in old_data}
 
@@ -49,10 +51,10 @@ if __name__ == "__main__":
         branch = html.unescape(nd["store"]).replace("–", "-")
         tags_to_reset = set()
 
-        d = next((od for od in old_data if od[REF] == public_id), None)
+        d = old_refs.find(public_id)
         if d is None:
             coord = [float(nd["lat"]), float(nd["lng"])]
-            ds = [x for x in old_data if not x[REF] and distance([x.lat, x.lon], coord) < 250]
+            ds = [x for x, _ in old_geo.within(coord, 250) if not x[REF]]
             if len(ds) == 1:
                 d = ds[0]
         if d is None:
@@ -62,6 +64,8 @@ if __name__ == "__main__":
             d.data["lat"] = float(nd["lat"])
             d.data["lon"] = float(nd["lng"])
             old_data.append(d)
+            old_refs.add(d)
+            old_geo.add(d)
         else:
             old_node_ids.remove(d.data["id"])
 
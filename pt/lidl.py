@@ -6,7 +6,19 @@ from datetime import date, datetime
 
 from unidecode import unidecode
 
-from impl.common import BASE_NAME, DiffDict, distance, fetch_json_data, opening_weekdays, overpass_query, titleize, write_diff
+from impl.common import (
+    BASE_NAME,
+    DiffDict,
+    GeoIndex,
+    RefIndex,
+    RegexReplacements,
+    fetch_json_data,
+    match_nearby,
+    opening_weekdays,
+    overpass_query,
+    titleize,
+    write_diff,
+)
 from impl.config import CONFIG
 
 
@@ -96,29 +108,31 @@ CITIES = {
     "8135-016": "Almancil",
     "8400-330": "Parchal",
 }
-BRANCH_ABBREVS = [
-    [r"–", "-"],
-    [r"\s*/\s*", " / "],
-    [r"\bav\.? ", "avenida "],
-    [r"\bd\.\s*", "dom "],
-    [r"\bdr\.\s*", "doutor "],
-    [r"\beng\.º? ", "engenheiro "],
-    [r"\bestr\. ", "estrada "],
-    [r"\bmt\.\s*", "monte "],
-    [r"\bqta\. ", "quinta "],
-    [r"\bqt\.ª ", "quinta "],
-    [r"\br\. ", "rua "],
-    [r"\bs\. ", "são "],
-    [r"\bsao ", "são "],
-    [r"\bsta\.? ", "santa "],
-    [r"\bsto\.? ", "santo "],
-    [r"\bv\.f\.xira\b", "vila franca de xira"],
-    [r"\bv\.n\.\s*gaia\b", "vila nova de gaia"],
-    [r"\bagueda\b", "águeda"],
-    [r"\bcor\.\s*", "coronel "],
-    [r"\bg\.delgado\b", "general delgado"],
-    [r"\bj\.\s*", "josé "],
-]
+BRANCH_ABBREVS = RegexReplacements(
+    [
+        [r"–", "-"],
+        [r"\s*/\s*", " / "],
+        [r"\bav\.? ", "avenida "],
+        [r"\bd\.\s*", "dom "],
+        [r"\bdr\.\s*", "doutor "],
+        [r"\beng\.º? ", "engenheiro "],
+        [r"\bestr\. ", "estrada "],
+        [r"\bmt\.\s*", "monte "],
+        [r"\bqta\. ", "quinta "],
+        [r"\bqt\.ª ", "quinta "],
+        [r"\br\. ", "rua "],
+        [r"\bs\. ", "são "],
+        [r"\bsao ", "são "],
+        [r"\bsta\.? ", "santa "],
+        [r"\bsto\.? ", "santo "],
+        [r"\bv\.f\.xira\b", "vila franca de xira"],
+        [r"\bv\.n\.\s*gaia\b", "vila nova de gaia"],
+        [r"\bagueda\b", "águeda"],
+        [r"\bcor\.\s*", "coronel "],
+        [r"\bg\.delgado\b", "general delgado"],
+        [r"\bj\.\s*", "josé "],
+    ]
+)
 CITY_FIXES = {
     "charneca da caparica": "charneca de caparica",
     "ponte de sôr": "ponte de sor",
@@ -169,8 +183,7 @@ def fetch_data():
 
 
 def fix_branch(branch):
-    for r in BRANCH_ABBREVS:
-        branch = re.sub(r[0], r[1], branch.lower())
+    branch = BRANCH_ABBREVS.sub(branch.lower())
     branch = re.sub(
         (
             r"^(aveiro|barcelos|batalha|famalicão|faro|gondomar|guimarães|leiria|loulé|moita|montijo|porto(?! alto)|sintra"
@@ -205,27 +218,37 @@ if __name__ == "__main__":
     new_data = fetch_data()
 
     old_data = [DiffDict(e) for e in overpass_query('nwr[shop][~"^(name|brand)$"~"lidl",i](area.country);')]
+    old_refs = RefIndex(old_data, REF)
+    old_geo = GeoIndex(old_data)
 
     new_node_id = -10000
     old_node_ids = {d.data["id"] for d in old_data}
 
-    for nd in new_data:
+    nearby = match_nearby(
+        old_geo,
+        [
+            None if old_refs.find(nd["objectNumber"]) else [float(nd["address"]["latitude"]), float(nd["address"]["longitude"])]
+            for nd in new_data
+        ],
+        100,
+        lambda x: not x[REF],
+    )
+
+    for nd, nearby_d in zip(new_data, nearby, strict=True):
         public_id = nd["objectNumber"]
         addr = nd["address"]
         tags_to_reset = set()
 
-        d = next((od for od in old_data if od[REF] == public_id), None)
+        d = old_refs.find(public_id) or nearby_d
         coord = [float(addr["latitude"]), float(addr["longitude"])]
-        if d is None:
-            ds = [x for x in old_data if not x[REF] and distance([x.lat, x.lon], coord) < 100]
-            if len(ds) == 1:
-                d = ds[0]
         if d is None:
             d = DiffDict()
             d.data["type"] = "node"
             d.data["id"] = str(new_node_id)
             d.data["lat"], d.data["lon"] = coord
             old_data.append(d)
+            old_refs.add(d)
+            old_geo.add(d)
             new_node_id -= 1
         else:
             old_node_ids.remove(d.data["id"])
@@ -4,22 +4,37 @@ import re
 
 from lxml import etree
 
-from impl.common import DiffDict, distance, fetch_json_data, format_phonenumber, overpass_query, titleize, write_diff
+from impl.common import (
+    DiffDict,
+    GeoIndex,
+    RefIndex,
+    RegexMapping,
+    fetch_json_data,
+    format_phonenumber,
+    normalize_addresses,
+    overpass_query,
+    titleize,
+    write_diff,
+)
 
 
 DATA_URL = "https://www.maxmat.pt/pt/contactos-de-lojas_421.html"
 
 REF = "ref"
 
-SCHEDULE_DAYS_MAPPING = {
-    r"(De )?Segunda a Sábados? e Feriados": "Mo-Sa,PH",
-    r"Domingos": "Su",
-    r"Todos os dias": "Mo-Su",
-}
-SCHEDULE_HOURS_MAPPING = {
-    r"(\d{1})h(\d{2}) às (\d{2})h(\d{2})": r"0\1:\2-\3:\4",
-    r"(\d{2})h(\d{2}) às (\d{2})h(\d{2})": r"\1:\2-\3:\4",
-}
+SCHEDULE_DAYS_MAPPING = RegexMapping(
+    {
+        r"(De )?Segunda a Sábados? e Feriados": "Mo-Sa,PH",
+        r"Domingos": "Su",
+        r"Todos os dias": "Mo-Su",
+    }
+)
+SCHEDULE_HOURS_MAPPING = RegexMapping(
+    {
+        r"(\d{1})h(\d{2}) às (\d{2})h(\d{2})": r"0\1:\2-\3:\4",
+        r"(\d{2})h(\d{2}) às (\d{2})h(\d{2})": r"\1:\2-\3:\4",
+    }
+)
 BRANCHES = {
     "Marco Canaveses": "Marco de Canaveses",
     "S. J. Madeira": "São João da Madeira",
@@ -55,19 +70,15 @@ def fetch_data():
 
 
 def schedule_time(v, mapping):
-    sa = v
-    sb = f"<ERR:{v}>"
-    for sma, smb in mapping.items():
-        if re.fullmatch(sma, sa) is not None:
-            sb = re.sub(sma, smb, sa)
-            break
-    return sb
+    return mapping.sub(v, f"<ERR:{v}>")
 
 
 if __name__ == "__main__":
     new_data = fetch_data()
 
     old_data = [DiffDict(e) for e in overpass_query('nwr[shop][name~"max[ ]?mat",i](area.country);')]
+    old_refs = RefIndex(old_data, REF)
+    old_geo = GeoIndex(old_data)
 
     old_node_ids = {d.data["id"] for d in old_data}
 
@@ -75,10 +86,10 @@ if __name__ == "__main__":
         public_id = nd["id"]
         tags_to_reset = set()
 
-        d = next((od for od in old_data if od[REF] == public_id), None)
+        d = old_refs.find(public_id)
         coord = list(map(float, re.split(r"\s*[,;]\s*", nd["coordinates"].strip())))[:2]
         if d is None:
-            ds = [x for x in old_data if not x[REF] and distance([x.lat, x.lon], coord) < 250]
+            ds = [x for x, _ in old_geo.within(coord, 250) if not x[REF]]
             if len(ds) == 1:
                 d = ds[0]
         if d is None:
@@ -87,6 +98,8 @@ if __name__ == "__main__":
             d.data["id"] = f"-{public_id}"
             d.data["lat"], d.data["lon"] = coord
             old_data.append(d)
+            old_refs.add(d)
+            old_geo.add(d)
         else:
             old_node_ids.remove(d.data["id"])
 
@@ -119,7 +132,7 @@ if __name__ == "__main__":
         d["source:contact"] = "website"
 
         d["addr:postcode"] = nd["zip"]
-        d["addr:city"] = CITIES.get(d["addr:postcode"], titleize(nd["city"]))
+        d["addr:city"] = titleize(nd["city"])
         if not d["addr:street"] and not (d["addr:housenumber"] or d["nohousenumber"]):
             d["x-dld-addr"] = "; ".join(
                 [x.strip() for x in etree.fromstring(nd["street"], etree.HTMLParser()).xpath("//text()")]
@@ -133,6 +146,8 @@ if __name__ == "__main__":
         if d.data["id"] in old_node_ids:
             d.kind = "del"
 
+    normalize_addresses([d for d in old_data if d.kind != "del"], CITIES)
+
     old_data.sort(key=lambda d: d[REF])
 
     write_diff("Maxmat", REF, old_data)
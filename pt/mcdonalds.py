@@ -5,14 +5,16 @@ import itertools
 import json
 import re
 import uuid
-from multiprocessing import Pool
 from urllib.parse import urljoin, urlsplit
 
 from impl.common import (
     DiffDict,
-    distance,
+    GeoIndex,
+    RefIndex,
+    RegexMapping,
     fetch_html_data,
     fetch_json_data,
+    fetch_many,
     lookup_postcode,
     opening_weekdays,
     overpass_query,
@@ -33,12 +35,14 @@ BRANCHES = {
     "Vila Real Nosso Shopping": "Vila Real - Nosso Shopping",
 }
 DAYS = ["Segunda", "Terça", "Quarta", "Quinta", "Sexta", "Sábado", "Domingo"]
-SCHEDULE_HOURS_MAPPING = {
-    r"(\d{2})h(\d{2}) às (\d{2})h(\d{2})": r"\1:\2-\3:\4",
-    r"(\d{1})h(\d{2}) às (\d{2})h(\d{2})": r"0\1:\2-\3:\4",
-    r"(\d{2})h(\d{2}) às (\d{1})h(\d{2})": r"\1:\2-0\3:\4",
-    r"(\d{1})h(\d{2}) às (\d{1})h(\d{2})": r"0\1:\2-0\3:\4",
-}
+SCHEDULE_HOURS_MAPPING = RegexMapping(
+    {
+        r"(\d{2})h(\d{2}) às (\d{2})h(\d{2})": r"\1:\2-\3:\4",
+        r"(\d{1})h(\d{2}) às (\d{2})h(\d{2})": r"0\1:\2-\3:\4",
+        r"(\d{2})h(\d{2}) às (\d{1})h(\d{2})": r"\1:\2-0\3:\4",
+        r"(\d{1})h(\d{2}) às (\d{1})h(\d{2})": r"0\1:\2-0\3:\4",
+    }
+)
 CITIES = {
     "2580-491": "Carregado",
     "2660-017": "Santo António dos Cavaleiros",
@@ -95,13 +99,7 @@ def fetch_level2_data(data):
 
 
 def schedule_time(v):
-    sa = v
-    sb = f"<ERR:{v}>"
-    for sma, smb in SCHEDULE_HOURS_MAPPING.items():
-        if re.fullmatch(sma, sa) is not None:
-            sb = re.sub(sma, smb, sa)
-            break
-    return sb
+    return SCHEDULE_HOURS_MAPPING.sub(v, f"<ERR:{v}>")
 
 
 def opening_hours(data, title):
@@ -140,8 +138,7 @@ def opening_hours(data, title):
 
 if __name__ == "__main__":
     new_data = fetch_level1_data()
-    with Pool(4) as p:
-        new_data = list(p.imap_unordered(fetch_level2_data, new_data))
+    new_data = fetch_many(fetch_level2_data, new_data)
 
     old_data = [
         DiffDict(e)
@@ -150,16 +147,18 @@ if __name__ == "__main__":
             ' [name~"mc ?donald",i](area.country);'
         )
     ]
+    old_refs = RefIndex(old_data, REF)
+    old_geo = GeoIndex(old_data)
 
     new_node_id = -10000
     old_node_ids = {d.data["id"] for d in old_data}
 
     for nd in new_data:
         public_id = nd["id"]
-        d = next((od for od in old_data if od[REF] == public_id), None)
+        d = old_refs.find(public_id)
         if d is None:
             coord = [nd["Lat"], nd["Lng"]]
-            ds = [x for x in old_data if not x[REF] and distance([x.lat, x.lon], coord) < 250]
+            ds = [x for x, _ in old_geo.within(coord, 250) if not x[REF]]
             if len(ds) == 1:
                 d = ds[0]
         if d is None:
@@ -169,6 +168,8 @@ if __name__ == "__main__":
             d.data["lat"] = nd["Lat"]
             d.data["lon"] = nd["Lng"]
             old_data.append(d)
+            old_refs.add(d)
+            old_geo.add(d)
             new_node_id -= 1
         else:
             old_node_ids.remove(d.data["id"])
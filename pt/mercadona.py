@@ -9,7 +9,9 @@ from impl.common import (
     BASE_NAME,
     LISBON_TZ,
     DiffDict,
-    distance,
+    GeoIndex,
+    RefIndex,
+    RegexReplacements,
     fetch_json_data,
     overpass_query,
     titleize,
@@ -21,17 +23,19 @@ DATA_URL = "https://storage.googleapis.com/pro-bucket-wcorp-files/json/data.js"
 
 REF = "ref"
 
-STREET_ABBREVS = [
-    [r"\bal\.? ", "alameda "],
-    [r"\bav\.? ", "avenida "],
-    [r"\bdr\. ", "doutor "],
-    [r"\bdra\. ", "doutora "],
-    [r"\beng\. ", "engenheiro "],
-    [r"\bestr\.? ", "estrada "],
-    [r"\bestrada n\. ", "estrada nacional "],
-    [r"\br\.? ", "rua "],
-    [r"\btv\.? ", "travessa "],
-]
+STREET_ABBREVS = RegexReplacements(
+    [
+        [r"\bal\.? ", "alameda "],
+        [r"\bav\.? ", "avenida "],
+        [r"\bdr\. ", "doutor "],
+        [r"\bdra\. ", "doutora "],
+        [r"\beng\. ", "engenheiro "],
+        [r"\bestr\.? ", "estrada "],
+        [r"\bestrada n\. ", "estrada nacional "],
+        [r"\br\.? ", "rua "],
+        [r"\btv\.? ", "travessa "],
+    ]
+)
 STREET_FIXUPS = {
     "barreiro | rua dos resistentes anti-fascistas": "rua resistentes anti-fascistas",
     "braga | avenida doutor antónio palha": "avenida doutor antónio alves palha",
@@ -67,6 +71,8 @@ if __name__ == "__main__":
     new_data = fetch_data()
 
     old_data = [DiffDict(e) for e in overpass_query("nwr[shop][name=Mercadona](area.country);")]
+    old_refs = RefIndex(old_data, REF)
+    old_geo = GeoIndex(old_data)
 
     old_node_ids = {d.data["id"] for d in old_data}
 
@@ -77,10 +83,10 @@ if __name__ == "__main__":
 
     for nd in new_data:
         public_id = str(nd["id"])
-        d = next((od for od in old_data if od[REF] == public_id), None)
+        d = old_refs.find(public_id)
         coord = [nd["lt"], nd["lg"]]
         if d is None:
-            ds = [x for x in old_data if (not x[REF] or len(x[REF]) == 4) and distance([x.lat, x.lon], coord) < 250]
+            ds = [x for x, _ in old_geo.within(coord, 250) if not x[REF] or len(x[REF]) == 4]
             if len(ds) == 1:
                 d = ds[0]
         if d is None:
@@ -90,6 +96,8 @@ if __name__ == "__main__":
             d.data["lat"] = nd["lt"]
             d.data["lon"] = nd["lg"]
             old_data.append(d)
+            old_refs.add(d)
+            old_geo.add(d)
         else:
             old_node_ids.remove(d.data["id"])
 
@@ -137,8 +145,7 @@ if __name__ == "__main__":
         m = re.match(r"^(.+?), (\d+|S/N.*?)\.?$", nd["dr"])
         if m is not None:
             street = m[1].lower()
-            for r in STREET_ABBREVS:
-                street = re.sub(r[0], r[1], street)
+            street = STREET_ABBREVS.sub(street)
             street = STREET_FIXUPS.get(f"{locality.lower()} | {street}", street)
             d["addr:street"] = titleize(street)
 
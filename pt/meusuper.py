@@ -4,107 +4,127 @@ import html
 import re
 import unicodedata
 
-from impl.common import DiffDict, distance, fetch_json_data, overpass_query, titleize, write_diff
+from impl.common import (
+    DiffDict,
+    GeoIndex,
+    RefIndex,
+    RegexMapping,
+    fetch_json_data,
+    normalize_addresses,
+    overpass_query,
+    titleize,
+    write_diff,
+)
 
 
 DATA_URL = "https://www.meusuper.pt/lojas/"
 
 REF = "ref"
 
-SCHEDULE_DAYS_MAPPING = {
-    r"(de )?segunda a sexta( feira)?": "Mo-Fr",
-    r"segunda a sexta e feriados": "Mo-Fr,PH",
-    r"(de )?(2[ºª]( feira)?|seg(unda)?) a s[áa]b(ados?)?": "Mo-Sa",
-    r"(de )?segunda( feira)? a sábados? (e feriados|\(in(cl|lc)u[ií]n?do feriados\))": "Mo-Sa,PH",
-    r"(de )?(2[ºa]|segunda)( feira)?( a |\s*-\s*)domingo|todos os dias": "Mo-Su",
-    r"(de )?segunda a domingos? (e feriados|\(inclu[ií]ndo feriados\))": "Mo-Su,PH",
-    r"sábados?": "Sa",
-    r"sábados e feriados": "Sa,PH",
-    r"sábados? e domingos?": "Sa,Su",
-    r"sábados, domingos e feriados": "Sa,Su,PH",
-    r"domingos?( é)?": "Su",
-    r"domingos? e feriados?": "Su,PH",
-    r"feriados": "PH",
-}
-SCHEDULE_DAYS_OFF_MAPPING = {
-    r"domingos? (encerrados?|fechados)": "Su",
-    r"domingos e feriados encerrado": "Su,PH",
-    r"em agosto não abre ao domingo": "Aug Su",
-    r"encerra(do)?( aos?)? domingos?": "Su",
-    r"encerra aos domingos e feriados": "Su,PH",
-    r"encerra aos feriados": "PH",
-    r"encerra(do)? domingos? e feriados": "Su,PH",
-}
-SCHEDULE_HOURS_MAPPING = {
-    r"(?:das )?(\d{1})h [àáa]s (\d{2})h?(?: e)?": r"0\1:00-\2:00",
-    r"(?:das )?(\d{1})h [àáa]s (\d{2})h e das (\d{2})h [àáa]s (\d{2})h": r"0\1:00-\2:00,\3:00-\4:00",
-    r"(?:das )?(\d{1})h [àáa]s (\d{2})h e das (\d{2})h [àáa]s (\d{2})[:.h](\d{2})": r"0\1:00-\2:00,\3:00-\4:\5",
-    r"(?:das )?(\d{1})h [àáa]s (\d{2})h e das (\d{2})[:.h](\d{2}) [àáa]s (\d{2})h": r"0\1:00-\2:00,\3:\4-\5:00",
-    r"(?:das )?(\d{1})h [àáa]s (\d{2})[:.h](\d{2})": r"0\1:00-\2:\3",
-    r"(?:das )?(\d{1})h [àáa]s (\d{2})[:.h](\d{2}) e das (\d{2})h [àáa]s (\d{2})h": r"0\1:00-\2:\3,\4:00-\5:00",
-    r"(?:das )?(\d{1})h [àáa]s (\d{2})[:.h](\d{2}) e(?: das)? (\d{2})[:.h](\d{2}) [àáa]s (\d{2})h?": (
-        r"0\1:00-\2:\3,\4:\5-\6:00"
-    ),
-    r"(?:das )?(\d{1})h ao (\d{2})[:.h](\d{2})": r"0\1:00-\2:\3",
-    r"(?:das )?(\d{1})[:.h](\d{2}) - (\d{2})[:.h](\d{2})": r"0\1:\2-\3:\4",
-    r"(?:das )?(\d{1})[:.h](\d{2}) - (\d{2})[:.h](\d{2}) e das (\d{2})[:.h](\d{2}) - (\d{2})[:.h](\d{2})": (
-        r"0\1:\2-\3:\4,\5:\6-\7:\8"
-    ),
-    r"(?:das )?(\d{1})[:.h](\d{2}) [àáa]s (\d{2})h": r"0\1:\2-\3:00",
-    r"(?:das )?(\d{1})[:.h](\d{2}) [àáa]s (\d{2})h e das (\d{2})h [àáa]s (\d{2})h": r"0\1:\2-\3:00,\4:00-\5:00",
-    r"(?:das )?(\d{1})[:.h](\d{2}) [àáa]s (\d{2})h e das (\d{2})h [àáa]s (\d{2})[:.h](\d{2})": r"0\1:\2-\3:00,\4:00-\5:\6",
-    r"(?:das )?(\d{1})[:.h](\d{2}) [àáa]s (\d{2})[:.h](\d{2})": r"0\1:\2-\3:\4",
-    r"(?:das )?(\d{1})[:.h](\d{2}) [àáa]s (\d{2})[:.h](\d{2}) e das (\d{2}) [àáa]s (\d{2})[:.h](\d{2})h": (
-        r"0\1:\2-\3:\4,\5:00-\6:\7"
-    ),
-    r"(?:das )?(\d{1})[:.h](\d{2}) [àáa]s (\d{2})[:.h](\d{2}) e das (\d{2})[:.h](\d{2}) [àáa]s (\d{2})[:.h](\d{2})": (
-        r"0\1:\2-\3:\4,\5:\6-\7:\8"
-    ),
-    r"(?:das )?(\d{1})[:.h](\d{2}) [àáa]s (\d{2})[:.h](\d{2})h": r"0\1:\2-\3:\4",
-    r"(?:das )?(\d{1})h-(\d{2})h": r"0\1:00-\2:00",
-    r"(?:das )?(\d{1})[:.h](\d{2})h [àáa]s (\d{2})h, e das (\d{2})h [àáa]s (\d{2})[:.h](\d{2})h": r"0\1:\2-\3:00,\4:00-\5:\6",
-    r"(?:das )?(\d{1})[:.h](\d{2})h [àáa]s (\d{2})[:.h](\d{2})h": r"0\1:\2-\3:\4",
-    r"(?:das )?(\d{1})h-(\d{2})[:.h](\d{2}) e (\d{2})h-(\d{2})h": r"0\1:00-\2:\3,\4:00-\5:00",
-    ##
-    r"(?:das )?(\d{2})h? [àáa]s (\d{2})h": r"\1:00-\2:00",
-    r"(?:das )?(\d{2})h [àáa]s (\d{2})h e (\d{2})h [àáa]s (\d{2})h": r"\1:00-\2:00,\3:00-\4:00",
-    r"(?:das )?(\d{2})h [àáa]s (\d{2})h e das (\d{2})h [àáa]s (\d{2})h?": r"\1:00-\2:00,\3:00-\4:00",
-    r"(?:das )?(\d{2})h [àáa]s (\d{2})h e das (\d{2})h [àáa]s (\d{2})[:.h](\d{2})": r"\1:00-\2:00,\3:00-\4:\5",
-    r"(?:das )?(\d{2})h [àáa]s (\d{2})h e das (\d{2})[:.h](\d{2}) [àáa]s (\d{2})h": r"\1:00-\2:00,\3:\4-\5:00",
-    r"(?:das )?(\d{2})h [àáa]s (\d{2})[:.h](\d{2})h?": r"\1:00-\2:\3",
-    r"(?:das )?(\d{2})h [àáa]s (\d{2})[:.h](\d{2}) e das (\d{2})h [àáa]s (\d{2})h": r"\1:00-\2:\3,\4:00-\5:00",
-    r"(?:das )?(\d{2})h [àáa]s (\d{2})[:.h](\d{2}) e das (\d{2})[:.h](\d{2}) [àáa]s (\d{2})h": r"\1:00-\2:\3,\4:\5-\6:00",
-    r"(?:das )?(\d{2})h e das (\d{2})h e das (\d{2})h [àáa]s (\d{2})h": r"\1:00-\2:00,\3:00-\4:00",
-    r"(?:das )?(\d{2})h e das (\d{2})h e das (\d{2})h e das (\d{2})[:.h](\d{2})": r"\1:00-\2:00,\3:00-\4:\5",
-    r"(?:das )?(\d{2})[:.h](\d{2}) - [àáa]s (\d{2})[:.h](\d{2})": r"\1:\2-\3:\4",
-    r"(?:das )?(\d{2})[:.h](\d{2})h? [àáa]s (\d{2})h": r"\1:\2-\3:00",
-    r"(?:das )?(\d{2})[:.h](\d{2}) [àáa]s (\d{2})h(?: e)? das (\d{2})h [àáa]s (\d{2})h": r"\1:\2-\3:00,\4:00-\5:00",
-    r"(?:das )?(\d{2})[:.h](\d{2}) [àáa]s (\d{2})h e das (\d{2})h [àáa]s (\d{2})[:.h](\d{2})": r"\1:\2-\3:00,\4:00-\5:\6",
-    r"(?:das )?(\d{2})[:.h](\d{2}) [àáa]ss? (\d{2})[:.h](\d{2})": r"\1:\2-\3:\4",
-    r"(?:das )?(\d{2})[:.h](\d{2}) [àáa]s (\d{2})[:.h](\d{2}) (\d{2})[:.h](\d{2}) [àáa]s (\d{2})[:.h](\d{2})": (
-        r"\1:\2-\3:\4,\5:\6-\7:\8"
-    ),
-    r"(?:das )?(\d{2})[:.h](\d{2}) [àáa]s (\d{2})[:.h](\d{2}) e das (\d{2})h [àáa]s (\d{2})h": r"\1:\2-\3:\4,\5:00-\6:00",
-    r"(?:das )?(\d{2})[:.h](\d{2}) [àáa]s (\d{2})[:.h](\d{2}) e das (\d{2})h [àáa]s (\d{2})[:.h](\d{2})": (
-        r"\1:\2-\3:\4,\5:00-\6:\7"
-    ),
-    r"(?:das )?(\d{2})[:.h](\d{2}) [àáa]s (\d{2})[:.h](\d{2}) e das (\d{2})[:.h](\d{2}) [àáa]s (\d{2})[:.h](\d{2})": (
-        r"\1:\2-\3:\4,\5:\6-\7:\8"
-    ),
-    r"(?:das )?(\d{2})h-(\d{2})h": r"\1:00-\2:00",
-    r"(?:das )?o(\d{1})h [àáa]s (\d{2})h": r"0\1:00-\2:00",
-}
-SCHEDULE_SEASONS_MAPPING = {
-    r"inverno": "Sep 22-Jun 20",
-    r"inverno \((\d{2})/09 a (\d{2})/06\)": r"Sep \1-Jun \2",
-    r"inverno \(novemnro a maio\)": "Nov-May",
-    r"inverno \(outubro a março\)": "Oct-Mar",
-    r"verão": "Jun 21-Sep 21",
-    r"verão \((\d{2})/06 a (\d{2})/09\)": r"Jun \1-Sep \2",
-    r"verão \(abril a setembro\)": "Apr-Sep",
-    r"verão \(de (\d{2})\.06 a (\d{2})\.09\)": r"Jun \1-Sep \2",
-    r"verão \(junho a outubro\)": "Jun-Oct",
-}
+SCHEDULE_DAYS_MAPPING = RegexMapping(
+    {
+        r"(de )?segunda a sexta( feira)?": "Mo-Fr",
+        r"segunda a sexta e feriados": "Mo-Fr,PH",
+        r"(de )?(2[ºª]( feira)?|seg(unda)?) a s[áa]b(ados?)?": "Mo-Sa",
+        r"(de )?segunda( feira)? a sábados? (e feriados|\(in(cl|lc)u[ií]n?do feriados\))": "Mo-Sa,PH",
+        r"(de )?(2[ºa]|segunda)( feira)?( a |\s*-\s*)domingo|todos os dias": "Mo-Su",
+        r"(de )?segunda a domingos? (e feriados|\(inclu[ií]ndo feriados\))": "Mo-Su,PH",
+        r"sábados?": "Sa",
+        r"sábados e feriados": "Sa,PH",
+        r"sábados? e domingos?": "Sa,Su",
+        r"sábados, domingos e feriados": "Sa,Su,PH",
+        r"domingos?( é)?": "Su",
+        r"domingos? e feriados?": "Su,PH",
+        r"feriados": "PH",
+    }
+)
+SCHEDULE_DAYS_OFF_MAPPING = RegexMapping(
+    {
+        r"domingos? (encerrados?|fechados)": "Su",
+        r"domingos e feriados encerrado": "Su,PH",
+        r"em agosto não abre ao domingo": "Aug Su",
+        r"encerra(do)?( aos?)? domingos?": "Su",
+        r"encerra aos domingos e feriados": "Su,PH",
+        r"encerra aos feriados": "PH",
+        r"encerra(do)? domingos? e feriados": "Su,PH",
+    }
+)
+SCHEDULE_HOURS_MAPPING = RegexMapping(
+    {
+        r"(?:das )?(\d{1})h [àáa]s (\d{2})h?(?: e)?": r"0\1:00-\2:00",
+        r"(?:das )?(\d{1})h [àáa]s (\d{2})h e das (\d{2})h [àáa]s (\d{2})h": r"0\1:00-\2:00,\3:00-\4:00",
+        r"(?:das )?(\d{1})h [àáa]s (\d{2})h e das (\d{2})h [àáa]s (\d{2})[:.h](\d{2})": r"0\1:00-\2:00,\3:00-\4:\5",
+        r"(?:das )?(\d{1})h [àáa]s (\d{2})h e das (\d{2})[:.h](\d{2}) [àáa]s (\d{2})h": r"0\1:00-\2:00,\3:\4-\5:00",
+        r"(?:das )?(\d{1})h [àáa]s (\d{2})[:.h](\d{2})": r"0\1:00-\2:\3",
+        r"(?:das )?(\d{1})h [àáa]s (\d{2})[:.h](\d{2}) e das (\d{2})h [àáa]s (\d{2})h": r"0\1:00-\2:\3,\4:00-\5:00",
+        r"(?:das )?(\d{1})h [àáa]s (\d{2})[:.h](\d{2}) e(?: das)? (\d{2})[:.h](\d{2}) [àáa]s (\d{2})h?": (
+            r"0\1:00-\2:\3,\4:\5-\6:00"
+        ),
+        r"(?:das )?(\d{1})h ao (\d{2})[:.h](\d{2})": r"0\1:00-\2:\3",
+        r"(?:das )?(\d{1})[:.h](\d{2}) - (\d{2})[:.h](\d{2})": r"0\1:\2-\3:\4",
+        r"(?:das )?(\d{1})[:.h](\d{2}) - (\d{2})[:.h](\d{2}) e das (\d{2})[:.h](\d{2}) - (\d{2})[:.h](\d{2})": (
+            r"0\1:\2-\3:\4,\5:\6-\7:\8"
+        ),
+        r"(?:das )?(\d{1})[:.h](\d{2}) [àáa]s (\d{2})h": r"0\1:\2-\3:00",
+        r"(?:das )?(\d{1})[:.h](\d{2}) [àáa]s (\d{2})h e das (\d{2})h [àáa]s (\d{2})h": r"0\1:\2-\3:00,\4:00-\5:00",
+        r"(?:das )?(\d{1})[:.h](\d{2}) [àáa]s (\d{2})h e das (\d{2})h [àáa]s (\d{2})[:.h](\d{2})": r"0\1:\2-\3:00,\4:00-\5:\6",
+        r"(?:das )?(\d{1})[:.h](\d{2}) [àáa]s (\d{2})[:.h](\d{2})": r"0\1:\2-\3:\4",
+        r"(?:das )?(\d{1})[:.h](\d{2}) [àáa]s (\d{2})[:.h](\d{2}) e das (\d{2}) [àáa]s (\d{2})[:.h](\d{2})h": (
+            r"0\1:\2-\3:\4,\5:00-\6:\7"
+        ),
+        r"(?:das )?(\d{1})[:.h](\d{2}) [àáa]s (\d{2})[:.h](\d{2}) e das (\d{2})[:.h](\d{2}) [àáa]s (\d{2})[:.h](\d{2})": (
+            r"0\1:\2-\3:\4,\5:\6-\7:\8"
+        ),
+        r"(?:das )?(\d{1})[:.h](\d{2}) [àáa]s (\d{2})[:.h](\d{2})h": r"0\1:\2-\3:\4",
+        r"(?:das )?(\d{1})h-(\d{2})h": r"0\1:00-\2:00",
+        (
+            r"(?:das )?(\d{1})[:.h](\d{2})h [àáa]s (\d{2})h, e das (\d{2})h [àáa]s (\d{2})[:.h](\d{2})h"
+        ): r"0\1:\2-\3:00,\4:00-\5:\6",
+        r"(?:das )?(\d{1})[:.h](\d{2})h [àáa]s (\d{2})[:.h](\d{2})h": r"0\1:\2-\3:\4",
+        r"(?:das )?(\d{1})h-(\d{2})[:.h](\d{2}) e (\d{2})h-(\d{2})h": r"0\1:00-\2:\3,\4:00-\5:00",
+        ##
+        r"(?:das )?(\d{2})h? [àáa]s (\d{2})h": r"\1:00-\2:00",
+        r"(?:das )?(\d{2})h [àáa]s (\d{2})h e (\d{2})h [àáa]s (\d{2})h": r"\1:00-\2:00,\3:00-\4:00",
+        r"(?:das )?(\d{2})h [àáa]s (\d{2})h e das (\d{2})h [àáa]s (\d{2})h?": r"\1:00-\2:00,\3:00-\4:00",
+        r"(?:das )?(\d{2})h [àáa]s (\d{2})h e das (\d{2})h [àáa]s (\d{2})[:.h](\d{2})": r"\1:00-\2:00,\3:00-\4:\5",
+        r"(?:das )?(\d{2})h [àáa]s (\d{2})h e das (\d{2})[:.h](\d{2}) [àáa]s (\d{2})h": r"\1:00-\2:00,\3:\4-\5:00",
+        r"(?:das )?(\d{2})h [àáa]s (\d{2})[:.h](\d{2})h?": r"\1:00-\2:\3",
+        r"(?:das )?(\d{2})h [àáa]s (\d{2})[:.h](\d{2}) e das (\d{2})h [àáa]s (\d{2})h": r"\1:00-\2:\3,\4:00-\5:00",
+        r"(?:das )?(\d{2})h [àáa]s (\d{2})[:.h](\d{2}) e das (\d{2})[:.h](\d{2}) [àáa]s (\d{2})h": r"\1:00-\2:\3,\4:\5-\6:00",
+        r"(?:das )?(\d{2})h e das (\d{2})h e das (\d{2})h [àáa]s (\d{2})h": r"\1:00-\2:00,\3:00-\4:00",
+        r"(?:das )?(\d{2})h e das (\d{2})h e das (\d{2})h e das (\d{2})[:.h](\d{2})": r"\1:00-\2:00,\3:00-\4:\5",
+        r"(?:das )?(\d{2})[:.h](\d{2}) - [àáa]s (\d{2})[:.h](\d{2})": r"\1:\2-\3:\4",
+        r"(?:das )?(\d{2})[:.h](\d{2})h? [àáa]s (\d{2})h": r"\1:\2-\3:00",
+        r"(?:das )?(\d{2})[:.h](\d{2}) [àáa]s (\d{2})h(?: e)? das (\d{2})h [àáa]s (\d{2})h": r"\1:\2-\3:00,\4:00-\5:00",
+        r"(?:das )?(\d{2})[:.h](\d{2}) [àáa]s (\d{2})h e das (\d{2})h [àáa]s (\d{2})[:.h](\d{2})": r"\1:\2-\3:00,\4:00-\5:\6",
+        r"(?:das )?(\d{2})[:.h](\d{2}) [àáa]ss? (\d{2})[:.h](\d{2})": r"\1:\2-\3:\4",
+        r"(?:das )?(\d{2})[:.h](\d{2}) [àáa]s (\d{2})[:.h](\d{2}) (\d{2})[:.h](\d{2}) [àáa]s (\d{2})[:.h](\d{2})": (
+            r"\1:\2-\3:\4,\5:\6-\7:\8"
+        ),
+        r"(?:das )?(\d{2})[:.h](\d{2}) [àáa]s (\d{2})[:.h](\d{2}) e das (\d{2})h [àáa]s (\d{2})h": r"\1:\2-\3:\4,\5:00-\6:00",
+        r"(?:das )?(\d{2})[:.h](\d{2}) [àáa]s (\d{2})[:.h](\d{2}) e das (\d{2})h [àáa]s (\d{2})[:.h](\d{2})": (
+            r"\1:\2-\3:\4,\5:00-\6:\7"
+        ),
+        r"(?:das )?(\d{2})[:.h](\d{2}) [àáa]s (\d{2})[:.h](\d{2}) e das (\d{2})[:.h](\d{2}) [àáa]s (\d{2})[:.h](\d{2})": (
+            r"\1:\2-\3:\4,\5:\6-\7:\8"
+        ),
+        r"(?:das )?(\d{2})h-(\d{2})h": r"\1:00-\2:00",
+        r"(?:das )?o(\d{1})h [àáa]s (\d{2})h": r"0\1:00-\2:00",
+    }
+)
+SCHEDULE_SEASONS_MAPPING = RegexMapping(
+    {
+        r"inverno": "Sep 22-Jun 20",
+        r"inverno \((\d{2})/09 a (\d{2})/06\)": r"Sep \1-Jun \2",
+        r"inverno \(novemnro a maio\)": "Nov-May",
+        r"inverno \(outubro a março\)": "Oct-Mar",
+        r"verão": "Jun 21-Sep 21",
+        r"verão \((\d{2})/06 a (\d{2})/09\)": r"Jun \1-Sep \2",
+        r"verão \(abril a setembro\)": "Apr-Sep",
+        r"verão \(de (\d{2})\.06 a (\d{2})\.09\)": r"Jun \1-Sep \2",
+        r"verão \(junho a outubro\)": "Jun-Oct",
+    }
+)
 BRANCHES = {
     "Bom Sucesso (Fnc)": "Bom Sucesso (Funchal)",
     "Padre António Vieira (Cbr)": "Padre António Vieira (Coimbra)",
@@ -143,16 +163,16 @@ def fetch_data():
 
 
 def schedule_time(v, mapping):
-    for sma, smb in mapping.items():
-        if re.fullmatch(sma, v) is not None:
-            return True, re.sub(sma, smb, v)
-    return False, f"<ERR:{v}>"
+    sb = mapping.sub(v)
+    return (True, sb) if sb is not None else (False, f"<ERR:{v}>")
 
 
 if __name__ == "__main__":
     new_data = fetch_data()
 
     old_data = [DiffDict(e) for e in overpass_query('nwr[shop][name~"meu[ ]*super",i](area.country);')]
+    old_refs = RefIndex(old_data, REF)
+    old_geo = GeoIndex(old_data)
 
     old_node_ids = {d.data["id"] for d in old_data}
 
@@ -161,7 +181,7 @@ if __name__ == "__main__":
         branch = titleize(re.sub(r"^(Meu Super|MS)\s+", "", html.unescape(nd["name"]).replace("–", "-")))
         tags_to_reset = set()
 
-        d = next((od for od in old_data if od[REF] == public_id), None)
+        d = old_refs.find(public_id)
         coord = [float(nd["latitude"]), float(nd["longitude"])]
         if coord[1] > 0:
             coord[1] = -coord[1]
@@ -172,7 +192,7 @@ if __name__ == "__main__":
             elif re.match(r"-[1-3]", lng):
                 coord[1] = float(f"{lng[:3]}.{lng[3:]}")
         if d is None:
-            ds = [x for x in old_data if not x[REF] and distance([x.lat, x.lon], coord) < 250]
+            ds = [x for x, _ in old_geo.within(coord, 250) if not x[REF]]
             if len(ds) == 1:
                 d = ds[0]
         if d is None:
@@ -181,6 +201,8 @@ if __name__ == "__main__":
             d.data["id"] = f"-{public_id}"
             d.data["lat"], d.data["lon"] = coord
             old_data.append(d)
+            old_refs.add(d)
+            old_geo.add(d)
         else:
             old_node_ids.remove(d.data["id"])
 
@@ -268,7 +290,7 @@ if __name__ == "__main__":
         address = re.sub(r"^[\s;]+|[\s;]+$", "", nd["morada"].replace("<br />", ";"))
         if m := re.fullmatch(r"(.+?)\b[\s,]+(\d{4})\s*[-–]\s*(\d{3})\s*,?\s+(.+)", address, flags=re.DOTALL):
             d["addr:postcode"] = f"{m[2]}-{m[3]}"
-            d["addr:city"] = CITIES.get(d["addr:postcode"], titleize(m[4]))
+            d["addr:city"] = titleize(m[4])
             address = m[1]
         if not d["addr:street"] and not d["addr:place"] and not d["addr:suburb"] and not d["addr:housename"]:
             d["x-dld-addr"] = address
@@ -281,6 +303,8 @@ if __name__ == "__main__":
         if d.data["id"] in old_node_ids:
             d.kind = "del"
 
+    normalize_addresses([d for d in old_data if d.kind != "del"], CITIES)
+
     old_data.sort(key=lambda d: d[REF])
 
     write_diff("Meu Super", REF, old_data)
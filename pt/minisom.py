@@ -3,11 +3,21 @@
 import datetime
 import itertools
 import re
-from multiprocessing import Pool
 
 from unidecode import unidecode
 
-from impl.common import BASE_NAME, LISBON_TZ, DiffDict, distance, fetch_json_data, opening_weekdays, overpass_query, write_diff
+from impl.common import (
+    BASE_NAME,
+    LISBON_TZ,
+    DiffDict,
+    GeoIndex,
+    RefIndex,
+    fetch_json_data,
+    fetch_many,
+    opening_weekdays,
+    overpass_query,
+    write_diff,
+)
 from impl.config import CONFIG
 
 
@@ -64,10 +74,11 @@ def get_url_part(value):
 
 if __name__ == "__main__":
     new_data = fetch_level1_data()
-    with Pool(4) as p:
-        new_data = list(p.imap_unordered(fetch_level2_data, new_data))
+    new_data = fetch_many(fetch_level2_data, new_data)
 
     old_data = [DiffDict(e) for e in overpass_query('nwr[shop][~"^(name|brand)$"~"minisom|amplifon",i](area.country);')]
+    old_refs = RefIndex(old_data, REF)
+    old_geo = GeoIndex(old_data)
 
     old_node_ids = {d.data["id"] for d in old_data}
 
@@ -81,10 +92,10 @@ if __name__ == "__main__":
             location = None
         tags_to_reset = set()
 
-        d = next((od for od in old_data if od[REF] == public_id), None)
+        d = old_refs.find(public_id)
         if d is None:
             coord = [nd["latitude"], nd["longitude"]]
-            ds = [x for x in old_data if not x[REF] and distance([x.lat, x.lon], coord) < 250]
+            ds = [x for x, _ in old_geo.within(coord, 250) if not x[REF]]
             if len(ds) == 1:
                 d = ds[0]
         if d is None:
@@ -94,6 +105,8 @@ if __name__ == "__main__":
             d.data["lat"] = nd["latitude"]
             d.data["lon"] = nd["longitude"]
             old_data.append(d)
+            old_refs.add(d)
+            old_geo.add(d)
         else:
             old_node_ids.remove(d.data["id"])
 
@@ -12,7 +12,8 @@ from impl.common import (
     BASE_NAME,
     LISBON_TZ,
     DiffDict,
-    distance,
+    GeoIndex,
+    RefIndex,
     fetch_json_data,
     gregorian_easter,
     opening_weekdays,
@@ -61,6 +62,8 @@ if __name__ == "__main__":
             'nwr[shop][shop!=alcohol][shop!=florist][shop!=kiosk][~"^(name|brand)$"~"^ping[ou] doce",i](area.country);'
         )
     ]
+    old_refs = RefIndex(old_data, REF)
+    old_geo = GeoIndex(old_data)
 
     old_node_ids = {d.data["id"] for d in old_data}
 
@@ -71,10 +74,10 @@ if __name__ == "__main__":
 
     for nd in new_data:
         public_id = nd["id"]
-        d = next((od for od in old_data if od[REF] == public_id), None)
+        d = old_refs.find(public_id)
         coord = [float(nd["lat"] or 38.306893), float(nd["long"] or -17.050891)]
         if d is None:
-            ds = [x for x in old_data if not x[REF] and distance([x.lat, x.lon], coord) < 250]
+            ds = [x for x, _ in old_geo.within(coord, 250) if not x[REF]]
             if len(ds) == 1:
                 d = ds[0]
         if d is None:
@@ -83,6 +86,8 @@ if __name__ == "__main__":
             d.data["id"] = f"-{public_id}"
             d.data["lat"], d.data["lon"] = coord
             old_data.append(d)
+            old_refs.add(d)
+            old_geo.add(d)
         else:
             old_node_ids.remove(d.data["id"])
 
@@ -5,34 +5,38 @@ import re
 
 from unidecode import unidecode
 
-from impl.common import DiffDict, distance, fetch_html_data, overpass_query, write_diff
+from impl.common import DiffDict, GeoIndex, RefIndex, RegexMapping, fetch_html_data, overpass_query, write_diff
 
 
 DATA_URL = "https://www.radiopopular.pt/lojas/"
 
 REF = "ref"
 
-SCHEDULE_DAYS = {
-    r"domingo": "Su",
-    r"domingo a (5ª|quinta)": "Su-Th",
-    r"domingos? e feriados": "Su,PH",
-    r"segunda a sábado": "Mo-Sa",
-    r"sexta e sabado": "Fr,Sa",
-    r"sexta, sábado e vésperas de feriados": "Fr,Sa,PH -1 days",
-    r"dia (\d{2}) dezembro": r"Dec \1",
-    r"dia 24 e 31 dezembro": "Dec 24,Dec 31",
-    r"dias (\d{2}) a (\d{2}) dezembro": r"Dec \1-\2",
-    r"domingo de páscoa - \d+( de)? abril \d+": "easter",
-    r"todos os dias": "Mo-Su",
-}
-SCHEDULE_HOURS_MAPPING = {
-    r"(\d{1})h\s*-\s*(\d{2})h": r"0\1:00-\2:00",
-    r"(\d{2})h\s*-\s*(\d{2})h": r"\1:00-\2:00",
-    r"(\d{2})h\s*-\s*(\d{2}):(\d{2})h": r"\1:00-\2:\3",
-    r"(\d{2})[:h](\d{2})h?\s*(?:-|às)\s*(\d{2})h": r"\1:\2-\3:00",
-    r"(\d{2})[:h](\d{2})h?\s*(?:-|às)\s*(\d{2})[:h](\d{2})h?": r"\1:\2-\3:\4",
-    r"encerrado": "off",
-}
+SCHEDULE_DAYS = RegexMapping(
+    {
+        r"domingo": "Su",
+        r"domingo a (5ª|quinta)": "Su-Th",
+        r"domingos? e feriados": "Su,PH",
+        r"segunda a sábado": "Mo-Sa",
+        r"sexta e sabado": "Fr,Sa",
+        r"sexta, sábado e vésperas de feriados": "Fr,Sa,PH -1 days",
+        r"dia (\d{2}) dezembro": r"Dec \1",
+        r"dia 24 e 31 dezembro": "Dec 24,Dec 31",
+        r"dias (\d{2}) a (\d{2}) dezembro": r"Dec \1-\2",
+        r"domingo de páscoa - \d+( de)? abril \d+": "easter",
+        r"todos os dias": "Mo-Su",
+    }
+)
+SCHEDULE_HOURS_MAPPING = RegexMapping(
+    {
+        r"(\d{1})h\s*-\s*(\d{2})h": r"0\1:00-\2:00",
+        r"(\d{2})h\s*-\s*(\d{2})h": r"\1:00-\2:00",
+        r"(\d{2})h\s*-\s*(\d{2}):(\d{2})h": r"\1:00-\2:\3",
+        r"(\d{2})[:h](\d{2})h?\s*(?:-|às)\s*(\d{2})h": r"\1:\2-\3:00",
+        r"(\d{2})[:h](\d{2})h?\s*(?:-|às)\s*(\d{2})[:h](\d{2})h?": r"\1:\2-\3:\4",
+        r"encerrado": "off",
+    }
+)
 CITIES = {
     "2400-441": "Leiria",
     "2636-901": "Rio de Mouro",
@@ -56,13 +60,7 @@ def fetch_data():
 
 
 def schedule_time(v, mapping):
-    sa = v
-    sb = f"<ERR:{v}>"
-    for sma, smb in mapping.items():
-        if re.fullmatch(sma, sa) is not None:
-            sb = re.sub(sma, smb, sa)
-            break
-    return sb
+    return mapping.sub(v, f"<ERR:{v}>")
 
 
 def get_url_part(value):
@@ -77,6 +75,8 @@ if __name__ == "__main__":
     new_data = fetch_data()
 
     old_data = [DiffDict(e) for e in overpass_query('nwr[shop][~"^(name|brand)$"~"r[aá]dio.*popular",i](area.country);')]
+    old_refs = RefIndex(old_data, REF)
+    old_geo = GeoIndex(old_data)
 
     old_node_ids = {d.data["id"] for d in old_data}
 
@@ -84,10 +84,10 @@ if __name__ == "__main__":
         public_id = str(nd["id"])
         tags_to_reset = set()
 
-        d = next((od for od in old_data if od[REF] == public_id), None)
+        d = old_refs.find(public_id)
         if d is None:
             coord = [float(nd["latitude"]), float(nd["longitude"])]
-            ds = [x for x in old_data if not x[REF] and distance([x.lat, x.lon], coord) < 250]
+            ds = [x for x, _ in old_geo.within(coord, 250) if not x[REF]]
             if len(ds) == 1:
                 d = ds[0]
         if d is None:
@@ -97,6 +97,8 @@ if __name__ == "__main__":
             d.data["lat"] = float(nd["latitude"])
             d.data["lon"] = float(nd["longitude"])
             old_data.append(d)
+            old_refs.add(d)
+            old_geo.add(d)
         else:
             old_node_ids.remove(d.data["id"])
 
@@ -1,12 +1,11 @@
 #!/usr/bin/env python3
 
 import re
-from multiprocessing import Pool
 
 from lxml import etree
 from unidecode import unidecode
 
-from impl.common import DiffDict, distance, fetch_json_data, overpass_query, titleize, write_diff
+from impl.common import DiffDict, GeoIndex, RefIndex, fetch_json_data, fetch_many, overpass_query, titleize, write_diff
 
 
 DATA_URL = "https://www.recheio.pt/portal/pt-PT/webruntime/api/apex/execute"
@@ -91,10 +90,11 @@ def get_url_part(value):
 
 if __name__ == "__main__":
     new_data = fetch_level1_data()
-    with Pool(4) as p:
-        new_data = list(p.imap_unordered(fetch_level2_data, new_data))
+    new_data = fetch_many(fetch_level2_data, new_data)
 
     old_data = [DiffDict(e) for e in overpass_query('nwr[shop][~"^(name|brand)$"~"recheio",i](area.country);')]
+    old_refs = RefIndex(old_data, REF)
+    old_geo = GeoIndex(old_data)
 
     old_node_ids = {d.data["id"] for d in old_data}
 
@@ -102,14 +102,14 @@ if __name__ == "__main__":
         public_id = nd["RCH_ExternalId__c"]
         tags_to_reset = set()
 
-        d = next((od for od in old_data if od[REF] == public_id), None)
+        d = old_refs.find(public_id)
         coord = (
             [nd["RCH_LatitudeLongitude__c"]["latitude"], nd["RCH_LatitudeLongitude__c"]["longitude"]]
             if "RCH_LatitudeLongitude__c" in nd
             else [38.306893, -17.050891]
         )
         if d is None:
-            ds = [x for x in old_data if not x[REF] and distance([x.lat, x.lon], coord) < 250]
+            ds = [x for x, _ in old_geo.within(coord, 250) if not x[REF]]
             if len(ds) == 1:
                 d = ds[0]
         if d is None:
@@ -118,6 +118,8 @@ if __name__ == "__main__":
             d.data["id"] = f"-{public_id}"
             d.data["lat"], d.data["lon"] = coord
             old_data.append(d)
+            old_refs.add(d)
+            old_geo.add(d)
         else:
             old_node_ids.remove(d.data["id"])
 
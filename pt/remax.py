@@ -3,7 +3,18 @@
 import re
 from urllib.parse import urlparse
 
-from impl.common import DiffDict, distance, fetch_json_data, format_phonenumber, overpass_query, titleize, write_diff
+from impl.common import (
+    DiffDict,
+    GeoIndex,
+    RefIndex,
+    RegexReplacements,
+    fetch_json_data,
+    format_phonenumber,
+    match_nearby,
+    overpass_query,
+    titleize,
+    write_diff,
+)
 
 
 DATA_URL = "https://remax.pt/api/Office/PaginatedSearch"
@@ -13,72 +24,75 @@ REF = "ref"
 BRANCHES = {
     "ConviCtus": "Convictus",
 }
-OPERATOR_FIXES = (
-    # proper names
-    (r"\bbizzyland\b", "BizzyLand"),
-    (r"\bblueland\b", "BlueLand"),
-    (r"\bcirc\b", "CIRC"),
-    (r"\bclassalegre\b", "ClassAlegre"),
-    (r"\bconquistenigma\b", "ConquistEnigma"),
-    (r"\bdd[ ]?vendas\b", "DD Vendas"),
-    (r"\bestorilhouse\b", "EstorilHouse"),
-    (r"\bfcgm\b", "FCGM"),
-    (r"\bgldn\b", "GLDN"),
-    (r"\bgoldenloft\b", "GoldenLoft"),
-    (r"\binteligentepartilha\b", "InteligentePartilha"),
-    (r"\bjc2future\b", "JC2Future"),
-    (r"\blpdp in motion\b", "LPDP In Motion"),
-    (r"\bmaxlinha\b", "MaxLinha"),
-    (r"\bmaxloja\b", "MaxLoja"),
-    (r"\bmaxocidente\b", "MaxOcidente"),
-    (r"\bmaxselect\b", "MaxSelect"),
-    (r"\bmaxvilla\b", "MaxVilla"),
-    (r"\bmedipombal\b", "MediPombal"),
-    (r"\bmundilocation\b", "MundiLocation"),
-    (r"\bnortecerto\b", "NorteCerto"),
-    (r"\boceano d eleição\b", "Oceano d'Eleição"),
-    (r"\bon the move\b", "On the Move"),
-    (r"\bo chefe voltou\b", "O Chefe Voltou"),
-    (r"\bpartilhanotável\b", "PartilhaNotável"),
-    (r"\bpatrimonioforte\b", "PatrimonioForte"),
-    (r"\bd'êxito\b", "d'Êxito"),
-    (r"\bportalrumo\b", "PortalRumo"),
-    (r"\bproudnumbers\b", "ProudNumbers"),
-    (r"\brebelgolden\b", "RebelGolden"),
-    (r"\brealwise\b", "RealWise"),
-    (r"\bre - inventar\b", "Re-Inventar"),
-    (r"\britualnorma\b", "RitualNorma"),
-    (r"\bskyimage\b", "SkyImage"),
-    (r"\bskyreal\b", "SkyReal"),
-    (r"\bsuccessagain\b", "SuccessAgain"),
-    (r"\btaguscasa\b", "TagusCasa"),
-    (r"\bteclaperfeita\b", "TeclaPerfeita"),
-    (r"\burbanland\b", "UrbanLand"),
-    (r"\bwematch\b", "WeMatch"),
-    (r"\bwhiteone\b", "WhiteOne"),
-    (r"\bwhitetwo\b", "WhiteTwo"),
-    (r"\bwonderfulsix\b", "WonderfulSix"),
-    (r"\bworldwidexl\b", "WorldWideXL"),
-    # abbreviations
-    (r"(?<=- )\bimob\.", "Imobiliária"),
-    (r"(?<=mediação )\bimob\.", "Imobiliária"),
-    (r"(?<=atividades )\bimob\b\.?", "Imobiliárias"),
-    (r"\bmed\.? imob\b\.?", "Mediação Imobiliária"),
-    (r"\bmed\.?(?= imob| e ativ)", "Mediação"),
-    (r"\bmed\.(?= imob| e constr)", "Mediação"),
-    (r"\bsoc\.( de)?(?= med)", "Sociedade de"),
-    (r"\bsociedade(?= med)", "Sociedade de"),
-    (r"(?<=\bsoluções )imob\.", "Imobiliárias"),
-    (r"\bunip\b\.?", "Unipessoal"),
-    # forms of ownership
-    (r"(\s*[-,])?\s*\bunipessoal\b", ", Unipessoal"),
-    (r"(\s*[-,])?\s*\blda\b\.?", ", Lda."),
-    (r"(\s*[-,])?\s*\bs\.a\b\.?", ", S.A."),
-    # dashes
-    (r"\b(?<!de)[\s>,]+\b((sociedade de )?mediação\b|soluções imob)", r" - \1"),
-    # typos and other mistakes
-    (r"\bmedição\b", "Mediação"),
-    (r"\bimobiliari([ao])", r"Imobiliári\1"),
+OPERATOR_FIXES = RegexReplacements(
+    (
+        # proper names
+        (r"\bbizzyland\b", "BizzyLand"),
+        (r"\bblueland\b", "BlueLand"),
+        (r"\bcirc\b", "CIRC"),
+        (r"\bclassalegre\b", "ClassAlegre"),
+        (r"\bconquistenigma\b", "ConquistEnigma"),
+        (r"\bdd[ ]?vendas\b", "DD Vendas"),
+        (r"\bestorilhouse\b", "EstorilHouse"),
+        (r"\bfcgm\b", "FCGM"),
+        (r"\bgldn\b", "GLDN"),
+        (r"\bgoldenloft\b", "GoldenLoft"),
+        (r"\binteligentepartilha\b", "InteligentePartilha"),
+        (r"\bjc2future\b", "JC2Future"),
+        (r"\blpdp in motion\b", "LPDP In Motion"),
+        (r"\bmaxlinha\b", "MaxLinha"),
+        (r"\bmaxloja\b", "MaxLoja"),
+        (r"\bmaxocidente\b", "MaxOcidente"),
+        (r"\bmaxselect\b", "MaxSelect"),
+        (r"\bmaxvilla\b", "MaxVilla"),
+        (r"\bmedipombal\b", "MediPombal"),
+        (r"\bmundilocation\b", "MundiLocation"),
+        (r"\bnortecerto\b", "NorteCerto"),
+        (r"\boceano d eleição\b", "Oceano d'Eleição"),
+        (r"\bon the move\b", "On the Move"),
+        (r"\bo chefe voltou\b", "O Chefe Voltou"),
+        (r"\bpartilhanotável\b", "PartilhaNotável"),
+        (r"\bpatrimonioforte\b", "PatrimonioForte"),
+        (r"\bd'êxito\b", "d'Êxito"),
+        (r"\bportalrumo\b", "PortalRumo"),
+        (r"\bproudnumbers\b", "ProudNumbers"),
+        (r"\brebelgolden\b", "RebelGolden"),
+        (r"\brealwise\b", "RealWise"),
+        (r"\bre - inventar\b", "Re-Inventar"),
+        (r"\britualnorma\b", "RitualNorma"),
+        (r"\bskyimage\b", "SkyImage"),
+        (r"\bskyreal\b", "SkyReal"),
+        (r"\bsuccessagain\b", "SuccessAgain"),
+        (r"\btaguscasa\b", "TagusCasa"),
+        (r"\bteclaperfeita\b", "TeclaPerfeita"),
+        (r"\burbanland\b", "UrbanLand"),
+        (r"\bwematch\b", "WeMatch"),
+        (r"\bwhiteone\b", "WhiteOne"),
+        (r"\bwhitetwo\b", "WhiteTwo"),
+        (r"\bwonderfulsix\b", "WonderfulSix"),
+        (r"\bworldwidexl\b", "WorldWideXL"),
+        # abbreviations
+        (r"(?<=- )\bimob\.", "Imobiliária"),
+        (r"(?<=mediação )\bimob\.", "Imobiliária"),
+        (r"(?<=atividades )\bimob\b\.?", "Imobiliárias"),
+        (r"\bmed\.? imob\b\.?", "Mediação Imobiliária"),
+        (r"\bmed\.?(?= imob| e ativ)", "Mediação"),
+        (r"\bmed\.(?= imob| e constr)", "Mediação"),
+        (r"\bsoc\.( de)?(?= med)", "Sociedade de"),
+        (r"\bsociedade(?= med)", "Sociedade de"),
+        (r"(?<=\bsoluções )imob\.", "Imobiliárias"),
+        (r"\bunip\b\.?", "Unipessoal"),
+        # forms of ownership
+        (r"(\s*[-,])?\s*\bunipessoal\b", ", Unipessoal"),
+        (r"(\s*[-,])?\s*\blda\b\.?", ", Lda."),
+        (r"(\s*[-,])?\s*\bs\.a\b\.?", ", S.A."),
+        # dashes
+        (r"\b(?<!de)[\s>,]+\b((sociedade de )?mediação\b|soluções imob)", r" - \1"),
+        # typos and other mistakes
+        (r"\bmedição\b", "Mediação"),
+        (r"\bimobiliari([ao])", r"Imobiliári\1"),
+    ),
+    flags=re.IGNORECASE,
 )
 YOUTUBE_CHANNELS = {
     "UC0l_7DV4OhqwNh34es5Y-nw": "@REMAXPRO-porto",
@@ -160,8 +174,7 @@ def fetch_data():
 
 def fixup_operator(v):
     v = titleize(re.sub(r"\s*[-–]\s*", " - ", v))
-    for a, b in OPERATOR_FIXES:
-        v = re.sub(a, b, v, flags=re.IGNORECASE)
+    v = OPERATOR_FIXES.sub(v)
     return v
 
 
@@ -283,27 +296,34 @@ if __name__ == "__main__":
             ");"
         )
     ]
+    old_refs = RefIndex(old_data, REF)
+    old_geo = GeoIndex(old_data)
 
     old_node_ids = {d.data["id"] for d in old_data}
 
-    for nd in new_data:
+    nearby = match_nearby(
+        old_geo,
+        [None if old_refs.find(nd["officeNumber"]) else [nd["latitude"], nd["longitude"]] for nd in new_data],
+        250,
+        lambda x: not x[REF],
+    )
+
+    for nd, nearby_d in zip(new_data, nearby, strict=True):
         public_id = nd["officeNumber"]
         branch = nd["officeName"].removeprefix("RE/MAX ")
         branch = BRANCHES.get(branch, branch)
         tags_to_reset = set()
 
-        d = next((od for od in old_data if od[REF] == public_id), None)
+        d = old_refs.find(public_id) or nearby_d
         coord = [nd["latitude"], nd["longitude"]]
-        if d is None:
-            ds = [x for x in old_data if not x[REF] and distance([x.lat, x.lon], coord) < 250]
-            if len(ds) == 1:
-                d = ds[0]
         if d is None:
             d = DiffDict()
             d.data["type"] = "node"
             d.data["id"] = f"-{public_id}"
             d.data["lat"], d.data["lon"] = coord
             old_data.append(d)
+            old_refs.add(d)
+            old_geo.add(d)
         else:
             old_node_ids.remove(d.data["id"])
 
@@ -5,33 +5,46 @@ from itertools import batched, count, groupby
 
 from lxml import etree
 
-from impl.common import DiffDict, distance, fetch_json_data, format_phonenumber, overpass_query, write_diff
+from impl.common import (
+    DiffDict,
+    GeoIndex,
+    RefIndex,
+    RegexMapping,
+    fetch_json_data,
+    format_phonenumber,
+    overpass_query,
+    write_diff,
+)
 
 
 DATA_URL = "https://www.roady.pt/amlocator/index/ajax/"
 
 REF = "ref"
 
-SCHEDULE_DAYS_MAPPING = {
-    r"segunda-feira a quinta-feira": "Mo-Th",
-    r"segunda(- ?feira)? a sexta(-feira)?": "Mo-Fr",
-    r"(de )?(2ª|segunda-feira) (a|até) sábado": "Mo-Sa",
-    r"segunda-feira a sábado e feriados": "Mo-Sa,PH",
-    r"segunda-feira a domingo e feriados": "Mo-Su,PH",
-    r"sexta-feira e sábado": "Fr,Sa",
-    r"sábado": "Sa",
-    r"sábado, domingo e feriados": "Sa,Su,PH",
-    r"sábado e feriados": "Sa,PH",
-    r"domingos?": "Su",
-    r"domingos? e feriados": "Su,PH",
-    r"feriados?": "PH",
-}
-SCHEDULE_HOURS_MAPPING = {
-    r"(\d{1})h(\d{2})\s*(?:às|-)\s*(\d{2})h(\d{2})": r"0\1:\2-\3:\4",
-    r"(\d{2})[:h](\d{2})\s*(?:às|-)\s*(\d{2})[:h](\d{2})": r"\1:\2-\3:\4",
-    r"(\d{2})h-(\d{2})h": r"\1:00-\2:00",
-    r"encerrado": r"off",
-}
+SCHEDULE_DAYS_MAPPING = RegexMapping(
+    {
+        r"segunda-feira a quinta-feira": "Mo-Th",
+        r"segunda(- ?feira)? a sexta(-feira)?": "Mo-Fr",
+        r"(de )?(2ª|segunda-feira) (a|até) sábado": "Mo-Sa",
+        r"segunda-feira a sábado e feriados": "Mo-Sa,PH",
+        r"segunda-feira a domingo e feriados": "Mo-Su,PH",
+        r"sexta-feira e sábado": "Fr,Sa",
+        r"sábado": "Sa",
+        r"sábado, domingo e feriados": "Sa,Su,PH",
+        r"sábado e feriados": "Sa,PH",
+        r"domingos?": "Su",
+        r"domingos? e feriados": "Su,PH",
+        r"feriados?": "PH",
+    }
+)
+SCHEDULE_HOURS_MAPPING = RegexMapping(
+    {
+        r"(\d{1})h(\d{2})\s*(?:às|-)\s*(\d{2})h(\d{2})": r"0\1:\2-\3:\4",
+        r"(\d{2})[:h](\d{2})\s*(?:às|-)\s*(\d{2})[:h](\d{2})": r"\1:\2-\3:\4",
+        r"(\d{2})h-(\d{2})h": r"\1:00-\2:00",
+        r"encerrado": r"off",
+    }
+)
 
 
 def fetch_data():
@@ -77,13 +90,7 @@ def fetch_data():
 
 
 def schedule_time(v, mapping):
-    sa = v
-    sb = f"<ERR:{v}>"
-    for sma, smb in mapping.items():
-        if re.fullmatch(sma, sa) is not None:
-            sb = re.sub(sma, smb, sa)
-            break
-    return sb
+    return mapping.sub(v, f"<ERR:{v}>")
 
 
 def schedule_time_for(schedule, kind):
@@ -121,6 +128,8 @@ if __name__ == "__main__":
     new_data = fetch_data()
 
     old_data = [DiffDict(e) for e in overpass_query('nwr[shop][name~"roady",i](area.country);')]
+    old_refs = RefIndex(old_data, REF)
+    old_geo = GeoIndex(old_data)
 
     new_node_id = -10000
     old_node_ids = {d.data["id"] for d in old_data}
@@ -130,10 +139,10 @@ if __name__ == "__main__":
         branch = nd["name"].removeprefix("Roady ")
         tags_to_reset = set()
 
-        d = next((od for od in old_data if od[REF] == public_id), None)
+        d = old_refs.find(public_id)
         coord = [float(nd["lat"]), float(nd["lng"])]
         if d is None:
-            ds = [x for x in old_data if not x[REF] and distance([x.lat, x.lon], coord) < 250]
+            ds = [x for x, _ in old_geo.within(coord, 250) if not x[REF]]
             if len(ds) == 1:
                 d = ds[0]
         if d is None:
@@ -142,6 +151,8 @@ if __name__ == "__main__":
             d.data["id"] = str(new_node_id)
             d.data["lat"], d.data["lon"] = coord
             old_data.append(d)
+            old_refs.add(d)
+            old_geo.add(d)
             new_node_id -= 1
         else:
             old_node_ids.remove(d.data["id"])
@@ -6,11 +6,14 @@ import re
 from impl.common import (
     DAYS,
     DiffDict,
+    GeoIndex,
+    RefIndex,
     country_polygon,
-    cover_polygon,
-    distance,
+    cover_polygon_parallel,
+    distances,
     fetch_json_data,
     format_phonenumber,
+    match_nearby,
     merge_weekdays,
     overpass_query,
     titleize,
@@ -168,14 +171,15 @@ def fetch_data():
         }
         data = fetch_json_data(DATA_URL, params=params)
 
-        max_dist = 0
         for poi in data:
             pois[poi["poicode"]] = poi
-            max_dist = max(max_dist, distance(coords, [poi["location"]["coordinates"][1], poi["location"]["coordinates"][0]]))
 
-        return max_dist if data else MAX_RADIUS
+        if not data:
+            return MAX_RADIUS
+        poi_coords = [[poi["location"]["coordinates"][1], poi["location"]["coordinates"][0]] for poi in data]
+        return float(distances(coords, poi_coords).max())
 
-    cover_polygon(country_polygon(), MAX_RADIUS, fetch_impl)
+    cover_polygon_parallel(country_polygon(tolerance=0.01), MAX_RADIUS, fetch_impl, plan_key="santander")
 
     results = list(pois.values())
     results = [r for r in results if r["entityCode"] == "Santander_Totta"]
@@ -187,21 +191,28 @@ if __name__ == "__main__":
     new_data = fetch_data()
 
     old_data = [DiffDict(e) for e in overpass_query('nwr[amenity=bank][name~"santander",i](area.country);')]
+    old_refs = RefIndex(old_data, REF)
+    old_geo = GeoIndex(old_data)
 
     new_node_id = -10000
     old_node_ids = {d.data["id"] for d in old_data}
 
-    for nd in new_data:
+    nearby = match_nearby(
+        old_geo,
+        [
+            None if old_refs.find(nd["poicode"]) else [nd["location"]["coordinates"][1], nd["location"]["coordinates"][0]]
+            for nd in new_data
+        ],
+        100,
+        lambda x: not x[REF],
+    )
+
+    for nd, nearby_d in zip(new_data, nearby, strict=True):
         public_id = nd["poicode"]
         branch = fix_branch(nd["name"])
         tags_to_reset = set()
 
-        d = next((od for od in old_data if od[REF] == public_id), None)
-        if d is None:
-            coord = [nd["location"]["coordinates"][1], nd["location"]["coordinates"][0]]
-            ds = [x for x in old_data if not x[REF] and distance([x.lat, x.lon], coord) < 100]
-            if len(ds) == 1:
-                d = ds[0]
+        d = old_refs.find(public_id) or nearby_d
         if d is None:
             d = DiffDict()
             d.data["type"] = "node"
@@ -209,6 +220,8 @@ if __name__ == "__main__":
             d.data["lat"] = nd["location"]["coordinates"][1]
             d.data["lon"] = nd["location"]["coordinates"][0]
             old_data.append(d)
+            old_refs.add(d)
+            old_geo.add(d)
             new_node_id -= 1
         else:
             old_node_ids.remove(d.data["id"])
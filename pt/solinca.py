@@ -2,12 +2,13 @@
 
 import re
 from itertools import count
-from multiprocessing import Pool
 
 from impl.common import (
     DiffDict,
-    distance,
+    GeoIndex,
+    RefIndex,
     fetch_html_data,
+    fetch_many,
     lookup_gmaps_coords,
     lookup_postcode,
     overpass_query,
@@ -80,19 +81,20 @@ def fetch_level2_data(data):
 
 if __name__ == "__main__":
     new_data = fetch_level1_data()
-    with Pool(4) as p:
-        new_data = list(p.imap_unordered(fetch_level2_data, new_data))
+    new_data = fetch_many(fetch_level2_data, new_data)
 
     old_data = [DiffDict(e) for e in overpass_query('nwr[leisure][name~"solinca",i](area.country);')]
+    old_refs = RefIndex(old_data, REF)
+    old_geo = GeoIndex(old_data)
 
     old_node_ids = {d.data["id"] for d in old_data}
 
     for nd in new_data:
         public_id = nd["id"]
-        d = next((od for od in old_data if od[REF] == public_id), None)
+        d = old_refs.find(public_id)
         if d is None and nd["location"]:
             coord = nd["location"][0]
-            ds = [x for x in old_data if not x[REF] and distance([x.lat, x.lon], coord) < 250]
+            ds = [x for x, _ in old_geo.within(coord, 250) if not x[REF]]
             if len(ds) == 1:
                 d = ds[0]
         if d is None:
@@ -102,6 +104,8 @@ if __name__ == "__main__":
             d.data["lat"] = nd["location"][0][0]
             d.data["lon"] = nd["location"][0][1]
             old_data.append(d)
+            old_refs.add(d)
+            old_geo.add(d)
         else:
             old_node_ids.remove(d.data["id"])
 
@@ -3,9 +3,8 @@
 import json
 import re
 from itertools import batched, dropwhile, groupby, islice, takewhile
-from multiprocessing import Pool
 
-from impl.common import DiffDict, distance, fetch_html_data, fetch_json_data, overpass_query, write_diff
+from impl.common import DiffDict, GeoIndex, RefIndex, fetch_html_data, fetch_json_data, fetch_many, overpass_query, write_diff
 
 
 LEVEL1_DATA_URL = "https://www.spar.pt/loja/resumo"
@@ -82,10 +81,11 @@ def fetch_level2_data(data):
 
 if __name__ == "__main__":
     new_data = fetch_level1_data()
-    with Pool(4) as p:
-        new_data = list(p.imap_unordered(fetch_level2_data, new_data))
+    new_data = fetch_many(fetch_level2_data, new_data)
 
     old_data = [DiffDict(e) for e in overpass_query(r'nwr[shop][shop!=newsagent][name~"\\bspar\\b",i](area.country);')]
+    old_refs = RefIndex(old_data, REF)
+    old_geo = GeoIndex(old_data)
 
     old_node_ids = {d.data["id"] for d in old_data}
 
@@ -94,12 +94,12 @@ if __name__ == "__main__":
         branch = re.sub(r"^SPAR\s+", "", nd["nome"], flags=re.IGNORECASE)
         tags_to_reset = set()
 
-        d = next((od for od in old_data if od[REF] == public_id), None)
+        d = old_refs.find(public_id)
         coord = [float(nd["latitude"]), float(nd["longitude"])]
         if coord[1] > 0:
             coord[1] = -coord[1]
         if d is None:
-            ds = [x for x in old_data if not x[REF] and distance([x.lat, x.lon], coord) < 100]
+            ds = [x for x, _ in old_geo.within(coord, 100) if not x[REF]]
             if len(ds) == 1:
                 d = ds[0]
         if d is None:
@@ -108,6 +108,8 @@ if __name__ == "__main__":
             d.data["id"] = f"-{public_id}"
             d.data["lat"], d.data["lon"] = coord
             old_data.append(d)
+            old_refs.add(d)
+            old_geo.add(d)
         else:
             old_node_ids.remove(d.data["id"])
 
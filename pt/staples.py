@@ -5,7 +5,16 @@ import re
 
 from lxml import etree
 
-from impl.common import DiffDict, distance, fetch_json_data, opening_weekdays, overpass_query, write_diff
+from impl.common import (
+    DiffDict,
+    GeoIndex,
+    RefIndex,
+    RegexMapping,
+    fetch_json_data,
+    opening_weekdays,
+    overpass_query,
+    write_diff,
+)
 
 
 DATA_URL = "https://www.staples.pt/pt/pt/store-locator"
@@ -13,10 +22,12 @@ DATA_URL = "https://www.staples.pt/pt/pt/store-locator"
 REF = "ref"
 
 DAYS = ["Segunda-feira", "Terça-feira", "Quarta-feira", "Quinta-feira", "Sexta-feira", "Sábado", "Domingo"]
-SCHEDULE_HOURS_MAPPING = {
-    r"(\d{2})h(\d{2}) - (\d{2})h(\d{2})": r"\1:\2-\3:\4",
-    "Encerrada": "off",
-}
+SCHEDULE_HOURS_MAPPING = RegexMapping(
+    {
+        r"(\d{2})h(\d{2}) - (\d{2})h(\d{2})": r"\1:\2-\3:\4",
+        "Encerrada": "off",
+    }
+)
 OFF_DAYS_MAPPING = {
     "1/jan": "Jan 01",
     "Domingo de Páscoa": "easter",
@@ -46,29 +57,25 @@ def fetch_data():
 
 
 def schedule_time(v):
-    sa = v
-    sb = f"<ERR:{v}>"
-    for sma, smb in SCHEDULE_HOURS_MAPPING.items():
-        if re.fullmatch(sma, sa) is not None:
-            sb = re.sub(sma, smb, sa)
-            break
-    return sb
+    return SCHEDULE_HOURS_MAPPING.sub(v, f"<ERR:{v}>")
 
 
 if __name__ == "__main__":
     new_data = fetch_data()
 
     old_data = [DiffDict(e) for e in overpass_query('nwr[shop][name~"^staples",i](area.country);')]
+    old_refs = RefIndex(old_data, REF)
+    old_geo = GeoIndex(old_data)
 
     new_node_id = -10000
     old_node_ids = {d.data["id"] for d in old_data}
 
     for nd in new_data:
         public_id = str(nd["point_id"])
-        d = next((od for od in old_data if od[REF] == public_id), None)
+        d = old_refs.find(public_id)
         if d is None:
             coord = [float(nd["coordX"]), float(nd["coordY"])]
-            ds = [x for x in old_data if not x[REF] and distance([x.lat, x.lon], coord) < 250]
+            ds = [x for x, _ in old_geo.within(coord, 250) if not x[REF]]
             if len(ds) == 1:
                 d = ds[0]
         if d is None:
@@ -78,6 +85,8 @@ if __name__ == "__main__":
             d.data["lat"] = float(nd["coordX"])
             d.data["lon"] = float(nd["coordY"])
             old_data.append(d)
+            old_refs.add(d)
+            old_geo.add(d)
             new_node_id -= 1
         else:
             old_node_ids.remove(d.data["id"])
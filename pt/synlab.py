@@ -5,7 +5,7 @@ import re
 from itertools import batched, groupby
 from urllib.parse import urljoin
 
-from impl.common import DiffDict, distance, fetch_html_data, format_phonenumber, overpass_query, write_diff
+from impl.common import DiffDict, GeoIndex, RegexMapping, fetch_html_data, format_phonenumber, overpass_query, write_diff
 
 
 DATA_URL = "https://www.synlab.pt/onde-estamos"
@@ -55,13 +55,15 @@ SCHEDULE_DAYS_MAPPING = {
     "24 horas": "24/7",
     "por marcação": '"por marcação"',
 }
-SCHEDULE_HOURS_MAPPING = {
-    r"(\d{1}):(\d{2}) às (\d{2}):(\d{2})": r"0\1:\2-\3:\4",
-    r"(\d{1}):(\d{2}) às (\d{2}):(\d{2}) e das (\d{2}):(\d{2}) às (\d{2}):(\d{2})": r"0\1:\2-\3:\4,\5:\6-\7:\8",
-    r"(\d{2})[:.](\d{2})\s*[àá]s\s*(\d{2})[:.](\d{2})": r"\1:\2-\3:\4",
-    r"(\d{2}):(\d{2}) às (\d{2}):(\d{2}) e(?: das)? (\d{2}):(\d{2}) (?:a|às) (\d{2}):(\d{2})": r"\1:\2-\3:\4,\5:\6-\7:\8",
-    r"(\d{2}):(\d{2}) às (\d{2}):(\d{2}) \(por marcação\)": r'\1:\2-\3:\4 "por marcação"',
-}
+SCHEDULE_HOURS_MAPPING = RegexMapping(
+    {
+        r"(\d{1}):(\d{2}) às (\d{2}):(\d{2})": r"0\1:\2-\3:\4",
+        r"(\d{1}):(\d{2}) às (\d{2}):(\d{2}) e das (\d{2}):(\d{2}) às (\d{2}):(\d{2})": r"0\1:\2-\3:\4,\5:\6-\7:\8",
+        r"(\d{2})[:.](\d{2})\s*[àá]s\s*(\d{2})[:.](\d{2})": r"\1:\2-\3:\4",
+        r"(\d{2}):(\d{2}) às (\d{2}):(\d{2}) e(?: das)? (\d{2}):(\d{2}) (?:a|às) (\d{2}):(\d{2})": r"\1:\2-\3:\4,\5:\6-\7:\8",
+        r"(\d{2}):(\d{2}) às (\d{2}):(\d{2}) \(por marcação\)": r'\1:\2-\3:\4 "por marcação"',
+    }
+)
 CITIES = {
     "2840-009": "Seixal",
     "4700-068": "Braga",
@@ -112,13 +114,7 @@ def fix_branch(name):
 
 
 def schedule_time(v):
-    sa = v
-    sb = f"<ERR:{v}>"
-    for sma, smb in SCHEDULE_HOURS_MAPPING.items():
-        if re.fullmatch(sma, sa) is not None:
-            sb = re.sub(sma, smb, sa)
-            break
-    return sb
+    return SCHEDULE_HOURS_MAPPING.sub(v, f"<ERR:{v}>")
 
 
 def process_valid_schedule(schedule):
@@ -158,6 +154,7 @@ if __name__ == "__main__":
     new_data = fetch_data()
 
     old_data = [DiffDict(e) for e in overpass_query('nwr[healthcare][~"^(name|brand)$"~"synlab",i](area.country);')]
+    old_geo = GeoIndex(old_data)
 
     new_node_id = -10000
     old_node_ids = {d.data["id"] for d in old_data}
@@ -170,7 +167,7 @@ if __name__ == "__main__":
         d = None  # next((od for od in old_data if od[REF] == public_id), None)
         coord = [nd["lat"], nd["lng"]]
         if d is None:
-            ds = [x for x in old_data if not x[REF] and distance([x.lat, x.lon], coord) < 250]
+            ds = [x for x, _ in old_geo.within(coord, 250) if not x[REF]]
             if len(ds) == 1:
                 d = ds[0]
         if d is None:
@@ -179,6 +176,7 @@ if __name__ == "__main__":
             d.data["id"] = str(new_node_id)
             d.data["lat"], d.data["lon"] = coord
             old_data.append(d)
+            old_geo.add(d)
             new_node_id -= 1
         else:
             old_node_ids.remove(d.data["id"])
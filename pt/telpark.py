@@ -1,9 +1,8 @@
 #!/usr/bin/env python3
 
 import re
-from multiprocessing import Pool
 
-from impl.common import DiffDict, RedoIter, distance, fetch_json_data, overpass_query, write_diff
+from impl.common import DiffDict, GeoIndex, RedoIter, RefIndex, fetch_json_data, fetch_many, overpass_query, write_diff
 
 
 LEVEL1_DATA_URL = "https://www.telpark.com/pt/wp-json/wp/v2/country"
@@ -90,8 +89,7 @@ def fixup_price(price):
 
 if __name__ == "__main__":
     countries = fetch_level1_data()
-    with Pool(4) as p:
-        locations = {k: v for x in p.imap_unordered(fetch_level2_data, countries.keys()) for k, v in x.items()}
+    locations = {k: v for x in fetch_many(fetch_level2_data, countries.keys()) for k, v in x.items()}
     new_data = fetch_level3_data(locations)
 
     old_data = [
@@ -103,6 +101,8 @@ if __name__ == "__main__":
             ");"
         )
     ]
+    old_refs = RefIndex(old_data, REF)
+    old_geo = GeoIndex(old_data)
 
     old_node_ids = {d.data["id"] for d in old_data}
 
@@ -113,10 +113,10 @@ if __name__ == "__main__":
         public_id = nd["id"]
         tags_to_reset = set()
 
-        d = next((od for od in old_data if od[REF] == public_id and od.data["type"] == old_type), None)
+        d = next((od for od in old_refs.find_all(public_id) if od.data["type"] == old_type), None)
         coord = [float(nd["latitude"]), float(nd["longitude"])]
         if d is None:
-            ds = [x for x in old_data if not x[REF] and x.data["type"] == old_type and distance([x.lat, x.lon], coord) < 250]
+            ds = [x for x, _ in old_geo.within(coord, 250) if not x[REF] and x.data["type"] == old_type]
             if len(ds) == 1:
                 d = ds[0]
         if d is None and old_type in ("way", "relation"):
@@ -133,6 +133,8 @@ if __name__ == "__main__":
             d.data["id"] = f"-{public_id}"
             d.data["lat"], d.data["lon"] = coord
             old_data.append(d)
+            old_refs.add(d)
+            old_geo.add(d)
         else:
             old_node_ids.remove(d.data["id"])
 
@@ -0,0 +1,172 @@
+import os
+import threading
+from gzip import compress
+
+import pytest
+
+import impl.cache
+import impl.common
+from impl.cache import CacheStore, parse_duration
+from impl.common import conditional_fetch, single_flight
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(impl.cache, "time", clock)
+    return clock
+
+
+def store(path, **kwargs):
+    return CacheStore(path / "cache.sqlite3", **{"ttls": {}, "stale_ttls": {}, "max_size": 1 << 20, **kwargs})
+
+
+def total_size(s):
+    conn = s._connection()  # noqa: SLF001
+    tracked = conn.execute("SELECT value FROM totals WHERE name = 'size'").fetchone()[0]
+    return tracked, conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+
+def test_parse_duration():
+    assert parse_duration(None) is None
+    assert parse_duration(30) == 30
+    assert parse_duration("6h") == 6 * 60 * 60
+    assert parse_duration("1.5d") == 1.5 * 24 * 60 * 60
+    with pytest.raises(ValueError, match="Invalid duration"):
+        parse_duration("soon")
+
+
+def test_ttl_and_stale_ttl(tmp_path, clock):
+    s = store(tmp_path, ttls={"data": 60}, stale_ttls={"data": 30})
+    s.set("data", "a", b"value")
+    s.set("other", "a", b"forever")
+    assert s.lookup("data", "a") == (b"value", True)
+
+    clock.now += 61
+    assert s.get("data", "a") is None
+    assert s.lookup("data", "a") == (b"value", False)
+    assert s.get("other", "a") == b"forever"
+
+    clock.now += 30
+    assert s.lookup("data", "a") == (None, False)
+    assert s.lookup("data", "a", expired=True) == (b"value", False)
+
+    assert s.prune() == 1
+    assert s.lookup("data", "a", expired=True) == (None, False)
+    assert s.get("other", "a") == b"forever"
+
+
+@pytest.mark.usefixtures("clock")
+def test_replace_and_delete(tmp_path):
+    s = store(tmp_path)
+    s.set("data", "a", b"x" * 100)
+    s.set("data", "a", b"y")
+    assert s.get("data", "a") == b"y"
+    s.set("data", "b", b"z")
+    s.delete("data", "a")
+    assert s.get("data", "a") is None
+    tracked, actual = total_size(s)
+    assert tracked == actual
+
+
+def test_lru_eviction(tmp_path, clock):
+    s = store(tmp_path, max_size=1)
+    s.set("data", "a", b"a")
+    assert s.get("data", "a") is None
+    # Sizes are those of the compressed values
+    large = os.urandom(100)
+    s = store(tmp_path, max_size=2 * len(compress(b"a")) + len(compress(large)))
+    for key in "abc":
+        clock.now += 1
+        s.set("data", key, key.encode())
+    # Access times are only updated once they are old enough, so that lookups don't have to write
+    clock.now += 2 * impl.cache.ACCESS_RESOLUTION
+    assert s.get("data", "a") == b"a"
+    s.set("data", "d", large)
+    tracked, actual = total_size(s)
+    assert tracked == actual
+    assert s.get("data", "b") is None
+    assert s.get("data", "a") == b"a"
+    assert s.get("data", "c") == b"c"
+    assert s.get("data", "d") == large
+
+
+@pytest.mark.usefixtures("clock")
+def test_lookups_do_not_write(tmp_path):
+    s = store(tmp_path)
+    s.set("data", "a", b"value")
+    conn = s._connection()  # noqa: SLF001
+    changes = conn.total_changes
+    for _ in range(10):
+        assert s.get("data", "a") == b"value"
+    assert conn.total_changes == changes
+
+
+class Response:
+    def __init__(self, status_code, content=b"", headers=None):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+
+
+def test_conditional_fetch(tmp_path, clock, monkeypatch):
+    s = store(tmp_path, ttls={"data": 60})
+    monkeypatch.setattr(impl.common, "CACHE_STORE", s)
+    sent = []
+
+    def request(response):
+        def func(headers):
+            sent.append(headers)
+            return response
+
+        return func
+
+    assert conditional_fetch("data", "a", request(Response(200, b"v1", {"etag": '"1"'}))) == b"v1"
+    assert sent[-1] == {}
+    s.set("data", "a", b"v1")
+
+    # Revalidated even once expired, and kept as is on 304
+    clock.now += 120
+    assert conditional_fetch("data", "a", request(Response(304))) == b"v1"
+    assert sent[-1] == {"if-none-match": '"1"'}
+
+    assert conditional_fetch("data", "a", request(Response(200, b"v2", {"last-modified": "Sun"}))) == b"v2"
+    assert sent[-1] == {"if-none-match": '"1"'}
+    s.set("data", "a", b"v2")
+    assert conditional_fetch("data", "a", request(Response(304))) == b"v2"
+    assert sent[-1] == {"if-modified-since": "Sun"}
+
+
+def test_single_flight_nesting(tmp_path, monkeypatch):
+    monkeypatch.setattr(impl.common, "BASE_DIR", tmp_path)
+    (tmp_path / "cache").mkdir()
+    events = []
+
+    def nested():
+        with single_flight("data", "a"), single_flight("data", "a"):
+            events.append("nested")
+
+    def other():
+        with single_flight("data", "a"):
+            events.append("other")
+
+    thread = threading.Thread(target=nested, daemon=True)
+    thread.start()
+    thread.join(5)
+    assert events == ["nested"]
+
+    with single_flight("data", "a"):
+        thread = threading.Thread(target=other, daemon=True)
+        thread.start()
+        thread.join(0.2)
+        assert events == ["nested"]
+    thread.join(5)
+    assert events == ["nested", "other"]
@@ -0,0 +1,39 @@
+import random
+
+import numpy as np
+from shapely import union_all
+from shapely.geometry import MultiPolygon, box
+
+from impl.common import circles, cover_polygon, cover_polygon_parallel, distances
+
+
+def dense_branches():
+    # Mainland and island boxes with branches clustered around cities of varying size, plus some scattered ones
+    rng = random.Random(7)  # noqa: S311
+    g = MultiPolygon([box(-9.5, 37.0, -6.2, 42.0), box(-17.3, 32.6, -16.6, 32.9), box(-25.9, 37.7, -25.1, 37.9)])
+    cities = [(rng.uniform(37.2, 41.8), rng.uniform(-9.3, -6.5), rng.uniform(0.01, 0.2)) for _ in range(30)]
+    branches = [[rng.gauss(lat, s), rng.gauss(lon, s)] for lat, lon, s in [*cities, (32.65, -16.9, 0.05)] for _ in range(150)]
+    branches += [[rng.uniform(37.0, 42.0), rng.uniform(-9.5, -6.2)] for _ in range(500)]
+    return g, np.array(branches)
+
+
+def counting_query(branches, limit=10):
+    # Like a store locator returning the `limit` nearest branches, covering up to the farthest of them
+    queries = []
+
+    def query(c):
+        queries.append(c)
+        return float(np.sort(distances([c[1], c[0]], branches))[limit - 1])
+
+    return queries, query
+
+
+def test_cover_polygon_parallel_queries():
+    g, branches = dense_branches()
+    sequential_queries, query = counting_query(branches)
+    cover_polygon(g, 100_000, query)
+    parallel_queries, query = counting_query(branches)
+    plan = cover_polygon_parallel(g, 100_000, query)
+
+    assert len(parallel_queries) <= len(sequential_queries)
+    assert g.difference(union_all(circles([c for c, _ in plan], [r for _, r in plan]))).area == 0
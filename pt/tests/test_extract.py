@@ -0,0 +1,94 @@
+import pytest
+from shapely import to_wkb
+from shapely.geometry import box
+
+from impl.extract import OsmExtract, QueryParser
+
+
+def box_wkb(*bounds):
+    return to_wkb(box(*bounds))
+
+
+def extract():
+    elements = [
+        {"type": "node", "id": 1, "lat": 38.7, "lon": -9.1, "tags": {"shop": "supermarket", "name": "Aldi", "brand": "ALDI"}},
+        {"type": "node", "id": 2, "lat": 41.1, "lon": -8.6, "tags": {"shop": "supermarket", "name": "Lidl"}},
+        {"type": "way", "id": 3, "center": {"lat": 38.71, "lon": -9.11}, "tags": {"shop": "convenience", "name": "aldi"}},
+        {"type": "node", "id": 4, "lat": 38.72, "lon": -9.12, "tags": {"amenity": "bank", "name": "CGD"}},
+        {"type": "relation", "id": 5, "center": {"lat": 41.2, "lon": -8.55}, "tags": {"amenity": "bank", "brand": "ALDI"}},
+    ]
+    areas = [
+        {
+            "id": 10,
+            "point": [-9.1, 38.7],
+            "tags": {"name": "Lisboa", "admin_level": "7"},
+            "wkb": to_wkb(box(-9.3, 38.6, -9.0, 38.8)),
+        },
+        {
+            "id": 11,
+            "point": [-8.6, 41.1],
+            "tags": {"name": "Porto", "admin_level": "7"},
+            "wkb": to_wkb(box(-8.7, 41.0, -8.5, 41.3)),
+        },
+    ]
+    return OsmExtract(elements, areas)
+
+
+def ids(query, **kwargs):
+    return [e["id"] for e in extract().query(query, **kwargs)]
+
+
+def test_parser():
+    statements = QueryParser('(node[shop="a b"][!brand](area.x); way[~"^name$"~"x",i];) -> .r;').parse()
+
+    assert len(statements) == 1
+    union = statements[0]
+    assert union["kind"] == "union"
+    assert union["into"] == "r"
+    assert [s["kind"] for s in union["statements"]] == ["node", "way"]
+    assert union["statements"][0]["area"] == "x"
+    assert [k for k, _ in union["statements"][0]["filters"]] == ["shop", None]
+    assert union["statements"][1]["area"] is None
+
+
+@pytest.mark.parametrize("query", ["nwr[shop", "nwr[shop];)", "foo[shop];", "nwr[shop=x],"])
+def test_parser_errors(query):
+    with pytest.raises(ValueError, match=r"Expected|Unexpected"):
+        QueryParser(query).parse()
+
+
+@pytest.mark.parametrize(
+    ("query", "expected"),
+    [
+        ("nwr[shop](area.country);", [1, 2, 3]),
+        ("nwr[shop=supermarket](area.country);", [1, 2]),
+        ("nwr[shop][!brand](area.country);", [2, 3]),
+        ("nwr[shop][name!=Lidl](area.country);", [1, 3]),
+        ('nwr[shop][name~"^aldi$"](area.country);', [3]),
+        ('nwr[shop][name~"^aldi$",i](area.country);', [1, 3]),
+        ('nwr[shop][name!~"^aldi$",i](area.country);', [2]),
+        ('nwr[amenity][~"^(name|brand)$"~"aldi",i](area.country);', [5]),
+        ("node[shop](area.country);", [1, 2]),
+        ("way[shop](area.country);", [3]),
+        ("(node[shop=supermarket];nwr[amenity=bank];);", [1, 2, 4, 5]),
+        ("(nwr[shop=supermarket];nwr[shop][name=aldi];);", [1, 2, 3]),
+    ],
+)
+def test_query_filters(query, expected):
+    assert ids(query) == expected
+
+
+def test_query_areas():
+    assert ids("area[name=Lisboa] -> .a; nwr[shop](area.a); nwr[amenity](area.a) -> .b;") == [1, 3]
+    assert ids("area[admin_level=7] -> .a; nwr[amenity](area.a);") == [4, 5]
+
+
+def test_query_center():
+    assert "center" in extract().query("way[shop];")[0]
+    assert "center" not in extract().query("way[shop];", center=False)[0]
+
+
+@pytest.mark.parametrize("query", ["nwr[name=Aldi];", "nwr[!shop][name];", 'nwr[~"shop"~"."];'])
+def test_query_unindexed(query):
+    with pytest.raises(ValueError, match="has to filter on one of"):
+        extract().query(query)
@@ -0,0 +1,95 @@
+import json
+
+import pytest
+
+from impl.jsonstream import JsonReader, iter_chunks, iter_json_array, write_json_array
+
+
+DOCUMENT = {
+    "version": 0.6,
+    "osm3s": {"timestamp_osm_base": "2024-01-01T00:00:00Z"},
+    "elements": [
+        {"type": "node", "id": 1, "lat": 38.7, "lon": -9.15, "tags": {"name": "Café São João", "addr:housenumber": "12"}},
+        {"type": "way", "id": 22, "nodes": [1, 2, 3], "tags": {"name": "Rua 😀 ∑"}},
+        -1.5e-3,
+        120,
+        [],
+        {},
+        '"quoted" \\ é',
+        True,
+        None,
+    ],
+    "remark": "trailing",
+}
+
+
+def chunked(data, size):
+    return iter_chunks(data.encode("utf-8") if isinstance(data, str) else data, size)
+
+
+@pytest.mark.parametrize("size", range(1, 40))
+def test_members_and_array(size):
+    data = json.dumps(DOCUMENT, ensure_ascii=False)
+    members = {}
+    items = iter_json_array(chunked(data, size), "elements", members)
+    # Members before the array are known by its first item, the ones after it once it is exhausted
+    assert next(items) == DOCUMENT["elements"][0]
+    assert members == {"version": 0.6, "osm3s": DOCUMENT["osm3s"]}
+    assert list(items) == DOCUMENT["elements"][1:]
+    assert members == {k: v for k, v in DOCUMENT.items() if k != "elements"}
+
+
+@pytest.mark.parametrize("size", range(1, 8))
+def test_top_level_array(size):
+    assert list(iter_json_array(chunked(' [ 1 , 2.5,{"a": [3]} ,\n"x" ] ', size))) == [1, 2.5, {"a": [3]}, "x"]
+
+
+def test_text_chunks():
+    assert list(iter_json_array(['{"a": 1, "b": [1', "2, 3", ".5]}"], "b")) == [12, 3.5]
+
+
+@pytest.mark.parametrize(
+    ("chunks", "expected"),
+    [
+        ([b"[1", b"2]"], [12]),
+        ([b"[1.", b"5]"], [1.5]),
+        ([b"[1e", b"3, -", b"7]"], [1000.0, -7]),
+        ([b"[0", b".", b"25", b"]"], [0.25]),
+        ([b"[12", b" ,3", b"4]"], [12, 34]),
+    ],
+)
+def test_numbers_across_chunks(chunks, expected):
+    assert list(iter_json_array(chunks)) == expected
+
+
+def test_multibyte_across_chunks():
+    data = json.dumps(["ã", "😀", "ç€"], ensure_ascii=False).encode("utf-8")
+    # Every split point, including the ones inside a character's UTF-8 sequence
+    for i in range(1, len(data)):
+        assert list(iter_json_array([data[:i], data[i:]])) == ["ã", "😀", "ç€"]
+
+
+def test_trailing_number():
+    reader = JsonReader([b"4", b"2"])
+    assert reader.value() == 42
+    assert reader.peek() is None
+
+
+@pytest.mark.parametrize(
+    "data",
+    ["[1, 2", "[1, 2,", '[{"a": 1', '{"elements": [1]', '{"elements": [1], "x"', '["abc', "", "{", '{"elements" 1}'],
+)
+def test_truncated(data):
+    for size in (1, 3, len(data) or 1):
+        with pytest.raises(ValueError):  # noqa: PT011
+            list(iter_json_array(chunked(data, size), "elements" if data.startswith("{") else None))
+
+
+def test_write_json_array():
+    out = bytearray(b'{"elements": ')
+    write_json_array(out, (x for x in DOCUMENT["elements"]))
+    out += b"}"
+    assert json.loads(out) == {"elements": DOCUMENT["elements"]}
+    out = bytearray()
+    write_json_array(out, [])
+    assert out == b"[]"
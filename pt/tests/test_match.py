@@ -0,0 +1,51 @@
+import itertools
+import random
+
+from impl.common import DiffDict, GeoIndex, distance, match_nearby
+
+
+def node(i, lat, lon):
+    return DiffDict({"type": "node", "id": i, "lat": lat, "lon": lon, "tags": {}})
+
+
+def assignment_cost(coords, result, radius):
+    # What `match_nearby` minimizes: distances of the matched pairs, twice `radius` for each item left unmatched
+    return sum(2 * radius if d is None else distance([d.lat, d.lon], c) for c, d in zip(coords, result, strict=True))
+
+
+def brute_force_cost(coords, elements, radius):
+    candidates = [*elements, *[None] * len(coords)]
+    return min(
+        assignment_cost(coords, result, radius)
+        for result in itertools.permutations(candidates, len(coords))
+        if all(d is None or distance([d.lat, d.lon], c) < radius for c, d in zip(coords, result, strict=True))
+    )
+
+
+def test_match_nearby_is_optimal():
+    rng = random.Random(1)  # noqa: S311
+    for _ in range(20):
+        elements = [node(i, 38.7 + rng.uniform(0, 0.01), -9.1 + rng.uniform(0, 0.01)) for i in range(rng.randint(1, 5))]
+        coords = [[38.7 + rng.uniform(0, 0.01), -9.1 + rng.uniform(0, 0.01)] for _ in range(rng.randint(1, 5))]
+        result = match_nearby(GeoIndex(elements), coords, 500)
+
+        matched = [id(d) for d in result if d is not None]
+        assert len(matched) == len(set(matched))
+        assert all(d is None or distance([d.lat, d.lon], c) < 500 for c, d in zip(coords, result, strict=True))
+        assert abs(assignment_cost(coords, result, 500) - brute_force_cost(coords, elements, 500)) < 1e-6
+
+
+def test_match_nearby_out_of_radius():
+    elements = [node(1, 38.7, -9.1), node(2, 38.71, -9.1)]
+    coords = [[38.8, -9.1], None, [38.7, -9.2]]
+
+    assert match_nearby(GeoIndex(elements), coords, 1000) == [None, None, None]
+
+
+def test_match_nearby_predicate():
+    elements = [node(1, 38.7, -9.1), node(2, 38.7001, -9.1)]
+    elements[0]["ref"] = "x"
+
+    result = match_nearby(GeoIndex(elements), [[38.7, -9.1]], 100, lambda d: not d["ref"])
+
+    assert result == [elements[1]]
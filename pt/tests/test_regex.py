@@ -0,0 +1,68 @@
+import re
+
+import pytest
+from bench import linear_regex_sub, regex_table_examples, regex_tables
+
+from impl.common import RegexMapping, RegexReplacements, combine_patterns
+
+
+TABLES = list(regex_tables())
+EXAMPLES = [x for kind, table, _ in TABLES for x in regex_table_examples(kind, table)]
+
+
+def compile_table(kind, table, flags):
+    return RegexMapping(table, flags=flags) if kind == "RegexMapping" else RegexReplacements(table, flags=flags)
+
+
+def table_inputs(kind, table):
+    # The table's own examples, as is and altered so that some of them stop matching, and every other table's ones
+    own = regex_table_examples(kind, table)
+    altered = [f(x) for x in own for f in (str.upper, str.title, lambda x: f" {x} ", lambda x: f"{x}x", lambda x: x[1:])]
+    return ["", *own, *altered, *[f"{a} {b}" for a, b in zip(own, reversed(own), strict=True)], *EXAMPLES]
+
+
+def test_tables():
+    assert len(TABLES) > 30
+    assert any(flags & re.IGNORECASE for _, _, flags in TABLES)
+
+
+@pytest.mark.parametrize(("kind", "table", "flags"), TABLES)
+def test_table_matches_linear_scan(kind, table, flags):
+    compiled = compile_table(kind, table, flags)
+    hits = 0
+    for value in table_inputs(kind, table):
+        expected = linear_regex_sub(kind, table, flags, value)
+        assert compiled.sub(value) == expected, value
+        hits += expected not in (None, value)
+    assert hits
+
+
+@pytest.mark.parametrize(
+    ("kind", "table", "flags"),
+    [
+        ("RegexMapping", {r"(\d)-\1": r"twice \1", r"(\d)-(\d)": r"\2 after \1"}, 0),
+        ("RegexMapping", {r"(?P<d>\d)(?P=d)": r"double \g<d>", r"\d+": "number"}, 0),
+        ("RegexMapping", {r"abc": "lower", r"(?i)abc": "any case"}, 0),
+        ("RegexMapping", {r"ab(c)?": r"[\1]", r"a(?i:B)C": "mixed"}, re.IGNORECASE),
+        ("RegexReplacements", [(r"(\w)\1", r"<\1\1>"), (r"x", "y")], 0),
+        ("RegexReplacements", [(r"(?i)rua", "R."), (r"\s+", " ")], 0),
+        ("RegexReplacements", [(r"av\.?", "Avenida"), (r"(?-i:D)", "d")], re.IGNORECASE),
+    ],
+)
+def test_fallback_matches_linear_scan(kind, table, flags):
+    compiled = compile_table(kind, table, flags)
+    for value in ["", "1-1", "1-2", "11", "123", "abc", "ABC", "aBC", "ab", "AB", "xx yy", "Rua  da rUA", "AV. Dd", "av D"]:
+        assert compiled.sub(value) == linear_regex_sub(kind, table, flags, value), value
+
+
+def test_combine_patterns():
+    def combine(*patterns, flags=0):
+        return combine_patterns([re.compile(x, flags) for x in patterns], flags)
+
+    assert combine(r"(\d)-\1", r"\d") is None
+    assert combine(r"(?P<d>\d)(?P=d)", r"\d") is None
+    assert combine(r"a", r"(?i)b") is None
+    assert combine(r"(?s)a.", r"b") is None
+    combined = combine(r"a(?i:b)", r"(c)+", flags=re.IGNORECASE)
+    assert combined is not None
+    assert combined.fullmatch("CC").lastgroup == "_r1"
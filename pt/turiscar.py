@@ -2,39 +2,53 @@
 
 import itertools
 import re
-from multiprocessing import Pool
 from urllib.parse import urljoin
 
 from lxml import etree
 from more_itertools import flatten
 
-from impl.common import DiffDict, distance, fetch_html_data, fetch_json_data, overpass_query, titleize, write_diff
+from impl.common import (
+    DiffDict,
+    GeoIndex,
+    RefIndex,
+    RegexMapping,
+    fetch_html_data,
+    fetch_json_data,
+    fetch_many,
+    overpass_query,
+    titleize,
+    write_diff,
+)
 
 
 DATA_URL = "https://www.turiscar.pt/pt/estacoes"
 
 REF = "ref"
 
-SCHEDULE_DAYS_MAPPING = {
-    r"segunda a sexta feira": "Mo-Fr",
-    r"segunda-feira a sexta-feira": "Mo-Fr",
-    r"segunda-feira a domingo": "Mo-Su",
-    r"sábado": "Sa",
-    r"sábados": "Sa",
-    r"sábado, domingo e feriados": "Sa,Su,PH",
-    r"sábados, domingos e  feriados": "Sa,Su,PH",
-    r"sábados, domingos e feriados": "Sa,Su,PH",
-    r"domingos": "Su",
-    r"domingo e feriados": "Su,PH",
-    r"domingos e feriados": "Su,PH",
-    r"fins-de-semana e feriados": "Sa,Su,PH",
-}
-SCHEDULE_HOURS_MAPPING = {
-    r"(\d{2})h\s*(?:às|-)\s*(\d{2})h": r"\1:00-\2:00",
-    r"(?:das\s+)?(\d{2})[:h](\d{1})\s*(?:às|-)\s*(\d{2})[:h](\d{2})": r"\1:0\2-\3:\4",
-    r"(?:das\s+)?(\d{2})[:h](\d{2})\s*(?:às|-)\s*(\d{2})[:h](\d{2})": r"\1:\2-\3:\4",
-    r"encerrado": "off",
-}
+SCHEDULE_DAYS_MAPPING = RegexMapping(
+    {
+        r"segunda a sexta feira": "Mo-Fr",
+        r"segunda-feira a sexta-feira": "Mo-Fr",
+        r"segunda-feira a domingo": "Mo-Su",
+        r"sábado": "Sa",
+        r"sábados": "Sa",
+        r"sábado, domingo e feriados": "Sa,Su,PH",
+        r"sábados, domingos e  feriados": "Sa,Su,PH",
+        r"sábados, domingos e feriados": "Sa,Su,PH",
+        r"domingos": "Su",
+        r"domingo e feriados": "Su,PH",
+        r"domingos e feriados": "Su,PH",
+        r"fins-de-semana e feriados": "Sa,Su,PH",
+    }
+)
+SCHEDULE_HOURS_MAPPING = RegexMapping(
+    {
+        r"(\d{2})h\s*(?:às|-)\s*(\d{2})h": r"\1:00-\2:00",
+        r"(?:das\s+)?(\d{2})[:h](\d{1})\s*(?:às|-)\s*(\d{2})[:h](\d{2})": r"\1:0\2-\3:\4",
+        r"(?:das\s+)?(\d{2})[:h](\d{2})\s*(?:às|-)\s*(\d{2})[:h](\d{2})": r"\1:\2-\3:\4",
+        r"encerrado": "off",
+    }
+)
 
 
 def fetch_level1_data():
@@ -85,19 +99,20 @@ def fetch_level2_data(data):
 
 if __name__ == "__main__":
     new_data = fetch_level1_data()
-    with Pool(4) as p:
-        new_data = list(p.imap_unordered(fetch_level2_data, new_data))
+    new_data = fetch_many(fetch_level2_data, new_data)
 
     old_data = [DiffDict(e) for e in overpass_query('nwr[amenity][name~"turiscar",i](area.country);')]
+    old_refs = RefIndex(old_data, REF)
+    old_geo = GeoIndex(old_data)
 
     old_node_ids = {d.data["id"] for d in old_data}
 
     for nd in new_data:
         public_id = str(nd["id"])
-        d = next((od for od in old_data if od[REF] == public_id), None)
+        d = old_refs.find(public_id)
         if d is None:
             coord = [nd["lat"], nd["lon"]]
-            ds = [x for x in old_data if not x[REF] and distance([x.lat, x.lon], coord) < 250]
+            ds = [x for x, _ in old_geo.within(coord, 250) if not x[REF]]
             if len(ds) == 1:
                 d = ds[0]
         if d is None:
@@ -107,6 +122,8 @@ if __name__ == "__main__":
             d.data["lat"] = nd["lat"]
             d.data["lon"] = nd["lon"]
             old_data.append(d)
+            old_refs.add(d)
+            old_geo.add(d)
         else:
             old_node_ids.remove(d.data["id"])
 
@@ -130,20 +147,12 @@ if __name__ == "__main__":
             schedule = [list(x) for x in itertools.batched(schedule, 2)]
             for s in schedule:
                 sa = s[0]
-                sb = f"<ERR:{sa}>"
-                for sma, smb in SCHEDULE_DAYS_MAPPING.items():
-                    if re.fullmatch(sma, sa) is not None:
-                        sb = re.sub(sma, smb, sa)
-                        break
+                sb = SCHEDULE_DAYS_MAPPING.sub(sa, f"<ERR:{sa}>")
                 s[0] = sb
 
                 ss = []
                 for sa in re.split(r"\s+e\s+|\s*/\s*", s[1]):
-                    sb = f"<ERR:{sa}>"
-                    for sma, smb in SCHEDULE_HOURS_MAPPING.items():
-                        if re.fullmatch(sma, sa) is not None:
-                            sb = re.sub(sma, smb, sa)
-                            break
+                    sb = SCHEDULE_HOURS_MAPPING.sub(sa, f"<ERR:{sa}>")
                     ss.append(sb)
                 s[1] = ",".join(ss)
             schedule = [" ".join(x) for x in schedule]
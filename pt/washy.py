@@ -2,11 +2,22 @@
 
 import itertools
 import re
-from multiprocessing import Pool
 
 import requests
 
-from impl.common import DiffDict, distance, fetch_json_data, opening_weekdays, overpass_query, titleize, write_diff
+from impl.common import (
+    DiffDict,
+    GeoIndex,
+    RefIndex,
+    RegexReplacements,
+    fetch_json_data,
+    fetch_many,
+    normalize_addresses,
+    opening_weekdays,
+    overpass_query,
+    titleize,
+    write_diff,
+)
 
 
 LEVEL1_DATA_URL = "https://limmia-wasky-public-api-c934cd99c58c.herokuapp.com/localsPages/listStaticLocalsPages"
@@ -20,15 +31,17 @@ CITIES = {
     "4470-274": "Moreira",
     "4760-501": "Vila Nova de Famalicão",
 }
-STREET_ABBREVS = [
-    [r"\bav\.? ", "avenida "],
-    [r"\beng\. ", "engenheiro "],
-    [r"\bdr\. ", "doutor "],
-    [r"\bgen\. ", "general "],
-    [r"\bpte\. ", "ponte "],
-    [r"\br\. ", "rua "],
-    [r"\btv\. ", "travessa "],
-]
+STREET_ABBREVS = RegexReplacements(
+    [
+        [r"\bav\.? ", "avenida "],
+        [r"\beng\. ", "engenheiro "],
+        [r"\bdr\. ", "doutor "],
+        [r"\bgen\. ", "general "],
+        [r"\bpte\. ", "ponte "],
+        [r"\br\. ", "rua "],
+        [r"\btv\. ", "travessa "],
+    ]
+)
 
 
 def fetch_level1_data():
@@ -48,10 +61,11 @@ def fetch_level2_data(data):
 
 if __name__ == "__main__":
     new_data = fetch_level1_data()
-    with Pool(4) as p:
-        new_data = list(p.imap_unordered(fetch_level2_data, new_data))
+    new_data = fetch_many(fetch_level2_data, new_data)
 
     old_data = [DiffDict(e) for e in overpass_query('nwr[shop][~"^(name|brand)$"~"washy",i](area.country);')]
+    old_refs = RefIndex(old_data, REF)
+    old_geo = GeoIndex(old_data)
 
     new_node_id = -10000
     old_node_ids = {d.data["id"] for d in old_data}
@@ -60,10 +74,10 @@ if __name__ == "__main__":
         public_id = nd["identifier"]
         tags_to_reset = set()
 
-        d = next((od for od in old_data if od[REF] == public_id), None)
+        d = old_refs.find(public_id)
         if d is None:
             coord = [float(nd["lat"]), float(nd["lng"])]
-            ds = [x for x in old_data if not x[REF] and distance([x.lat, x.lon], coord) < 250]
+            ds = [x for x, _ in old_geo.within(coord, 250) if not x[REF]]
             if len(ds) == 1:
                 d = ds[0]
         if d is None:
@@ -73,6 +87,8 @@ if __name__ == "__main__":
             d.data["lat"] = float(nd["lat"])
             d.data["lon"] = float(nd["lng"])
             old_data.append(d)
+            old_refs.add(d)
+            old_geo.add(d)
             new_node_id -= 1
         else:
             old_node_ids.remove(d.data["id"])
@@ -120,13 +136,12 @@ if __name__ == "__main__":
             d["source:contact"] = "website"
 
         d["addr:postcode"] = nd["zip"].strip()
-        d["addr:city"] = CITIES.get(d["addr:postcode"], nd["city"].strip())
+        d["addr:city"] = nd["city"].strip()
         if not d["addr:street"] and not d["addr:place"] and not d["addr:suburb"] and not d["addr:housename"]:
             street = nd["streetAndNumber"].replace("  ", " ")
             street = re.sub(r"^[Cc]ontinente( [Mm]odelo| [Bb]om [Dd]ia)?[^,]*,\s*", "", street)
             street = re.sub(r",\s*[Cc]ontinente( [Mm]odelo| [Bb]om [Dd]ia)?[^,]*", "", street)
-            for r in STREET_ABBREVS:
-                street = re.sub(r[0], r[1], street.lower())
+            street = STREET_ABBREVS.sub(street.lower())
             if m := re.fullmatch(r"(.+?),?\s+(\d+(?:-\d+)?|lote (?:[\d.]+))(?:,?\s+(loja \w+))?", street):
                 d["addr:street"] = titleize(m[1])
                 d["addr:housenumber"] = titleize(m[2])
@@ -150,6 +165,8 @@ if __name__ == "__main__":
         if d.data["id"] in old_node_ids:
             d.kind = "del"
 
+    normalize_addresses([d for d in old_data if d.kind != "del"], CITIES)
+
     old_data.sort(key=lambda d: d[REF])
 
     write_diff("Washy", REF, old_data, osm=True)
@@ -5,49 +5,63 @@ from functools import reduce
 
 from lxml import etree
 
-from impl.common import DiffDict, distance, fetch_json_data, format_phonenumber, overpass_query, titleize, write_diff
+from impl.common import (
+    DiffDict,
+    GeoIndex,
+    RefIndex,
+    RegexMapping,
+    RegexReplacements,
+    fetch_json_data,
+    format_phonenumber,
+    normalize_addresses,
+    overpass_query,
+    titleize,
+    write_diff,
+)
 
 
 DATA_URL = "https://wells.pt/lojas-wells"
 
 REF = "ref"
 
-BRANCH_ABBREVS = (
-    (r"\bAlges\b", "Algés"),
-    (r"\bAntonio\b", "António"),
-    (r"\bAv\b\.?", "Avenida"),
-    (r"\bAzeitao\b", "Azeitão"),
-    (r"\bBd\b", "Bom Dia"),
-    (r"\bCnt\b", "Continente"),
-    (r"\bD'Aire\b", "Daire"),
-    (r"\bDr\b", "Doutor"),
-    (r"\bEstacao\b", "Estação"),
-    (r"\bEvora\b", "Évora"),
-    (r"\bFamalicao\b", "Famalicão"),
-    (r"\bFanzeres\b", "Fânzeres"),
-    (r"\bFig\. Foz\b", "Figueira da Foz"),
-    (r"\bFrs\b", "Franquia"),
-    (r"^(Franquia) (.+)$", r"\2 \1"),
-    (r"\bGpl\b", "Gran Plaza"),
-    (r"\bJoao\b", "João"),
-    (r"\b(MDL|Mh)\b", "Modelo"),
-    (r"\bMte\b", "Monte"),
-    (r"\bOdiaxere\b", "Odiáxere"),
-    (r"\bPdl\b", "Ponta Delgada"),
-    (r"\bPonte de Sôr\b", "Ponte de Sor"),
-    (r"\bQta?\b", "Quinta"),
-    (r"\bS João\b", "São João"),
-    (r"\bS\.\s?J\.", "São João"),
-    (r"\bS\.Atº\b", "Santo António"),
-    (r"\bS\. F\. Marinha\b", "São Félix da Marinha"),
-    (r"\bS\.", "São"),
-    (r"\bStª? Maria\b", "Santa Maria"),
-    (r"\bSto\b", "Santo"),
-    (r"\bUbbo\b", "UBBO"),
-    (r"\bV\.\s?F\. Xira\b", "Vila Franca de Xira"),
-    (r"\bV\. N\.", "Vila Nova"),
-    (r"\bV\.", "Vila"),
-    (r"\bVitoria\b", "Vitória"),
+BRANCH_ABBREVS = RegexReplacements(
+    (
+        (r"\bAlges\b", "Algés"),
+        (r"\bAntonio\b", "António"),
+        (r"\bAv\b\.?", "Avenida"),
+        (r"\bAzeitao\b", "Azeitão"),
+        (r"\bBd\b", "Bom Dia"),
+        (r"\bCnt\b", "Continente"),
+        (r"\bD'Aire\b", "Daire"),
+        (r"\bDr\b", "Doutor"),
+        (r"\bEstacao\b", "Estação"),
+        (r"\bEvora\b", "Évora"),
+        (r"\bFamalicao\b", "Famalicão"),
+        (r"\bFanzeres\b", "Fânzeres"),
+        (r"\bFig\. Foz\b", "Figueira da Foz"),
+        (r"\bFrs\b", "Franquia"),
+        (r"^(Franquia) (.+)$", r"\2 \1"),
+        (r"\bGpl\b", "Gran Plaza"),
+        (r"\bJoao\b", "João"),
+        (r"\b(MDL|Mh)\b", "Modelo"),
+        (r"\bMte\b", "Monte"),
+        (r"\bOdiaxere\b", "Odiáxere"),
+        (r"\bPdl\b", "Ponta Delgada"),
+        (r"\bPonte de Sôr\b", "Ponte de Sor"),
+        (r"\bQta?\b", "Quinta"),
+        (r"\bS João\b", "São João"),
+        (r"\bS\.\s?J\.", "São João"),
+        (r"\bS\.Atº\b", "Santo António"),
+        (r"\bS\. F\. Marinha\b", "São Félix da Marinha"),
+        (r"\bS\.", "São"),
+        (r"\bStª? Maria\b", "Santa Maria"),
+        (r"\bSto\b", "Santo"),
+        (r"\bUbbo\b", "UBBO"),
+        (r"\bV\.\s?F\. Xira\b", "Vila Franca de Xira"),
+        (r"\bV\. N\.", "Vila Nova"),
+        (r"\bV\.", "Vila"),
+        (r"\bVitoria\b", "Vitória"),
+    )
 )
 BRANCHES = {
     "Aqua Portimao": "Aqua Portimão",
@@ -59,30 +73,34 @@ BRANCHES = {
     "Portimao Continente Shopping": "Portimão Continente Shopping",
     "São João da Madeira 8 Avenida": "São João da Madeira 8ª Avenida",
 }
-SCHEDULE_DAYS_MAPPING = {
-    r"^$|segunda a domingo-?|todos os dias?": "Mo-Su",
-    r"seg\.? a sex\.?": "Mo-Fr",
-    r"seg\.? a sáb\.?": "Mo-Sa",
-    r"dom(ingo|\.?) a (qui(nta(-feira)?)?\.?|5ªf)": "Su-Th",
-    r"s[aá]b\.": "Sa",
-    r"dom\.?": "Su",
-    r"sáb\.? [ea] dom\.": "Sa,Su",
-    r"sex\.": "Fr",
-    r"sex\. e sáb\.": "Fr,Sa",
-    r"feriados": "PH",
-    r"dom\.? e feriados": "Su,PH",
-    r"sáb\.? dom\.? e feriados": "Sa,Su,PH",
-    r"sex(tas|\.),? sáb(ados|\.) e v[eé]sp(era|\.)( de)? feriados?": "Fr,Sa,PH -1 day",
-    r"véspera de feriado, sex e sáb": "Fr,Sa,PH -1 day",
-    r"vésperas de feriados": "PH -1 day",
-}
-SCHEDULE_HOURS_MAPPING = {
-    r"(\d{2})h\s*às\s*(\d{2})h": r"\1:00-\2:00",
-    r"(\d{2})h\s*às\s*(\d{2})h(\d{2})": r"\1:00-\2:\3",
-    r"(\d{1})[:h](\d{2})h?\s*(?:às|-)\s*(\d{2})[:h](\d{2})h?": r"0\1:\2-\3:\4",
-    r"(?:das )?(\d{2})[:h](\d{2})h?\s*(?:às|-)\s*(\d{2})[:h](\d{2})h?": r"\1:\2-\3:\4",
-    r"encerrad[ao]|:h às :h": r"off",
-}
+SCHEDULE_DAYS_MAPPING = RegexMapping(
+    {
+        r"^$|segunda a domingo-?|todos os dias?": "Mo-Su",
+        r"seg\.? a sex\.?": "Mo-Fr",
+        r"seg\.? a sáb\.?": "Mo-Sa",
+        r"dom(ingo|\.?) a (qui(nta(-feira)?)?\.?|5ªf)": "Su-Th",
+        r"s[aá]b\.": "Sa",
+        r"dom\.?": "Su",
+        r"sáb\.? [ea] dom\.": "Sa,Su",
+        r"sex\.": "Fr",
+        r"sex\. e sáb\.": "Fr,Sa",
+        r"feriados": "PH",
+        r"dom\.? e feriados": "Su,PH",
+        r"sáb\.? dom\.? e feriados": "Sa,Su,PH",
+        r"sex(tas|\.),? sáb(ados|\.) e v[eé]sp(era|\.)( de)? feriados?": "Fr,Sa,PH -1 day",
+        r"véspera de feriado, sex e sáb": "Fr,Sa,PH -1 day",
+        r"vésperas de feriados": "PH -1 day",
+    }
+)
+SCHEDULE_HOURS_MAPPING = RegexMapping(
+    {
+        r"(\d{2})h\s*às\s*(\d{2})h": r"\1:00-\2:00",
+        r"(\d{2})h\s*às\s*(\d{2})h(\d{2})": r"\1:00-\2:\3",
+        r"(\d{1})[:h](\d{2})h?\s*(?:às|-)\s*(\d{2})[:h](\d{2})h?": r"0\1:\2-\3:\4",
+        r"(?:das )?(\d{2})[:h](\d{2})h?\s*(?:às|-)\s*(\d{2})[:h](\d{2})h?": r"\1:\2-\3:\4",
+        r"encerrad[ao]|:h às :h": r"off",
+    }
+)
 POSTCODES = {
     "2853": "9500-465",
 }
@@ -156,6 +174,8 @@ if __name__ == "__main__":
     new_data = fetch_data()
 
     old_data = [DiffDict(e) for e in overpass_query('nwr[shop][name~"well\'?s",i](area.country);')]
+    old_refs = RefIndex(old_data, REF)
+    old_geo = GeoIndex(old_data)
 
     old_node_ids = {d.data["id"] for d in old_data}
 
@@ -166,12 +186,12 @@ if __name__ == "__main__":
         branch = re.sub(r"\b(óp?tica|opt)\b", " ", branch, flags=re.IGNORECASE).strip()
         tags_to_reset = set()
 
-        d = next((od for od in old_data if od[REF] == public_id), None)
+        d = old_refs.find(public_id)
         coord = [nd["latitude"] or 38.306893, nd["longitude"] or -17.050891]
         if coord[0] > -9.6 and coord[0] < -6.3 and coord[1] > 36.8 and coord[1] < 42.3:
             coord = [coord[1], coord[0]]
         if d is None and nd["latitude"] is not None and nd["longitude"] is not None:
-            ds = [x for x in old_data if not x[REF] and distance([x.lat, x.lon], coord) < 250]
+            ds = [x for x, _ in old_geo.within(coord, 250) if not x[REF]]
             if len(ds) == 1:
                 d = ds[0]
         if d is None:
@@ -180,6 +200,8 @@ if __name__ == "__main__":
             d.data["id"] = f"-{public_id}"
             d.data["lat"], d.data["lon"] = coord
             old_data.append(d)
+            old_refs.add(d)
+            old_geo.add(d)
         else:
             old_node_ids.remove(d.data["id"])
 
@@ -189,8 +211,7 @@ if __name__ == "__main__":
         d["brand"] = "Wells"
         d["brand:wikidata"] = "Q115388598"
         d["brand:wikipedia"] = "pt:Wells (lojas)"
-        for r in BRANCH_ABBREVS:
-            branch = re.sub(r[0], r[1], branch)
+        branch = BRANCH_ABBREVS.sub(branch)
         d["branch"] = BRANCHES.get(branch, branch)
 
         tags_to_reset.update({"amenity", "dispensing", "healthcare"})
@@ -211,20 +232,12 @@ if __name__ == "__main__":
                 continue
 
             sa = s[0]
-            sb = f"<ERR:{sa}>"
-            for sma, smb in SCHEDULE_DAYS_MAPPING.items():
-                if re.fullmatch(sma, sa) is not None:
-                    sb = re.sub(sma, smb, sa)
-                    break
+            sb = SCHEDULE_DAYS_MAPPING.sub(sa, f"<ERR:{sa}>")
             s[0] = sb
 
             ss = []
             for sa in re.split(r"\s*(?:\be\b|/|,)\s*", s[1]):
-                sb = f"<ERR:{sa}>"
-                for sma, smb in SCHEDULE_HOURS_MAPPING.items():
-                    if re.fullmatch(sma, sa) is not None:
-                        sb = re.sub(sma, smb, sa)
-                        break
+                sb = SCHEDULE_HOURS_MAPPING.sub(sa, f"<ERR:{sa}>")
                 ss.append(sb)
             s[1] = ",".join(ss)
         if len(schedule) >= 2 and schedule[0][0] == "Mo-Sa" and schedule[1][0] == "Su,PH" and schedule[0][1] == schedule[1][1]:
@@ -265,7 +278,7 @@ if __name__ == "__main__":
         if len(postcode) == 4:
             postcode += "-000"
         d["addr:postcode"] = postcode
-        d["addr:city"] = CITIES.get(postcode, titleize(nd["city"].strip()))
+        d["addr:city"] = titleize(nd["city"].strip())
 
         if (
             not d["addr:street"]
@@ -283,6 +296,8 @@ if __name__ == "__main__":
         if d.data["id"] in old_node_ids:
             d.kind = "del"
 
+    normalize_addresses([d for d in old_data if d.kind != "del"], CITIES)
+
     old_data.sort(key=lambda d: d[REF])
 
     write_diff("Wells", REF, old_data)
@@ -3,7 +3,7 @@
 import itertools
 from urllib.parse import quote_plus, unquote_plus
 
-from impl.common import DiffDict, distance, fetch_json_data, opening_weekdays, overpass_query, write_diff
+from impl.common import DiffDict, GeoIndex, RefIndex, fetch_json_data, opening_weekdays, overpass_query, write_diff
 
 
 DATA_URL = "https://prod-cd.widex.pt/sitecore/api/ssc/WSA-Retail-Feature-ShopFinder-Controllers/ShopFinder/1/GetShopsForBusinessContext"
@@ -27,6 +27,8 @@ if __name__ == "__main__":
     new_data = fetch_data()
 
     old_data = [DiffDict(e) for e in overpass_query('nwr[shop][~"^(name|brand)$"~"widex",i](area.country);')]
+    old_refs = RefIndex(old_data, REF)
+    old_geo = GeoIndex(old_data)
 
     new_node_id = -10000
     old_node_ids = {d.data["id"] for d in old_data}
@@ -36,10 +38,10 @@ if __name__ == "__main__":
         branch = nd["title"].removeprefix("Widex").strip()
         tags_to_reset = set()
 
-        d = next((od for od in old_data if od[REF] == public_id), None)
+        d = old_refs.find(public_id)
         if d is None:
             coord = [nd["latitude"], nd["longitude"]]
-            ds = [x for x in old_data if not x[REF] and distance([x.lat, x.lon], coord) < 250]
+            ds = [x for x, _ in old_geo.within(coord, 250) if not x[REF]]
             if len(ds) == 1:
                 d = ds[0]
         if d is None:
@@ -49,6 +51,8 @@ if __name__ == "__main__":
             d.data["lat"] = nd["latitude"]
             d.data["lon"] = nd["longitude"]
             old_data.append(d)
+            old_refs.add(d)
+            old_geo.add(d)
             new_node_id -= 1
         else:
             old_node_ids.remove(d.data["id"])
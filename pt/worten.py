@@ -2,43 +2,46 @@
 
 import json
 import re
-from pathlib import Path
 
 from playwright.sync_api import sync_playwright
 
-from impl.common import DiffDict, cache_name, distance, overpass_query, titleize, write_diff
+from impl.common import DiffDict, GeoIndex, RefIndex, RegexMapping, cache_get, cache_set, overpass_query, titleize, write_diff
 from impl.config import ENABLE_CACHE, PLAYWRIGHT_CDP_URL, PLAYWRIGHT_CONTEXT_OPTS
 
 
 REF = "ref"
 
-SCHEDULE_DAYS_MAPPING = {
-    r"2ª a (6ª|sexta)": r"Mo-Fr",
-    r"(de )?(2ª|segunda)( a)? sábado": r"Mo-Sa",
-    r"2ª a domingo|todos os dias": r"Mo-Su",
-    r"(\d{2}), (\d{2}) de novembro": r"Nov \1, Nov \2",
-    r"(6ª|sexta), sábado": r"Fr,Sa",
-    r"(6ª|sexta), sábado, vésperas? de feriados?": r"Fr,Sa,PH -1 day",
-    r"de (\d{2}) a (\d{2}) de dezembro": r"Dec \1-\2",
-    r"dia (\d{2}) de dezembro": r"Dec \1",
-    r"domingo": r"Su",
-    r"domingo a (quinta|5ª)": r"Su-Th",
-    r"domingo a sexta": r"Su-Fr",
-    r"domingos?, feriados": r"Su,PH",
-    r"domingo, véspera de feriado": r"Su,PH -1 day",
-    r"feriados": r"PH",
-    r"sábado": r"Sa",
-    r"sábados?, domingos?": r"Sa,Su",
-    r"sábado, domingo, feriados": r"Sa,Su,PH",
-    r"segunda a 5ª, domingo": r"Mo-Th,Su",
-}
-SCHEDULE_HOURS_MAPPING = {
-    r"(?:das )?(\d{2})[:h.](\d{2})h?\s*(?:-|[áà]s)\s*(\d{2})[:h.](\d{2})h?": r"\1:\2-\3:\4",
-    r"(?:das )?(\d{1})[:h.](\d{2})h?\s*(?:-|[áà]s)\s*(\d{2})[:h.](\d{2})h?": r"0\1:\2-\3:\4",
-    r"(?:das )?(\d{2})h\s*(?:-|[áà]s)\s*(\d{2})h": r"\1:00-\2:00",
-    r"(?:das )?(\d{1})h\s*(?:-|[áà]s)\s*(\d{2})h": r"0\1:00-\2:00",
-    r"encerrados": r"off",
-}
+SCHEDULE_DAYS_MAPPING = RegexMapping(
+    {
+        r"2ª a (6ª|sexta)": r"Mo-Fr",
+        r"(de )?(2ª|segunda)( a)? sábado": r"Mo-Sa",
+        r"2ª a domingo|todos os dias": r"Mo-Su",
+        r"(\d{2}), (\d{2}) de novembro": r"Nov \1, Nov \2",
+        r"(6ª|sexta), sábado": r"Fr,Sa",
+        r"(6ª|sexta), sábado, vésperas? de feriados?": r"Fr,Sa,PH -1 day",
+        r"de (\d{2}) a (\d{2}) de dezembro": r"Dec \1-\2",
+        r"dia (\d{2}) de dezembro": r"Dec \1",
+        r"domingo": r"Su",
+        r"domingo a (quinta|5ª)": r"Su-Th",
+        r"domingo a sexta": r"Su-Fr",
+        r"domingos?, feriados": r"Su,PH",
+        r"domingo, véspera de feriado": r"Su,PH -1 day",
+        r"feriados": r"PH",
+        r"sábado": r"Sa",
+        r"sábados?, domingos?": r"Sa,Su",
+        r"sábado, domingo, feriados": r"Sa,Su,PH",
+        r"segunda a 5ª, domingo": r"Mo-Th,Su",
+    }
+)
+SCHEDULE_HOURS_MAPPING = RegexMapping(
+    {
+        r"(?:das )?(\d{2})[:h.](\d{2})h?\s*(?:-|[áà]s)\s*(\d{2})[:h.](\d{2})h?": r"\1:\2-\3:\4",
+        r"(?:das )?(\d{1})[:h.](\d{2})h?\s*(?:-|[áà]s)\s*(\d{2})[:h.](\d{2})h?": r"0\1:\2-\3:\4",
+        r"(?:das )?(\d{2})h\s*(?:-|[áà]s)\s*(\d{2})h": r"\1:00-\2:00",
+        r"(?:das )?(\d{1})h\s*(?:-|[áà]s)\s*(\d{2})h": r"0\1:00-\2:00",
+        r"encerrados": r"off",
+    }
+)
 CITIES = {
     "2040-413": "Rio Maior",
     "2135-114": "Samora Correia",
@@ -65,8 +68,8 @@ def fetch_data(page_url, data_url):
         # print(f"Making request: {request.url}")  # noqa: ERA001
         route.continue_()
 
-    cache_file = Path(f"{cache_name(data_url)}.json")
-    if not ENABLE_CACHE or not cache_file.exists():
+    result = cache_get("data", data_url) if ENABLE_CACHE else None
+    if result is None:
         # print(f"Querying URL: {data_url}")  # noqa: ERA001
         with sync_playwright() as p:
             browser = p.chromium.connect_over_cdp(PLAYWRIGHT_CDP_URL) if PLAYWRIGHT_CDP_URL else p.firefox.launch()
@@ -79,9 +82,9 @@ def fetch_data(page_url, data_url):
             browser.close()
         result = json.loads(result)
         if ENABLE_CACHE:
-            cache_file.write_text(json.dumps(result))
+            cache_set("data", data_url, json.dumps(result).encode("utf-8"))
     else:
-        result = json.loads(cache_file.read_text())
+        result = json.loads(result.decode("utf-8"))
     return result
 
 
@@ -91,15 +94,17 @@ if __name__ == "__main__":
     new_data = fetch_data(page_url, data_url)["stores"]
 
     old_data = [DiffDict(e) for e in overpass_query('nwr[shop][name~"worten",i](area.country);')]
+    old_refs = RefIndex(old_data, REF)
+    old_geo = GeoIndex(old_data)
 
     old_node_ids = {d.data["id"] for d in old_data}
 
     for nd in new_data:
         public_id = nd["id"]
-        d = next((od for od in old_data if od[REF] == public_id), None)
+        d = old_refs.find(public_id)
         coord = [float(nd["latitude"]), float(nd["longitude"])]
         if d is None:
-            ds = [x for x in old_data if not x[REF] and distance([x.lat, x.lon], coord) < 100]
+            ds = [x for x, _ in old_geo.within(coord, 100) if not x[REF]]
             if len(ds) == 1:
                 d = ds[0]
         if d is None:
@@ -108,6 +113,8 @@ if __name__ == "__main__":
             d.data["id"] = f"-{public_id}"
             d.data["lat"], d.data["lon"] = coord
             old_data.append(d)
+            old_refs.add(d)
+            old_geo.add(d)
         else:
             old_node_ids.remove(d.data["id"])
 
@@ -139,19 +146,12 @@ if __name__ == "__main__":
                 continue
 
             sa = s[0]
-            sb = f"<ERR:{s}>"
-            for sma, smb in SCHEDULE_DAYS_MAPPING.items():
-                if re.fullmatch(sma, sa) is not None:
-                    sb = re.sub(sma, smb, sa)
-                    break
+            sb = SCHEDULE_DAYS_MAPPING.sub(sa, f"<ERR:{s}>")
             s[0] = sb
 
             sa = s[1]
-            sb = f"<ERR:{s}>"
-            for sma, smb in SCHEDULE_HOURS_MAPPING.items():
-                if re.fullmatch(sma, sa) is not None:
-                    sb = re.sub(sma, smb, sa).replace("23:59", "00:00")
-                    break
+            sb = SCHEDULE_HOURS_MAPPING.sub(sa)
+            sb = sb.replace("23:59", "00:00") if sb is not None else f"<ERR:{s}>"
             s[1] = sb
         if len(schedule) == 2 and schedule[0][0] == "Mo-Fr" and schedule[1][0] == "Sa,Su" and schedule[0][1] == schedule[1][1]:
             schedule = [["Mo-Su", schedule[0][1]]]